@@ -0,0 +1,82 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import random
+import string
+import time
+from utils.redis_client import get_redis
+from task_queue.codec import TaskCodec
+
+# Serializer/compression combinations compared by the benchmark
+CODECS = [
+    ("json", None), ("orjson", None), ("msgpack", None),
+    ("json", "zstd"), ("orjson", "zstd"), ("msgpack", "zstd"),
+    ("json", "lz4"), ("orjson", "lz4"), ("msgpack", "lz4"),
+]
+TASKS_PER_MILLION = 1_000_000
+
+
+def make_tasks(count, payload_size):
+    words = ["".join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(200)]
+    tasks = []
+    for i in range(count):
+        payload = " ".join(random.choices(words, k=max(1, payload_size // 6)))[:payload_size]
+        tasks.append({"id": f"T{i:07}", "payload": payload, "submit_timestamp": time.time(), "priority": i % 3})
+    return tasks
+
+
+def redis_bytes_per_task(client, encoded, key="benchmark:codec"):
+    """Measure actual Redis memory for a list holding `encoded`, per task."""
+    client.delete(key)
+    before = client.info("memory")["used_memory"]
+    pipe = client.pipeline(transaction=False)
+    for i in range(0, len(encoded), 1000):
+        pipe.rpush(key, *encoded[i:i + 1000])
+    pipe.execute()
+    after = client.info("memory")["used_memory"]
+    client.delete(key)
+    return (after - before) / len(encoded)
+
+
+def run(count, payload_size, threshold, redis_client):
+    tasks = make_tasks(count, payload_size)
+    print(f"{count} tasks, ~{payload_size} B payload, compression threshold {threshold} B")
+    print(f"{'codec':<16}{'encode us':>11}{'decode us':>11}{'bytes/task':>12}{'MB per 1M':>11}")
+    for serializer, compression in CODECS:
+        try:
+            codec = TaskCodec(serializer, compression or "none", threshold)
+        except RuntimeError as e:
+            print(f"{serializer}+{compression or 'none':<10} skipped: {e}")
+            continue
+        start = time.perf_counter()
+        encoded = [codec.encode(t) for t in tasks]
+        encode_us = (time.perf_counter() - start) / count * 1e6
+        start = time.perf_counter()
+        for data in encoded:
+            codec.decode(data)
+        decode_us = (time.perf_counter() - start) / count * 1e6
+
+        if redis_client is not None:
+            per_task = redis_bytes_per_task(redis_client, encoded)
+        else:
+            per_task = sum(len(e.encode("utf-8")) for e in encoded) / count
+        mb_per_million = per_task * TASKS_PER_MILLION / (1024 * 1024)
+        name = f"{serializer}+{compression or 'none'}"
+        print(f"{name:<16}{encode_us:>11.2f}{decode_us:>11.2f}{per_task:>12.1f}{mb_per_million:>11.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare task codec cost and queue memory.")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--payload-size", type=int, default=2048)
+    parser.add_argument("--threshold", type=int, default=1024)
+    parser.add_argument("--redis", action="store_true",
+                        help="measure real Redis memory (used_memory delta) instead of encoded size")
+    args = parser.parse_args()
+
+    client = None
+    if args.redis:
+        client = get_redis()
+    run(args.count, args.payload_size, args.threshold, client)
@@ -0,0 +1,98 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Submissions go to a real Redis and stay queued: point REDIS_DB at a scratch database.
+# Per-task log lines would dominate the timings
+os.environ.setdefault("LOG_LEVEL", "warning")
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def report(name, count, elapsed, latencies, failures):
+    print(f"{name:<8}{count / elapsed:>12.0f}{percentile(latencies, 0.5) * 1000:>10.2f}"
+          f"{percentile(latencies, 0.99) * 1000:>10.2f}{failures:>10}")
+
+
+def make_bodies(count, payload_size, prefix):
+    return [json.dumps({"task": {"id": f"{prefix}-{i:07}", "payload": "x" * payload_size}}).encode("utf-8")
+            for i in range(count)]
+
+
+def run_flask(bodies, concurrency):
+    """The current path: one synchronous handler, and its Redis round trips, per request thread."""
+    from client_interface.api import app
+    client = app.test_client()
+
+    def submit(body):
+        start = time.perf_counter()
+        response = client.post("/submit_task", data=body, content_type="application/json")
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(submit, bodies))
+    return time.perf_counter() - start, outcomes
+
+
+def run_async(bodies, concurrency):
+    """The ASGI path: concurrent requests coalesced into micro-batches."""
+    from client_interface.async_api import IngestApp
+    app = IngestApp()
+    scope = {"type": "http", "method": "POST", "path": "/submit_task", "headers": []}
+
+    async def submit(body, limit):
+        async with limit:
+            status = {}
+
+            async def receive():
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+
+            start = time.perf_counter()
+            await app(scope, receive, send)
+            return time.perf_counter() - start, status.get("code")
+
+    async def main():
+        limit = asyncio.Semaphore(concurrency)
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(submit(body, limit) for body in bodies))
+        elapsed = time.perf_counter() - start
+        await app.batcher.close()
+        return elapsed, outcomes
+
+    return asyncio.run(main())
+
+
+def run(count, payload_size, concurrency):
+    print(f"{count} submissions, {payload_size} B payload, {concurrency} concurrent clients")
+    print(f"{'path':<8}{'tasks/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'failed':>10}")
+    prefix = uuid.uuid4().hex[:8]
+    for name, runner in (("flask", run_flask), ("async", run_async)):
+        bodies = make_bodies(count, payload_size, f"{prefix}-{name}")
+        elapsed, outcomes = runner(bodies, concurrency)
+        latencies = [latency for latency, _ in outcomes]
+        failures = sum(1 for _, code in outcomes if code != 200)
+        report(name, count, elapsed, latencies, failures)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Flask and micro-batched async task submission.")
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--payload-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+    run(args.count, args.payload_size, args.concurrency)
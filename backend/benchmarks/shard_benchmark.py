@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Tasks go to the servers in REDIS_SHARDS and stay queued: point them at scratch instances, e.g.
+#   for p in 6380 6381 6382 6383; do redis-server --port $p --save '' --daemonize yes; done
+#   REDIS_SHARDS=localhost:6380,localhost:6381,localhost:6382,localhost:6383 python benchmarks/shard_benchmark.py
+# Per-task log lines would dominate the timings
+os.environ.setdefault("LOG_LEVEL", "warning")
+
+from master_node.scheduler import TaskScheduler
+from master_node.sharded_scheduler import ShardedScheduler
+from utils.redis_client import shard_count
+
+
+def run_shards(shards, count, batch_size, producers, payload_size):
+    """Enqueue `count` tasks over the first `shards` shards from concurrent producers; returns tasks/s."""
+    scheduler = ShardedScheduler([TaskScheduler(shard=index) for index in range(shards)])
+    prefix = uuid.uuid4().hex[:8]
+    batches = [[{"id": f"{prefix}-{i:07}", "payload": "x" * payload_size}
+                for i in range(start, min(start + batch_size, count))]
+               for start in range(0, count, batch_size)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=producers) as pool:
+        results = [result for batch in pool.map(scheduler.assign_tasks, batches) for result in batch]
+    elapsed = time.perf_counter() - start
+    failures = sum(1 for result in results if result["status"] != "accepted")
+    return count / elapsed, failures
+
+
+def run(count, batch_size, producers, payload_size):
+    available = shard_count()
+    print(f"{count} tasks in batches of {batch_size}, {producers} producers, {payload_size} B payload")
+    print(f"{'shards':<8}{'tasks/s':>12}{'speedup':>10}{'failed':>10}")
+    baseline = None
+    for shards in range(1, available + 1):
+        rate, failures = run_shards(shards, count, batch_size, producers, payload_size)
+        baseline = baseline or rate
+        print(f"{shards:<8}{rate:>12.0f}{rate / baseline:>10.2f}{failures:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure enqueue throughput as queue shards are added.")
+    parser.add_argument("--count", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--producers", type=int, default=16)
+    parser.add_argument("--payload-size", type=int, default=256)
+    args = parser.parse_args()
+    run(args.count, args.batch_size, args.producers, args.payload_size)
@@ -0,0 +1,197 @@
+import math
+import time
+from collections import Counter
+from master_node.sharded_scheduler import ShardedScheduler
+from utils.config import Config
+from utils.logger import Logger
+from utils.worker_registry import WorkerRegistry
+from utils.service_stats import throughput
+
+# KEYS: client bucket, queues counted toward the depth limit...
+# ARGV: rate (tokens/s, 0 = unlimited), burst, cost, max depth (0 = unlimited), tasks ahead in this batch.
+# Returns {1, 'ok', depth}, {0, 'depth', depth} or {0, 'rate', seconds until enough tokens},
+# where depth includes the tasks ahead.
+# The depth check runs first, so a request refused for depth spends no tokens.
+ADMIT_SCRIPT = """
+local depth = 0
+for i = 2, #KEYS do
+    if redis.call('TYPE', KEYS[i]).ok == 'stream' then
+        depth = depth + redis.call('XLEN', KEYS[i])
+    else
+        depth = depth + redis.call('LLEN', KEYS[i])
+    end
+end
+local cost = tonumber(ARGV[3])
+local max_depth = tonumber(ARGV[4])
+depth = depth + tonumber(ARGV[5])
+if max_depth > 0 and depth + cost > max_depth then
+    return {0, 'depth', depth}
+end
+local rate = tonumber(ARGV[1])
+if rate > 0 then
+    local burst = tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local last = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(now - last, 0) * rate)
+    if tokens < cost then
+        return {0, 'rate', tostring((cost - tokens) / rate)}
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - cost), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+end
+return {1, 'ok', depth}
+"""
+
+
+class AdmissionController:
+    """
+    Backpressure on submission. A request is refused when the main queue holds
+    more than `max_depth` tasks, or when its client has spent its token bucket
+    (`rate` tasks per second, bursts up to `burst`). Both are checked in one
+    script on Redis, so the limits hold across any number of API instances.
+
+    A refusal says when to retry: for depth, the time the workers need to
+    drain the excess at their current rate (from their service-time stats);
+    for rate, the time until the bucket refills enough.
+    """
+    def __init__(self, redis_client, queues, max_depth=None, rate=None, burst=None,
+                 max_retry_after=None, prefix="admission:"):
+        self.redis = redis_client
+        self.queues = list(queues)
+        self.max_depth = max_depth if max_depth is not None else Config.ADMISSION_MAX_QUEUE_DEPTH
+        self.rate = rate if rate is not None else Config.ADMISSION_RATE
+        self.burst = max(burst if burst is not None else Config.ADMISSION_BURST, self.rate)
+        self.max_retry_after = max_retry_after or Config.ADMISSION_MAX_RETRY_AFTER
+        self.prefix = prefix
+        self.registry = WorkerRegistry(redis_client)
+        self.logger = Logger()
+        self._admit = redis_client.register_script(ADMIT_SCRIPT)
+        self._drain = (0.0, None)  # (read at, tasks per second)
+
+    @classmethod
+    def for_scheduler(cls, scheduler, **kwargs):
+        """Limit the queues a TaskScheduler enqueues to: its priority lanes, or its stream."""
+        if isinstance(scheduler, ShardedScheduler):
+            return ShardedAdmission.for_scheduler(scheduler, **kwargs)
+        stream = scheduler.queue_engine == "stream"
+        queues = [scheduler.main_queue] if stream else scheduler.lanes.names
+        return cls(scheduler.redis_queue.redis_client, queues, **kwargs)
+
+    @property
+    def enabled(self):
+        return self.max_depth > 0 or self.rate > 0
+
+    def check(self, client_id, cost=1, tasks=None):
+        """
+        None if admitted, else {"reason", "error", "retry_after"}. `tasks` are the
+        tasks being paid for; only ShardedAdmission needs them, to route the cost.
+        """
+        return self.check_many([(client_id, cost, tasks)])[0]
+
+    def check_many(self, requests):
+        """
+        Admit [(client id, cost[, tasks])] in one pipeline; returns a decision per request.
+        Each request counts the cost of those before it against the depth limit.
+        Raises ValueError for a cost no bucket could ever pay.
+        """
+        requests = [request[:2] for request in requests]
+        if not self.enabled or not requests:
+            return [None] * len(requests)
+        for _, cost in requests:
+            if self.rate and cost > self.burst:
+                raise ValueError(f"Batch of {cost} tasks exceeds the per-client burst of {self.burst:g}")
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            ahead = 0
+            for client_id, cost in requests:
+                self._admit(keys=[f"{self.prefix}{client_id}"] + self.queues,
+                            args=[self.rate, self.burst, cost, self.max_depth, ahead], client=pipe)
+                ahead += cost
+            replies = pipe.execute()
+        except Exception as e:
+            # Failing open keeps submissions flowing when only the limiter is broken
+            self.logger.log(f"[Admission] Check failed, admitting without limits: {e}")
+            return [None] * len(requests)
+        return [self._decision(reply, cost) for reply, (_, cost) in zip(replies, requests)]
+
+    def _decision(self, reply, cost):
+        admitted, reason, value = reply
+        if admitted:
+            return None
+        if reason == "rate":
+            return {"reason": "rate", "error": f"Rate limit of {self.rate:g} tasks/s exceeded",
+                    "retry_after": self._clamp(float(value))}
+        excess = int(value) + cost - self.max_depth
+        drain = self.drain_rate()
+        return {"reason": "depth", "error": f"Queue is full ({int(value)} tasks waiting)",
+                "retry_after": self._clamp(excess / drain if drain else self.max_retry_after)}
+
+    def _clamp(self, seconds):
+        return min(max(int(math.ceil(seconds)), 1), self.max_retry_after)
+
+    def drain_rate(self):
+        """Tasks per second the active workers complete, from their published service times."""
+        read_at, rate = self._drain
+        if time.time() - read_at < 1:
+            return rate
+        try:
+            rate = sum(throughput(stats) for _, stats in self.registry.get_active_stats()) or None
+        except Exception:
+            rate = None
+        self._drain = (time.time(), rate)
+        return rate
+
+
+class ShardedAdmission:
+    """
+    Admission over sharded queues. Each shard has its own AdmissionController
+    with an even share of the limits (depth, rate and burst divided by the
+    shard count), and a request is charged on the shards its tasks hash to, so
+    every check stays one script on one server. A client spreading tasks
+    evenly gets the configured totals; one pinned to a routing key gets a share.
+    A request refused on any shard is refused; tokens already spent on the
+    others are not returned.
+    """
+    def __init__(self, controllers, shard_for):
+        self.controllers = list(controllers)
+        self.shard_for = shard_for
+
+    @classmethod
+    def for_scheduler(cls, scheduler, max_depth=None, rate=None, burst=None, **kwargs):
+        count = len(scheduler.schedulers)
+        max_depth = Config.ADMISSION_MAX_QUEUE_DEPTH if max_depth is None else max_depth
+        rate = Config.ADMISSION_RATE if rate is None else rate
+        burst = max(Config.ADMISSION_BURST if burst is None else burst, rate)
+        controllers = [AdmissionController.for_scheduler(shard, max_depth=math.ceil(max_depth / count),
+                                                         rate=rate / count, burst=burst / count, **kwargs)
+                       for shard in scheduler.schedulers]
+        return cls(controllers, scheduler.shard_for)
+
+    @property
+    def enabled(self):
+        return any(controller.enabled for controller in self.controllers)
+
+    def check(self, client_id, cost=1, tasks=None):
+        return self.check_many([(client_id, cost, tasks)])[0]
+
+    def check_many(self, requests):
+        """Admit [(client id, cost, tasks)] with one pipeline per shard involved."""
+        requests = list(requests)
+        parts = {}  # shard -> [(request index, client id, cost on that shard)]
+        for index, (client_id, cost, *rest) in enumerate(requests):
+            tasks = rest[0] if rest else None
+            # Without the tasks, charge the client's own shard
+            costs = Counter(self.shard_for(task) for task in tasks) if tasks else {self.shard_for({"id": client_id}): cost}
+            for shard, shard_cost in costs.items():
+                parts.setdefault(shard, []).append((index, client_id, shard_cost))
+
+        decisions = [None] * len(requests)
+        for shard, entries in parts.items():
+            replies = self.controllers[shard].check_many([(client_id, cost) for _, client_id, cost in entries])
+            for (index, _, _), decision in zip(entries, replies):
+                if decision and (decisions[index] is None or decision["retry_after"] > decisions[index]["retry_after"]):
+                    decisions[index] = decision
+        return decisions
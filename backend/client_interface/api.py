@@ -1,10 +1,22 @@
 import sys
 import os
 import json
-from flask import Flask, request, jsonify
+import math
+import time
+import uuid
+from flask import Flask, Response, request, jsonify, g, stream_with_context
 from flask_cors import CORS
-import redis
 from master_node.scheduler import TaskScheduler
+from master_node.sharded_scheduler import create_scheduler
+from utils.worker_registry import WorkerRegistry
+from task_queue.priority_lanes import PriorityLanes
+from task_queue.result_backend import ResultBackend
+from utils.config import Config
+from utils.redis_client import get_shard, shard_count, shard_index
+from utils.metrics import metrics, CONTENT_TYPE
+from client_interface.status_snapshot import StatusSnapshotter, page
+from client_interface.submission import task_error, submit_reply, throttled_body
+from client_interface.admission import AdmissionController
 
 # Ensure backend can find modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -12,7 +24,73 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
-task_scheduler = TaskScheduler()
+# Routes each task to its queue shard when REDIS_SHARDS lists more than one
+task_scheduler = create_scheduler()
+# Queue depth and per-client rate limits, shared with every other API instance through Redis
+admission = AdmissionController.for_scheduler(task_scheduler)
+
+# Shared by /queue_status, /system_status and every /events stream
+status_snapshots = StatusSnapshotter([get_shard(index) for index in range(shard_count())])
+
+# Upper bound on tasks accepted by a single /submit_tasks request
+MAX_BATCH_SIZE = 10000
+
+REQUEST_LATENCY = metrics.histogram("api_request_seconds", "API request handling time", ["endpoint"])
+REQUESTS = metrics.counter("api_requests_total", "API requests by endpoint and status code", ["endpoint", "code"])
+QUEUE_DEPTH = metrics.gauge("queue_depth", "Tasks waiting per queue: lanes, delayed sets and tasks_failed", ["queue"])
+ACTIVE_WORKERS = metrics.gauge("active_workers", "Workers that heartbeated within the active window")
+
+
+def _collect_queue_metrics():
+    """
+    Refresh queue depths and the worker count from Redis on each scrape, in one
+    pipeline per shard. Sharded queues report their totals over all shards.
+    """
+    totals = None
+    for index in range(shard_count()):
+        redis_client = get_shard(index)
+        registry = WorkerRegistry(redis_client)
+        lanes = PriorityLanes(redis_client).names
+        pipe = redis_client.pipeline(transaction=False)
+        for lane in lanes:
+            pipe.llen(lane)
+            pipe.zcard(f"{lane}:delayed")
+        pipe.llen("tasks_failed")
+        pipe.zcount(registry.heartbeats_key, time.time() - registry.active_window, "+inf")
+        replies = pipe.execute()
+        totals = replies if totals is None else [total + reply for total, reply in zip(totals, replies)]
+    for lane, depth, delayed in zip(lanes, totals[:-2:2], totals[1:-2:2]):
+        QUEUE_DEPTH.set(depth, queue=lane)
+        QUEUE_DEPTH.set(delayed, queue=f"{lane}:delayed")
+    QUEUE_DEPTH.set(totals[-2], queue="tasks_failed")
+    ACTIVE_WORKERS.set(totals[-1])
+
+
+metrics.add_collector(_collect_queue_metrics)
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    # The route pattern, not the path, so /result/<task_id> is one series
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    if "request_start" in g:
+        REQUEST_LATENCY.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, code=response.status_code)
+    return response
+
+
+def _client_id():
+    """Who a submission counts against for rate limiting: the client header, else the address."""
+    return request.headers.get(Config.ADMISSION_CLIENT_HEADER) or request.remote_addr or "anonymous"
+
+
+def _throttled(decision):
+    return jsonify(throttled_body(decision)), 429, {"Retry-After": str(decision["retry_after"])}
 
 
 @app.route('/')
@@ -28,135 +106,204 @@ def submit_task():
             return jsonify({"error": "Invalid task format. Must be { task: { id: ..., payload: ... } }"}), 400
 
         task = task_data["task"]
-        if not task.get("id") or not task.get("payload"):
-            return jsonify({"error": "Task must contain 'id' and 'payload'"}), 400
+        error = task_error(task)
+        if error:
+            return jsonify({"error": error}), 400
+
+        # A retry of an accepted task only gets its original acceptance back, so it costs nothing
+        duplicate = admission.enabled and task_scheduler.already_submitted([task])[0]
+        throttled = None if duplicate else admission.check(_client_id(), tasks=[task])
+        if throttled:
+            return _throttled(throttled)
 
-        task_scheduler.assign_task(task)
-        return jsonify({"message": f"Task {task['id']} submitted successfully!"}), 200
+        body, status = submit_reply(task, task_scheduler.assign_task(task))
+        return jsonify(body), status
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 
-@app.route('/queue_status')
-def queue_status():
-    redis_client = redis.StrictRedis(host="localhost", port=6379, db=0, decode_responses=True)
+@app.route('/submit_tasks', methods=['POST'])
+def submit_tasks():
+    try:
+        task_data = request.get_json()
+        if not task_data or not isinstance(task_data.get("tasks"), list):
+            return jsonify({"error": "Invalid batch format. Must be { tasks: [ { id: ..., payload: ... }, ... ] }"}), 400
 
-    tasks = []
-    failed = []
+        tasks = task_data["tasks"]
+        if len(tasks) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch too large. At most {MAX_BATCH_SIZE} tasks per request"}), 400
 
-    # Pending tasks from main queue
-    try:
-        for item in redis_client.lrange("task_queue", 0, 10):
+        # Validate everything up front; only valid tasks reach the scheduler
+        results = [None] * len(tasks)
+        valid_indexes = []
+        for index, task in enumerate(tasks):
+            error = task_error(task)
+            if error:
+                task_id = task.get("id") if isinstance(task, dict) else None
+                results[index] = {"id": task_id, "status": "rejected", "error": error}
+            else:
+                valid_indexes.append(index)
+
+        if valid_indexes:
             try:
-                t = json.loads(item)
-                tasks.append({
-                    "id": t.get("id", "?"),
-                    "payload": t.get("payload", "?"),
-                    "location": "task_queue"
-                })
-            except Exception:
-                continue
-    except Exception:
-        pass
-
-    # Tasks from each worker's processing queue
+                valid = [tasks[i] for i in valid_indexes]
+                # Retries of accepted tasks are not enqueued again, so only new tasks are charged
+                seen = task_scheduler.already_submitted(valid) if admission.enabled else [False] * len(valid)
+                charged = [task for task, duplicate in zip(valid, seen) if not duplicate]
+                throttled = admission.check(_client_id(), cost=len(charged), tasks=charged) if charged else None
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if throttled:
+                return _throttled(throttled)
+            assigned = task_scheduler.assign_tasks(valid)
+            for index, result in zip(valid_indexes, assigned):
+                results[index] = result
+
+        accepted = sum(1 for r in results if r["status"] == "accepted")
+        return jsonify({
+            "accepted": accepted,
+            "rejected": len(results) - accepted,
+            "results": results
+        }), 200
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+@app.route('/result/<task_id>')
+def get_result(task_id):
+    """
+    Return a task's result. With ?wait=<seconds>, hold the request until the result
+    is written (up to RESULT_MAX_WAIT), woken by the worker rather than by polling.
+    Tasks submitted with a routing_key are looked up with ?routing_key=<key>:
+    their result is kept on that key's shard.
+    """
     try:
-        for key in redis_client.keys("processing:*"):
-            queue_name = key
-            for item in redis_client.lrange(queue_name, 0, 10):
-                try:
-                    t = json.loads(item)
-                    tasks.append({
-                        "id": t.get("id", "?"),
-                        "payload": t.get("payload", "?"),
-                        "location": queue_name
-                    })
-                except Exception:
-                    continue
-    except Exception:
-        pass
-
-    # Failed tasks
+        wait = float(request.args.get("wait", 0))
+        # nan and inf pass the clamp below
+        if not math.isfinite(wait):
+            raise ValueError(wait)
+        wait = min(max(wait, 0), Config.RESULT_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "'wait' must be a number of seconds"}), 400
     try:
-        for item in redis_client.lrange("tasks_failed", 0, 10):
-            try:
-                t = json.loads(item)
-                failed.append({
-                    "id": t.get("id", "?"),
-                    "payload": t.get("payload", "?")
-                })
-            except Exception:
-                continue
-    except Exception:
-        pass
-
-    return jsonify({
-        "queue_size": len(tasks),
-        "tasks": tasks,
-        "failed_tasks": failed
-    })
+        shard = shard_index(request.args.get("routing_key") or task_id)
+        # The long-poll holds its connection from the blocking pool, not the one submissions use
+        results = ResultBackend(get_shard(shard), blocking_client=get_shard(shard, blocking=True))
+        record = results.wait(task_id, wait)
+        if record is None:
+            return jsonify({"task_id": task_id, "status": "pending"}), 202
+        return jsonify(record), 200
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 
-@app.route('/system_status')
-def system_status():
-    redis_client = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+@app.route('/results', methods=['POST'])
+def get_results():
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get("task_ids"), list):
+            return jsonify({"error": "Invalid format. Must be { task_ids: [ ... ] }"}), 400
+        task_ids = [str(task_id) for task_id in data["task_ids"]]
+        if len(task_ids) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Too many task ids. At most {MAX_BATCH_SIZE} per request"}), 400
+        # Unfinished or expired tasks map to null. Routing keys are not known here,
+        # so every shard is asked: one MGET each
+        results = dict.fromkeys(task_ids)
+        for index in range(shard_count()):
+            for task_id, record in ResultBackend(get_shard(index)).get_many(task_ids).items():
+                results[task_id] = results[task_id] or record
+        return jsonify({"results": results}), 200
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of this process: API, scheduler and queue metrics."""
+    return metrics.render(), 200, {"Content-Type": CONTENT_TYPE}
+
+
+def _status_page(snapshot, sections):
+    """The requested sections of a snapshot, with its task list paginated by ?cursor=&limit=."""
+    tasks, next_cursor = page(snapshot["tasks"], request.args.get("cursor"), request.args.get("limit"))
+    body = {section: snapshot[section] for section in sections}
+    body.update(tasks=tasks, next_cursor=next_cursor, version=snapshot["version"],
+                generated_at=snapshot["generated_at"])
+    return jsonify(body)
 
-    tasks = []
-    failed = []
-    workers = []
 
-    # Pending tasks
+@app.route('/queue_status')
+def queue_status():
+    """
+    Pending and in-flight tasks from the shared status snapshot. `queue_size` and
+    lane depths are LLEN counts; `tasks` holds the head of each queue, a page at a time.
+    """
     try:
-        for item in redis_client.lrange("task_queue", 0, -1):
-            try:
-                t = json.loads(item)
-                tasks.append({
-                    "id": t.get("id", "?"),
-                    "payload": t.get("payload", "")
-                })
-            except Exception:
-                continue
-    except Exception:
-        pass
-
-    # Failed tasks
+        return _status_page(status_snapshots.current(), ("queue_size", "counts", "lanes", "failed_tasks"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+@app.route('/system_status')
+def system_status():
     try:
-        for item in redis_client.lrange("tasks_failed", 0, 10):
-            try:
-                t = json.loads(item)
-                failed.append({
-                    "id": t.get("id", "?"),
-                    "payload": t.get("payload", "")
-                })
-            except Exception:
-                continue
-    except Exception:
-        pass
-
-    # Workers
+        return _status_page(status_snapshots.current(), ("queue_size", "counts", "failed_tasks", "workers"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+# Snapshot versions restart with the process and differ between API instances, so
+# event ids carry this process's epoch: an id from anywhere else gets the full snapshot
+EVENT_EPOCH = uuid.uuid4().hex[:8]
+
+
+def _status_event(version, changes):
+    return (f"id: {EVENT_EPOCH}-{version}\nevent: status\n"
+            f"data: {json.dumps({'version': version, 'changes': changes})}\n\n")
+
+
+def _last_event_version(event_id):
+    """The snapshot version a Last-Event-ID refers to, or 0 (unknown) if it was not issued by this process."""
+    epoch, _, version = (event_id or "").partition("-")
+    if epoch != EVENT_EPOCH:
+        return 0
     try:
-        for key in redis_client.keys("worker_status:*"):
-            try:
-                val = redis_client.get(key)
-                if val:
-                    data = json.loads(val)
-                    workers.append({
-                        "worker_id": data.get("worker_id"),
-                        "status": data.get("status", "idle"),
-                        "current_task_id": data.get("current_task_id", ""),
-                        "last_heartbeat": data.get("last_heartbeat", 0)
-                    })
-            except Exception:
-                continue
-    except Exception:
-        pass
-
-    return jsonify({
-        "queue_size": len(tasks),
-        "tasks": tasks,
-        "failed_tasks": failed,
-        "workers": workers
-    })
+        return int(version)
+    except ValueError:
+        return 0
+
+
+@app.route('/events')
+def events():
+    """
+    Server-sent status stream. The first event carries every section (or, on a
+    reconnect with a Last-Event-ID from this process, what changed since); later
+    events carry only the sections that changed. Clients apply each event's
+    `changes` over their state.
+    """
+    last_version = _last_event_version(request.headers.get("Last-Event-ID"))
+
+    def stream():
+        status_snapshots.subscribe()
+        try:
+            status_snapshots.current()
+            version = last_version
+            while True:
+                snapshot, changes = status_snapshots.changes_since(version)
+                if snapshot["version"] != version:
+                    version = snapshot["version"]
+                    yield _status_event(version, changes)
+                if status_snapshots.wait_for_change(version, Config.STATUS_KEEPALIVE)["version"] == version:
+                    yield ": keep-alive\n\n"
+        finally:
+            status_snapshots.unsubscribe()
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 if __name__ == "__main__":
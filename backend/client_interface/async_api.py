@@ -0,0 +1,222 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from master_node.sharded_scheduler import create_scheduler
+from utils.config import Config
+from utils.logger import Logger
+from utils.metrics import metrics
+from client_interface.submission import task_error, submit_reply
+from client_interface.admission import AdmissionController
+
+BATCH_SIZE = metrics.histogram("ingest_batch_size", "Submissions coalesced into one scheduler write",
+                               buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+
+
+class MicroBatcher:
+    """
+    Group commit for submissions. Concurrent submit() calls are coalesced and
+    handed to `flush(items) -> results` as one batch once `max_batch` items are
+    waiting or `max_delay` seconds after the first, whichever comes first.
+    Each caller gets back the result for its own item, or the batch's exception.
+
+    `flush` is the scheduler's synchronous batch path, run on a small thread
+    pool, so Redis round trips scale with batches rather than requests and the
+    event loop never blocks on them.
+    """
+    def __init__(self, flush, max_batch=None, max_delay=None, workers=None):
+        self.flush = flush
+        self.max_batch = max_batch or Config.INGEST_BATCH_SIZE
+        self.max_delay = (max_delay if max_delay is not None else Config.INGEST_BATCH_DELAY_MS / 1000)
+        self.executor = ThreadPoolExecutor(max_workers=workers or Config.INGEST_FLUSH_WORKERS)
+        self.logger = Logger()
+        self._pending = []  # (item, future)
+        self._timer = None
+        self._writes = set()  # batches being written; the loop keeps only weak references
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush_now)
+        return await future
+
+    def _take_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _flush_now(self):
+        batch = self._take_batch()
+        if batch:
+            write = asyncio.ensure_future(self._write(batch))
+            self._writes.add(write)
+            write.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch):
+        items = [item for item, _ in batch]
+        BATCH_SIZE.observe(len(items))
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self.flush, items)
+        except Exception as e:
+            self.logger.log(f"[Ingest] Batch of {len(items)} submissions failed: {e}", level="error")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """Write what is still waiting and let in-flight batches finish."""
+        batch = self._take_batch()
+        if batch:
+            await self._write(batch)
+        if self._writes:
+            await asyncio.gather(*self._writes)
+        self.executor.shutdown(wait=True)
+
+
+class IngestApp:
+    """
+    ASGI front end exposing the /submit_task contract of the Flask API, with
+    submissions micro-batched into the scheduler's batch write. Admission is
+    checked for the whole batch in the same flush. Run it with any ASGI
+    server, e.g. `uvicorn client_interface.async_api:app --port 5001`.
+    """
+    def __init__(self, scheduler=None, batcher=None, admission=None):
+        self._scheduler = scheduler
+        self._batcher = batcher
+        self._admission = admission
+
+    @property
+    def batcher(self):
+        # Built on first use so importing the module needs no Redis
+        if self._batcher is None:
+            self._scheduler = self._scheduler or create_scheduler()
+            self._admission = self._admission or AdmissionController.for_scheduler(self._scheduler)
+            self._batcher = MicroBatcher(self._write_batch)
+        return self._batcher
+
+    def _write_batch(self, items):
+        """Admit [(task, client id)], charging only new tasks, then enqueue the admitted ones together."""
+        # Retries of accepted tasks are not enqueued again, so only new tasks are charged
+        seen = (self._scheduler.already_submitted([task for task, _ in items]) if self._admission.enabled
+                else [False] * len(items))
+        charged = [index for index, duplicate in enumerate(seen) if not duplicate]
+        results = [None] * len(items)
+        decisions = self._admission.check_many([(items[index][1], 1, [items[index][0]]) for index in charged])
+        for index, decision in zip(charged, decisions):
+            results[index] = decision
+        admitted = [index for index, throttled in enumerate(results) if throttled is None]
+        for index, throttled in enumerate(results):
+            if throttled is not None:
+                results[index] = dict(throttled, id=items[index][0].get("id"), status="throttled")
+        if admitted:
+            assigned = self._scheduler.assign_tasks([items[index][0] for index in admitted])
+            for index, result in zip(admitted, assigned):
+                results[index] = result
+        return results
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"]
+        if method == "OPTIONS":
+            await self._reply(send, 204, None)
+        elif path == "/" and method == "GET":
+            await self._reply(send, 200, "API is running")
+        elif path == "/submit_task" and method == "POST":
+            await self._submit_task(scope, receive, send)
+        else:
+            await self._reply(send, 404, {"error": "Not found"})
+
+    async def _submit_task(self, scope, receive, send):
+        try:
+            task_data = json.loads(await self._read_body(receive) or b"null")
+        except ValueError:
+            task_data = None
+        if not isinstance(task_data, dict) or "task" not in task_data:
+            await self._reply(send, 400, {"error": "Invalid task format. Must be { task: { id: ..., payload: ... } }"})
+            return
+        task = task_data["task"]
+        error = task_error(task)
+        if error:
+            await self._reply(send, 400, {"error": error})
+            return
+        try:
+            body, status = submit_reply(task, await self.batcher.submit((task, self._client_id(scope))))
+        except Exception as e:
+            body, status = {"error": f"Server error: {str(e)}"}, 500
+        await self._reply(send, status, body)
+
+    def _client_id(self, scope):
+        header = Config.ADMISSION_CLIENT_HEADER.lower().encode("latin-1")
+        for name, value in scope.get("headers", []):
+            if name == header and value:
+                return value.decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else "anonymous"
+
+    async def _read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def _reply(self, send, status, body):
+        headers = []
+        if status == 429:
+            headers.append((b"retry-after", str(body["retry_after"]).encode()))
+        if body is None:
+            payload, content_type = b"", b"text/plain"
+        elif isinstance(body, str):
+            payload, content_type = body.encode("utf-8"), b"text/plain; charset=utf-8"
+        else:
+            payload, content_type = json.dumps(body).encode("utf-8"), b"application/json"
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", content_type),
+            (b"content-length", str(len(payload)).encode()),
+            # Same open CORS policy as the Flask API
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-headers", f"Content-Type, {Config.ADMISSION_CLIENT_HEADER}".encode()),
+            (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+        ] + headers})
+        await send({"type": "http.response.body", "body": payload})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._batcher is not None:
+                    # Write what is still waiting before the process exits
+                    await self._batcher.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = IngestApp()
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The async ingestion server needs an ASGI server: pip install uvicorn")
+    uvicorn.run(app, host="0.0.0.0", port=Config.INGEST_PORT)
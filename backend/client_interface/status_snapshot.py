@@ -0,0 +1,211 @@
+import time
+import json
+import threading
+from utils.config import Config
+from utils.logger import Logger
+from utils.worker_registry import WorkerRegistry
+from task_queue.codec import decode_task
+from task_queue.claim_check import payload_preview
+from task_queue.priority_lanes import PriorityLanes
+
+# Snapshot sections sent as a whole when any part of them changes
+SECTIONS = ("queue_size", "counts", "lanes", "tasks", "failed_tasks", "workers")
+
+
+def _preview(item, **extra):
+    try:
+        task = decode_task(item)
+    except Exception:
+        return None
+    entry = {"id": task.get("id", "?"), "payload": payload_preview(task, "?")}
+    entry.update(extra)
+    return entry
+
+
+def diff(old, new):
+    """The sections of `new` that differ from `old` (all of them when there is no `old`)."""
+    if old is None:
+        return {section: new[section] for section in SECTIONS}
+    return {section: new[section] for section in SECTIONS if old.get(section) != new[section]}
+
+
+class StatusSnapshotter:
+    """
+    One compact view of the system, rebuilt by a background thread every
+    `interval` seconds and shared by every dashboard, however many are open.
+
+    A rebuild costs two round trips per queue shard: active workers, then one
+    pipeline with LLEN of every queue and the first `preview` tasks of each.
+    Status requests are served from memory; /events subscribers are woken on
+    each new version and sent only the sections that changed.
+    """
+    def __init__(self, redis_clients, interval=None, preview=None, idle_timeout=None):
+        # One client, or one per queue shard whose status is summed into the snapshot
+        self.shards = list(redis_clients) if isinstance(redis_clients, (list, tuple)) else [redis_clients]
+        self.interval = interval or Config.STATUS_INTERVAL
+        self.preview = preview or Config.STATUS_PREVIEW
+        # No rebuilds while nobody has asked for the status this long
+        self.idle_timeout = idle_timeout or Config.STATUS_IDLE_TIMEOUT
+        self.logger = Logger()
+        self._snapshot = None
+        self._delta = None  # (previous version, sections changed since it)
+        self._subscribers = 0
+        self._last_access = 0.0
+        self._changed = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def build(self):
+        """Read the current status from Redis. Returns the snapshot without publishing it."""
+        snapshot = self._read(self.shards[0])
+        for index, redis_client in enumerate(self.shards[1:], 1):
+            part = self._read(redis_client, shard=index)
+            snapshot["queue_size"] += part["queue_size"]
+            for name, count in part["counts"].items():
+                snapshot["counts"][name] += count
+            for section in ("lanes", "tasks", "failed_tasks", "workers"):
+                snapshot[section] += part[section]
+        if len(self.shards) > 1:
+            for lane in snapshot["lanes"]:
+                lane.setdefault("shard", 0)
+        snapshot["workers"].sort(key=lambda worker: str(worker["worker_id"]))
+        return snapshot
+
+    def _read(self, redis_client, shard=None):
+        """The status of one shard, in two round trips."""
+        registry = WorkerRegistry(redis_client)
+        active = registry.get_active_workers()
+        lane_names = list(enumerate(PriorityLanes(redis_client).names))[::-1]  # most urgent first
+        processing = [f"processing:{worker_id}" for worker_id, _ in active]
+        head = self.preview - 1
+
+        pipe = redis_client.pipeline(transaction=False)
+        for _, lane in lane_names:
+            pipe.llen(lane)
+            pipe.zcard(f"{lane}:delayed")
+            pipe.lrange(lane, 0, head)
+        for queue_name in processing:
+            pipe.llen(queue_name)
+            pipe.lrange(queue_name, 0, head)
+        pipe.llen("tasks_failed")
+        pipe.lrange("tasks_failed", 0, head)
+        pipe.hvals(registry.info_key)
+        replies = iter(pipe.execute())
+
+        lanes, tasks, failed, workers = [], [], [], []
+        pending = delayed = in_flight = 0
+        for priority, lane in lane_names:
+            depth, parked, items = next(replies), next(replies), next(replies)
+            pending += depth
+            delayed += parked
+            lanes.append({"priority": priority, "queue": lane, "depth": depth, "delayed": parked})
+            if shard is not None:
+                lanes[-1]["shard"] = shard
+            tasks += [_preview(item, priority=priority, location=lane) for item in items]
+        for queue_name in processing:
+            depth, items = next(replies), next(replies)
+            in_flight += depth
+            tasks += [_preview(item, location=queue_name) for item in items]
+        failed_count, failed_items = next(replies), next(replies)
+        failed = [_preview(item) for item in failed_items]
+        for raw in next(replies):
+            try:
+                info = json.loads(raw)
+            except (TypeError, ValueError):
+                continue
+            workers.append({
+                "worker_id": info.get("worker_id"),
+                "status": info.get("status", "idle"),
+                "current_task_id": info.get("current_task_id", ""),
+                "last_heartbeat": info.get("last_heartbeat", 0)
+            })
+
+        return {
+            "queue_size": pending,
+            "counts": {"pending": pending, "delayed": delayed, "processing": in_flight,
+                       "failed": failed_count, "workers": len(active)},
+            "lanes": lanes,
+            "tasks": [task for task in tasks if task],
+            "failed_tasks": [task for task in failed if task],
+            "workers": workers,
+        }
+
+    def refresh(self):
+        """Rebuild and publish a snapshot; subscribers wake only if something changed."""
+        snapshot = self.build()
+        with self._changed:
+            current = self._snapshot
+            changes = diff(current, snapshot)
+            if current is not None and not changes:
+                current["generated_at"] = time.time()
+                return current
+            snapshot["version"] = current["version"] + 1 if current else 1
+            snapshot["generated_at"] = time.time()
+            if current is not None:
+                self._delta = (current["version"], changes)
+            self._snapshot = snapshot
+            self._changed.notify_all()
+            return snapshot
+
+    def _run(self):
+        while True:
+            if self._subscribers or time.time() - self._last_access < self.idle_timeout:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    self.logger.log("[Status] Snapshot failed: %s", e, level="warning")
+            time.sleep(self.interval)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+
+    def current(self):
+        """The latest snapshot; built on the spot when there is none or it went stale while idle."""
+        self._last_access = time.time()
+        self._ensure_started()
+        snapshot = self._snapshot
+        if snapshot is None or time.time() - snapshot["generated_at"] > 2 * self.interval:
+            snapshot = self.refresh()
+        return snapshot
+
+    def changes_since(self, version):
+        """(latest snapshot, sections changed since `version`); everything for an unknown version."""
+        with self._changed:
+            snapshot, delta = self._snapshot, self._delta
+        if delta is not None and delta[0] == version:
+            return snapshot, delta[1]
+        return snapshot, diff(None, snapshot)
+
+    def wait_for_change(self, version, timeout):
+        """Block until a snapshot newer than `version` is published or `timeout` passes."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._snapshot and self._snapshot["version"] != version, timeout)
+            return self._snapshot
+
+    def subscribe(self):
+        with self._changed:
+            self._subscribers += 1
+        self._ensure_started()
+
+    def unsubscribe(self):
+        with self._changed:
+            self._subscribers -= 1
+        self._last_access = time.time()
+
+
+def page(items, cursor, limit):
+    """
+    Slice a snapshot list at an opaque cursor. Returns (items, next cursor or None).
+    Raises ValueError for a malformed cursor or limit.
+    """
+    offset = int(cursor or 0)
+    limit = int(limit or Config.STATUS_PAGE_SIZE)
+    if offset < 0 or limit < 1:
+        raise ValueError("'cursor' and 'limit' must be non-negative and positive")
+    limit = min(limit, Config.STATUS_MAX_PAGE_SIZE)
+    end = offset + limit
+    return items[offset:end], (str(end) if end < len(items) else None)
@@ -0,0 +1,42 @@
+from utils.config import Config
+from task_queue.delayed_tasks import parse_due_time
+from task_queue.retry_policy import RetryPolicy
+
+
+def task_error(task):
+    """Return why a submitted task is invalid, or None if it can be scheduled."""
+    if not isinstance(task, dict) or not task.get("id") or not task.get("payload"):
+        return "Task must contain 'id' and 'payload'"
+    priority = task.get("priority", 0)
+    levels = Config.PRIORITY_LEVELS
+    if isinstance(priority, bool) or not isinstance(priority, int) or not 0 <= priority < levels:
+        return f"'priority' must be an integer from 0 (lowest) to {levels - 1}"
+    if "routing_key" in task and (not isinstance(task["routing_key"], str) or not task["routing_key"]):
+        return "'routing_key' must be a non-empty string"
+    try:
+        parse_due_time(task)
+        if "retry" in task:
+            RetryPolicy().merged(task["retry"])
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def submit_reply(task, result):
+    """The /submit_task reply for a scheduler result, as (body, status code)."""
+    response = {"message": f"Task {task['id']} submitted successfully!"}
+    if isinstance(result, dict):
+        if result.get("status") == "throttled":
+            return throttled_body(result), 429
+        if result.get("status") == "rejected":
+            return {"error": result.get("error", "Enqueue failed")}, 503
+        if result.get("duplicate"):
+            # A retried submission: report the original acceptance, enqueue nothing
+            response = {"message": f"Task {task['id']} was already submitted.", "duplicate": True}
+        response["result"] = result
+    return response, 200
+
+
+def throttled_body(decision):
+    """Body of a 429; the front end also sends `retry_after` as the Retry-After header."""
+    return {"error": decision["error"], "reason": decision["reason"], "retry_after": decision["retry_after"]}
@@ -1,19 +1,103 @@
+import random
+import time
 import requests
 
+# Responses that mean "the server is overloaded, come back later"
+RETRY_STATUSES = (429, 503)
+
 class TaskSubmission:
     """
     Provides programmatic submission of tasks to the master node,
     separate from a direct HTTP/Flask interface.
+
+    Submissions back off adaptively under overload: a 429/503 is retried after
+    the server's Retry-After (or capped exponential backoff with jitter), and
+    the client paces itself with a delay between submissions that grows on
+    each refusal and decays on each success. Retrying is safe because the
+    server deduplicates resubmitted task ids.
     """
-    def __init__(self, master_node_url="http://localhost:5000/submit_task"):
+    def __init__(self, master_node_url="http://localhost:5000/submit_task", bulk_url=None,
+                 client_id=None, max_retries=5, max_backoff=60):
         self.master_node_url = master_node_url
+        # Bulk endpoint lives next to the single-task one unless given explicitly
+        self.bulk_url = bulk_url or master_node_url.rsplit("/", 1)[0] + "/submit_tasks"
+        self.base_url = master_node_url.rsplit("/", 1)[0]
+        # Sent as X-Client-ID so rate limits apply per client rather than per address
+        self.headers = {"X-Client-ID": client_id} if client_id else {}
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.pace = 0.0  # seconds to wait before each submission; adapts to refusals
+
+    def _post_with_backoff(self, url, body):
+        """POST, retrying refusals with backoff; returns the final response."""
+        attempt = 0
+        while True:
+            if self.pace:
+                time.sleep(self.pace)
+            response = requests.post(url, json=body, headers=self.headers)
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                if response.status_code not in RETRY_STATUSES:
+                    # Speed back up gradually once accepted
+                    self.pace = self.pace * 0.9 if self.pace > 0.001 else 0.0
+                return response
+            attempt += 1
+            # Slow down sharply on every refusal
+            self.pace = min(max(self.pace * 2, 0.05), self.max_backoff)
+            time.sleep(self._retry_delay(response, attempt))
+
+    def _retry_delay(self, response, attempt):
+        try:
+            delay = float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            delay = min(self.max_backoff, 0.5 * 2 ** attempt)
+        # Jitter keeps refused clients from all coming back at the same instant
+        return min(delay, self.max_backoff) * random.uniform(1.0, 1.5)
 
     def submit_task(self, task):
         """
         Sends a task to the master node via a POST request.
         """
         try:
-            response = requests.post(self.master_node_url, json={"task": task})
+            response = self._post_with_backoff(self.master_node_url, {"task": task})
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e)}
+
+    def submit_many(self, tasks):
+        """
+        Sends a batch of tasks in a single POST request.
+        The response carries one accept/reject result per task, in order.
+        """
+        try:
+            response = self._post_with_backoff(self.bulk_url, {"tasks": list(tasks)})
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e)}
+
+    def get_result(self, task_id, wait=0, routing_key=None):
+        """
+        Fetches a task's result. With `wait` > 0 the server holds the request
+        until the result is ready (or `wait` seconds pass) instead of us polling.
+        Pass the task's `routing_key` if it was submitted with one.
+        """
+        params = {"wait": wait}
+        if routing_key:
+            params["routing_key"] = routing_key
+        try:
+            response = requests.get(f"{self.base_url}/result/{task_id}", params=params, timeout=wait + 10)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e)}
+
+    def get_results(self, task_ids):
+        """
+        Fetches the results of many tasks in one request; unfinished ones are None.
+        """
+        try:
+            response = requests.post(f"{self.base_url}/results", json={"task_ids": list(task_ids)})
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -1,33 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from utils.config import Config
+from utils.redis_client import get_redis
 from utils.logger import Logger
+from utils.worker_registry import WorkerRegistry
+from task_queue.codec import encode_task
+from task_queue.priority_lanes import PriorityLanes
+from task_queue.task_leases import TaskLeases
+from utils.metrics import metrics, redis_latency
+
+WORKERS_RECOVERED = metrics.counter("monitor_workers_recovered_total", "Dead workers whose tasks were requeued")
+TASKS_REQUEUED = metrics.counter("monitor_tasks_requeued_total", "Tasks put back on a queue by recovery", ["reason"])
 
 class FailureHandler:
     """
-    Handles node failures by detecting worker downtime and 
+    Handles node failures by detecting worker downtime and
     reassigning in-progress tasks.
+
+    The one recovery engine for the Monitor (dead workers) and the TaskMonitor
+    (stalled tasks). On the list engine a dead worker's queue moves back to the
+    front of its lanes in one atomic server-side step, so a crash mid-recovery
+    can neither lose nor duplicate tasks. On the stream engine its pending
+    entries are re-added at the tail of the stream, in atomic batches: stream IDs
+    only grow, so they cannot jump the queue. Many workers failing together are
+    recovered in parallel.
     """
-    def __init__(self):
+    def __init__(self, redis_client=None, main_queue="task_queue", processing_prefix="processing:",
+                 stream_queue=None, concurrency=None):
+        self.redis = redis_client or get_redis()
+        self.registry = WorkerRegistry(self.redis)
+        self.lanes = PriorityLanes(self.redis, main_queue)
+        self.leases = TaskLeases(self.redis)
+        # Stream engine: a dead worker's pending entries are requeued (at the tail) instead of its list
+        self.stream_queue = stream_queue
+        self.processing_prefix = processing_prefix
+        self.concurrency = concurrency or Config.RECOVERY_CONCURRENCY
         self.logger = Logger()
 
     def handle_worker_failure(self, worker_id):
         """
-        Called when a worker node is detected to have failed 
-        or gone offline.
+        Called when a worker node is detected to have failed
+        or gone offline. Requeues its tasks, drops it from the registry
+        and returns the number of tasks requeued.
         """
         self.logger.log(f"Handling failure for worker: {worker_id}")
-        # You might check which tasks that worker was processing,
-        # then push them back into the queue, or call a reassign method.
-        # Example:
-        # tasks_in_flight = self._get_inflight_tasks(worker_id)
-        # for task in tasks_in_flight:
-        #     self.logger.log(f"Reassigning task {task['id']} from failed worker {worker_id}")
-        #     self.reassign_task(task)
-        pass
+        with redis_latency.time(op="requeue"):
+            if self.stream_queue:
+                count = self.stream_queue.requeue_consumer(worker_id)
+                source = self.stream_queue.stream_name
+            else:
+                source = f"{self.processing_prefix}{worker_id}"
+                count = self.lanes.requeue(source)
+        self.registry.remove(worker_id)
+        WORKERS_RECOVERED.inc()
+        TASKS_REQUEUED.inc(count, reason="dead_worker")
+        self.logger.log(f"Requeued {count} task(s) of {worker_id} from '{source}'")
+        return count
+
+    def handle_worker_failures(self, worker_ids):
+        """
+        Recover many dead workers at once, up to `concurrency` in parallel.
+        Returns {worker_id: tasks requeued, or None if its recovery failed}.
+        A failed recovery leaves the worker registered, so the next check retries it.
+        """
+        worker_ids = list(worker_ids)
+        if not worker_ids:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(worker_ids))) as pool:
+            futures = {worker_id: pool.submit(self.handle_worker_failure, worker_id) for worker_id in worker_ids}
+        recovered = {}
+        for worker_id, future in futures.items():
+            try:
+                recovered[worker_id] = future.result()
+            except Exception as e:
+                self.logger.log(f"Failed to recover tasks of {worker_id}: {e}")
+                recovered[worker_id] = None
+        return recovered
+
+    def reclaim_stalled_tasks(self):
+        """Requeue tasks whose lease expired (list engine). Returns the count requeued."""
+        with redis_latency.time(op="reclaim"):
+            count = self.leases.reclaim_expired()
+        TASKS_REQUEUED.inc(count, reason="lease_expired")
+        return count
 
     def reassign_task(self, task):
         """
-        Logic to push the task back to the master or a queue
-        so another worker can pick it up.
+        Push a task back to the front of its lane
+        so another worker picks it up next.
         """
-        # Implementation depends on your queue mechanism
-        # e.g. redis_queue.add_task_to_queue(task)
+        self.redis.lpush(self.lanes.name_for(task), encode_task(task))
         self.logger.log(f"Task {task['id']} reassigned after worker failure.")
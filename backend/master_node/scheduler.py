@@ -1,113 +1,520 @@
 import time
-import json
+import heapq
 import random
 from task_queue.redis_queue import RedisQueue
+from task_queue.stream_queue import StreamQueue
+from task_queue.codec import encode_task
+from task_queue.claim_check import ClaimCheck
+from task_queue.priority_lanes import PriorityLanes, LanePolicy
+from task_queue.delayed_tasks import DelayedTasks, parse_due_time
+from task_queue.idempotency import IdempotencyGuard
+from utils.config import Config
 from utils.logger import Logger
+from utils.worker_registry import WorkerRegistry
+from utils.service_stats import task_type, estimate, backlog, expected_completion
+from utils.metrics import metrics, redis_latency
+
+DISPATCH_LATENCY = metrics.histogram(
+    "scheduler_dispatch_seconds", "Time to place a submission, or to run one lane dispatch round", ["path"])
+TASKS_SUBMITTED = metrics.counter("scheduler_tasks_submitted_total", "Submitted tasks by outcome", ["status"])
+
+
+def _count_submissions(results):
+    for result in results:
+        if isinstance(result, dict):
+            status = "duplicate" if result.get("duplicate") else "delayed" if "eta" in result else result.get("status")
+            TASKS_SUBMITTED.inc(status=status)
 
 class TaskScheduler:
-    def __init__(self):
-        self.redis_queue = RedisQueue()
+    def __init__(self, dispatch_mode=None, shard=None):
+        # With the stream engine the consumer group does the dispatching; we only enqueue
+        self.queue_engine = Config.QUEUE_ENGINE
+        # One scheduler per queue shard; everything below lives on that shard's server
+        self.shard = Config.SHARD if shard is None else shard
+        queue_class = StreamQueue if self.queue_engine == "stream" else RedisQueue
+        self.redis_queue = queue_class(shard=self.shard)
         self.logger = Logger()
+        self.registry = WorkerRegistry(self.redis_queue.redis_client)
+        # Large payloads are swapped for blob-store references before they hit a queue
+        self.claim_check = ClaimCheck(self.redis_queue.redis_client, shard=self.shard)
         # Queue and key prefixes
         self.main_queue = self.redis_queue.main_queue_name  # e.g. "task_queue"
         self.processing_prefix = "processing:"
-        self.heartbeat_prefix = "worker_status:"
+        # Priority lanes (main_queue is lane 0) and the policy sharing free slots between them
+        self.lanes = PriorityLanes(self.redis_queue.redis_client, self.main_queue)
+        self.lane_policy = LanePolicy(self.lanes.levels)
+        # Tasks with a future eta/countdown are parked per target queue and promoted when due
+        stream = self.queue_engine == "stream"
+        self.delayed = DelayedTasks(self.redis_queue.redis_client,
+                                    [self.main_queue] if stream else self.lanes.names, stream=stream)
+        self.promote_interval = 1  # seconds between promotion ticks
+        # Producer retries of an already accepted task get the original acceptance back
+        self.idempotency = IdempotencyGuard(self.redis_queue.redis_client)
+        self._last_promote = 0
+        # "poll" runs monitor_tasks; "event" runs dispatch_events
+        self.dispatch_mode = dispatch_mode or Config.DISPATCH_MODE
+        self.block_timeout = Config.DISPATCH_BLOCK_TIMEOUT
+        # How a new task picks among workers with free slots (see _select_worker)
+        self.scheduling_policy = Config.SCHEDULING_POLICY
+        if self.scheduling_policy not in ("least_time", "p2c", "most_free"):
+            raise ValueError(f"Unknown scheduling policy: {self.scheduling_policy}")
 
     def _get_active_workers(self):
-        """Retrieve active workers and their current load (queue length)."""
-        active_workers = []
+        """Retrieve active workers and their current load from the worker registry."""
         try:
-            # Get all heartbeat keys for active workers
-            keys = self.redis_queue.redis_client.keys(f"{self.heartbeat_prefix}*")
-            for key in keys:
-                data = self.redis_queue.redis_client.get(key)
-                if not data:
-                    continue
-                hb = json.loads(data)
-                worker_id = hb.get("worker_id")
-                processing_queue = hb.get("processing_queue")
-                if worker_id and processing_queue:
-                    # Determine how many tasks are in this worker's processing queue
-                    queue_length = self.redis_queue.redis_client.llen(processing_queue)
-                    active_workers.append((worker_id, queue_length))
+            return self.registry.get_active_workers()
         except Exception as e:
             self.logger.log(f"[TaskScheduler] Error fetching worker statuses: {e}")
-        return active_workers
+            return []
+
+    def _get_free_slots(self):
+        """Retrieve active workers with spare capacity and their free slot counts."""
+        try:
+            return self.registry.get_free_slots()
+        except Exception as e:
+            self.logger.log(f"[TaskScheduler] Error fetching worker capacity: {e}")
+            return []
+
+    def _get_candidates(self, sample=False):
+        """Active workers with spare capacity as [(worker_id, free, load, stats)]."""
+        try:
+            if sample:
+                return self.registry.sample_candidates(Config.SCHEDULING_SAMPLE)
+            return self.registry.get_candidates()
+        except Exception as e:
+            self.logger.log(f"[TaskScheduler] Error fetching worker candidates: {e}")
+            return []
+
+    def _select_worker(self, task=None):
+        """
+        Choose an active worker with a free slot for `task`. Busy workers are never
+        chosen, so a backlog waits in the priority lanes instead of queueing
+        behind other work in a processing queue.
+
+        least_time: the worker expected to finish the task first, from the
+                    service-time EWMAs and running tasks workers publish
+        p2c:        the better of SCHEDULING_SAMPLE random workers, sampled
+                    server-side, so a decision costs the same at any fleet size
+        most_free:  the worker with the most free slots
+        """
+        if self.scheduling_policy == "most_free":
+            free_slots = self._get_free_slots()
+            if not free_slots:
+                return None
+            most_free = max(free for _, free in free_slots)
+            # Select one worker among those with the most room
+            candidates = [wid for wid, free in free_slots if free == most_free]
+            return random.choice(candidates)
+        candidates = self._get_candidates(sample=self.scheduling_policy == "p2c")
+        if not candidates:
+            return None
+        kind = task_type(task or {})
+        now = time.time()
+        best = min(candidates, key=lambda c: (expected_completion(c[3], c[2], kind, now), -c[1], random.random()))
+        return best[0]
+
+    def _slot_heap(self):
+        """
+        Heap of (key, tie, worker_id, free slots, stats) over workers with free
+        slots; the first entry is the best next placement under the scheduling policy.
+        """
+        if self.scheduling_policy == "most_free":
+            heap = [(-free, random.random(), wid, free, {}) for wid, free in self._get_free_slots()]
+        else:
+            now = time.time()
+            heap = [(backlog(stats, load, now), random.random(), wid, free, stats)
+                    for wid, free, load, stats in self._get_candidates()]
+        heapq.heapify(heap)
+        return heap
+
+    def _placement_cost(self, stats, task):
+        """How much a placement worsens a worker's heap key."""
+        if self.scheduling_policy == "most_free":
+            return 1
+        return estimate(stats, task_type(task)) / max(int(stats.get("concurrency") or 1), 1)
+
+    def _target_for(self, task):
+        """Queue a task waits in when no worker takes it: its priority lane, or the stream."""
+        return self.main_queue if self.queue_engine == "stream" else self.lanes.name_for(task)
 
-    def _select_worker(self):
-        """Choose an available worker with the least number of pending tasks."""
-        active_workers = self._get_active_workers()
-        if not active_workers:
+    def _park_if_delayed(self, task):
+        """Park a task whose eta/countdown is in the future. Returns its result dict, or None if not delayed."""
+        due = parse_due_time(task)
+        if due is None:
             return None
-        # Sort by pending task count (load)
-        active_workers.sort(key=lambda w: w[1])
-        min_load = active_workers[0][1]
-        # Select one worker among those with the minimum load
-        candidates = [wid for wid, load in active_workers if load == min_load]
-        worker_id = random.choice(candidates)
-        return worker_id
+        task["due_timestamp"] = due
+        task_id = task.get('id', 'N/A')
+        target = self._target_for(task)
+        try:
+            self.delayed.park(target, encode_task(task), due)
+            self.logger.log("[TaskScheduler] Task %s parked in '%s' until %.3f",
+                            task_id, self.delayed.key_for(target), due, category="task")
+            return {"id": task_id, "status": "accepted", "worker_id": None, "queue": self.delayed.key_for(target), "eta": due}
+        except Exception as e:
+            self.logger.log(f"[TaskScheduler] Failed to park task {task_id}: {e}")
+            return {"id": task_id, "status": "rejected", "error": f"Enqueue failed: {e}"}
 
     def assign_task(self, task):
         """
         Assign a new task to a worker if available; otherwise queue it in the main task queue.
+        Tasks with a future eta/countdown are parked until due. Returns the acceptance
+        result; a duplicate submission gets the original one, marked "duplicate".
         """
+        with DISPATCH_LATENCY.time(path="single"):
+            original = self.idempotency.claim(task)
+            if original is not None:
+                self.logger.log("[TaskScheduler] Duplicate submission of task %s ignored",
+                                task.get('id', 'N/A'), category="task")
+                result = original
+            else:
+                result = self._assign_one(task)
+                self._release_rejected([task], [result])
+                self.idempotency.settle(task, result)
+        _count_submissions([result])
+        return result
+
+    def already_submitted(self, tasks):
+        """Per task, whether it is a known duplicate, which assign_tasks would not enqueue again."""
+        return self.idempotency.seen_many(tasks)
+
+    def _assign_one(self, task):
         # Ensure the task has a submission timestamp
         if "submit_timestamp" not in task:
             task["submit_timestamp"] = time.time()
+        task_id = task.get('id', 'N/A')
+        self.claim_check.offload(task)
+        parked = self._park_if_delayed(task)
+        if parked is not None:
+            return parked
+        if self.queue_engine == "stream":
+            message_id = self.redis_queue.add_task_to_queue(task)
+            if message_id is None:
+                return {"id": task_id, "status": "rejected", "error": "Enqueue failed"}
+            return {"id": task_id, "status": "accepted", "worker_id": None, "queue": self.main_queue}
         # Attempt to select an active worker with least load
-        worker_id = self._select_worker()
+        worker_id = self._select_worker(task)
         if worker_id:
             # Assign task to the chosen worker's processing queue
             processing_queue = f"{self.processing_prefix}{worker_id}"
             try:
-                task_json = json.dumps(task)
-                self.redis_queue.redis_client.rpush(processing_queue, task_json)
-                self.logger.log(f"[TaskScheduler] Task {task.get('id', 'N/A')} assigned to worker {worker_id}")
+                task_json = encode_task(task)
+                pipe = self.redis_queue.redis_client.pipeline(transaction=True)
+                pipe.rpush(processing_queue, task_json)
+                self.registry.adjust_load(worker_id, 1, pipe=pipe)
+                with redis_latency.time(op="assign"):
+                    pipe.execute()
+                self.logger.log("[TaskScheduler] Task %s assigned to worker %s", task_id, worker_id, category="task")
+                return {"id": task_id, "status": "accepted", "worker_id": worker_id, "queue": processing_queue}
             except Exception as e:
-                self.logger.log(f"[TaskScheduler] Failed to assign task {task.get('id', 'N/A')} to {worker_id}: {e}")
+                self.logger.log(f"[TaskScheduler] Failed to assign task {task_id} to {worker_id}: {e}")
+                return {"id": task_id, "status": "rejected", "error": f"Enqueue failed: {e}"}
         else:
-            # No available workers; push task to main queue to wait
-            self.redis_queue.add_task_to_queue(task)
-            self.logger.log(f"[TaskScheduler] No available worker. Task {task.get('id', 'N/A')} queued in '{self.main_queue}'")
+            # No free worker; the task waits in the lane for its priority
+            lane = self.redis_queue.add_task_to_queue(task)
+            if lane is None:
+                return {"id": task_id, "status": "rejected", "error": "Enqueue failed"}
+            self.logger.log("[TaskScheduler] No available worker. Task %s queued in '%s'",
+                            task_id, lane, category="task")
+            return {"id": task_id, "status": "accepted", "worker_id": None, "queue": lane}
+
+    def assign_tasks(self, tasks):
+        """
+        Assign a batch of tasks using a single snapshot of free worker slots and
+        write them all in one MULTI/EXEC pipeline. The most urgent tasks take the
+        free slots; the rest wait in their priority lanes. Returns one result
+        dict per task, in submission order; duplicates get their original one.
+        """
+        with DISPATCH_LATENCY.time(path="batch"):
+            results = self.idempotency.claim_many(tasks)
+            fresh = [index for index, original in enumerate(results) if original is None]
+            if len(fresh) < len(tasks):
+                self.logger.log(f"[TaskScheduler] {len(tasks) - len(fresh)} duplicate submission(s) in batch ignored")
+            for index, result in zip(fresh, self._assign_batch([tasks[index] for index in fresh])):
+                results[index] = result
+            self._release_rejected([tasks[index] for index in fresh], [results[index] for index in fresh])
+            self.idempotency.settle_many([tasks[index] for index in fresh], [results[index] for index in fresh])
+        _count_submissions(results)
+        return results
+
+    def _release_rejected(self, tasks, results):
+        """Delete the offloaded payloads of tasks that were rejected after the blob was written."""
+        for task, result in zip(tasks, results):
+            if result["status"] == "rejected" and "payload_ref" in task:
+                try:
+                    self.claim_check.release(task)
+                except Exception as e:
+                    self.logger.log(f"[TaskScheduler] Failed to release payload of rejected task {task.get('id', 'N/A')}: {e}")
+
+    def _assign_batch(self, tasks):
+        now = time.time()
+        if self.queue_engine == "stream":
+            return self._append_to_stream(tasks, now)
+        # One capacity snapshot for the whole batch; each placement uses up one free slot
+        heap = self._slot_heap()
+
+        results = [None] * len(tasks)
+        batches = {}  # target queue -> encoded tasks, in submission order per priority
+        parked = {}   # target queue -> {encoded task: due time}
+        assigned = {}  # worker_id -> tasks added to its processing queue
+        # Stable sort: equal priorities keep their submission order
+        order = sorted(range(len(tasks)), key=lambda i: -self.lanes.priority_of(tasks[i]))
+        for index in order:
+            task = tasks[index]
+            task_id = task.get("id", "N/A")
+            if "submit_timestamp" not in task:
+                task["submit_timestamp"] = now
+            try:
+                due = parse_due_time(task, now)
+            except ValueError as e:
+                results[index] = {"id": task_id, "status": "rejected", "error": str(e)}
+                continue
+            if due is not None:
+                task["due_timestamp"] = due
+            try:
+                task_json = encode_task(self.claim_check.offload(task))
+            except (TypeError, ValueError) as e:
+                results[index] = {"id": task_id, "status": "rejected", "error": f"Task is not serializable: {e}"}
+                continue
+            if due is not None:
+                target = self.lanes.name_for(task)
+                parked.setdefault(target, {})[task_json] = due
+                results[index] = {"id": task_id, "status": "accepted", "worker_id": None,
+                                  "queue": self.delayed.key_for(target), "eta": due}
+                continue
+            if heap:
+                key, tie, worker_id, free, stats = heapq.heappop(heap)
+                if free > 1:
+                    heapq.heappush(heap, (key + self._placement_cost(stats, task), tie, worker_id, free - 1, stats))
+                target = f"{self.processing_prefix}{worker_id}"
+            else:
+                worker_id = None
+                target = self.lanes.name_for(task)
+            batches.setdefault(target, []).append(task_json)
+            if worker_id:
+                assigned[worker_id] = assigned.get(worker_id, 0) + 1
+            results[index] = {"id": task_id, "status": "accepted", "worker_id": worker_id, "queue": target}
+
+        if not batches and not parked:
+            return results
+        try:
+            pipe = self.redis_queue.redis_client.pipeline(transaction=True)
+            for target, encoded in batches.items():
+                pipe.rpush(target, *encoded)
+            for target, members in parked.items():
+                self.delayed.park_many(target, members, pipe=pipe)
+            for worker_id, count in assigned.items():
+                self.registry.adjust_load(worker_id, count, pipe=pipe)
+            with redis_latency.time(op="assign_batch"):
+                pipe.execute()
+        except Exception as e:
+            self.logger.log(f"[TaskScheduler] Failed to write batch of {len(results)} tasks: {e}")
+            for result in results:
+                if result["status"] == "accepted":
+                    result.update({"status": "rejected", "error": f"Enqueue failed: {e}", "worker_id": None, "queue": None})
+            return results
+
+        accepted = sum(len(encoded) for encoded in batches.values())
+        delayed = sum(len(members) for members in parked.values())
+        self.logger.log(f"[TaskScheduler] Batch of {accepted} tasks written to {len(batches)} queue(s), {delayed} parked")
+        return results
+
+    def _append_to_stream(self, tasks, now):
+        """Stream-engine counterpart of assign_tasks: XADD the whole batch in one pipeline."""
+        results = []
+        encoded = []
+        parked = {}
+        for task in tasks:
+            if "submit_timestamp" not in task:
+                task["submit_timestamp"] = now
+            try:
+                due = parse_due_time(task, now)
+                if due is not None:
+                    task["due_timestamp"] = due
+                task_json = encode_task(self.claim_check.offload(task))
+            except (TypeError, ValueError) as e:
+                results.append({"id": task.get("id", "N/A"), "status": "rejected", "error": f"Invalid task: {e}"})
+                continue
+            if due is not None:
+                parked[task_json] = due
+                results.append({"id": task.get("id", "N/A"), "status": "accepted", "worker_id": None,
+                                "queue": self.delayed.key_for(self.main_queue), "eta": due})
+                continue
+            encoded.append(task_json)
+            results.append({"id": task.get("id", "N/A"), "status": "accepted", "worker_id": None,
+                            "queue": self.redis_queue.stream_name})
+        if not encoded and not parked:
+            return results
+        try:
+            if parked:
+                self.delayed.park_many(self.main_queue, parked)
+            if encoded:
+                self.redis_queue.add_encoded_tasks(encoded)
+        except Exception as e:
+            self.logger.log(f"[TaskScheduler] Failed to write batch of {len(encoded)} tasks: {e}")
+            for result in results:
+                if result["status"] == "accepted":
+                    result.update({"status": "rejected", "error": f"Enqueue failed: {e}", "queue": None})
+            return results
+        self.logger.log(f"[TaskScheduler] Batch of {len(encoded)} tasks added to stream '{self.redis_queue.stream_name}'")
+        return results
 
     def monitor_tasks(self):
         """
-        Continuously monitor the main queue and dispatch tasks to idle workers.
+        Continuously monitor the priority lanes and dispatch tasks to idle workers.
         """
         while True:
+            self._promote_due()
             try:
-                # Check number of pending tasks in the main queue
-                queue_length = self.redis_queue.redis_client.llen(self.main_queue)
+                # Depth and head age of every lane in one round trip
+                depths, ages = self.lanes.snapshot()
             except Exception as e:
                 self.logger.log(f"[TaskScheduler] Error checking main queue: {e}")
-                queue_length = 0
-            if queue_length > 0:
+                depths, ages = [], []
+            if sum(depths) > 0:
                 # Find all idle workers (with 0 tasks in their processing queue)
                 active_workers = self._get_active_workers()
                 idle_workers = [wid for wid, load in active_workers if load == 0]
-                for worker_id in idle_workers:
-                    try:
-                        # Move one task from main queue to this idle worker's queue (atomic)
-                        processing_queue = f"{self.processing_prefix}{worker_id}"
-                        task_json = self.redis_queue.redis_client.rpoplpush(self.main_queue, processing_queue)
-                    except Exception as e:
-                        self.logger.log(f"[TaskScheduler] Error assigning task to worker {worker_id}: {e}")
-                        task_json = None
-                    if not task_json:
-                        break  # Main queue empty or error occurred
-                    # Log the task assignment
-                    try:
-                        task_data = json.loads(task_json)
-                        task_id = task_data.get("id", "N/A")
-                    except Exception:
-                        task_id = "N/A"
-                    self.logger.log(f"[TaskScheduler] Task {task_id} moved from '{self.main_queue}' to worker {worker_id}")
+                lanes = self.lane_policy.allocate(depths, ages, len(idle_workers))
+                if lanes:
+                    self._dispatch({worker_id: {lane: 1} for worker_id, lane in zip(idle_workers, lanes)})
             time.sleep(1)
 
+    def _dispatch_available(self):
+        """
+        Move as many tasks from the priority lanes as there are free worker slots,
+        in one pipeline. The lane policy decides which lane fills each slot.
+        Returns the number of tasks dispatched.
+        """
+        free_slots = self.registry.get_free_slots()
+        if not free_slots:
+            return 0
+        depths, ages = self.lanes.snapshot()
+        queue_length = sum(depths)
+        if queue_length == 0:
+            return 0
+        lanes = self.lane_policy.allocate(depths, ages, min(queue_length, sum(free for _, free in free_slots)))
+
+        # Spread the picks over free slots, one task per slot per round
+        plan = {}
+        remaining = dict(free_slots)
+        picks = iter(lanes)
+        planned = 0
+        while planned < len(lanes) and remaining:
+            for worker_id in list(remaining):
+                if planned >= len(lanes):
+                    break
+                lane_counts = plan.setdefault(worker_id, {})
+                lane = next(picks)
+                lane_counts[lane] = lane_counts.get(lane, 0) + 1
+                planned += 1
+                remaining[worker_id] -= 1
+                if remaining[worker_id] == 0:
+                    del remaining[worker_id]
+        return self._dispatch(plan)
+
+    def _dispatch(self, plan):
+        """
+        Move tasks from the priority lanes per {worker_id: {lane: count}}, one atomic
+        dispatch script call per worker and lane, all in a single pipeline.
+        Returns tasks moved.
+        """
+        pipe = self.redis_queue.redis_client.pipeline(transaction=False)
+        calls = []
+        for worker_id, lane_counts in plan.items():
+            for lane, count in lane_counts.items():
+                self.redis_queue.scripts.dispatch(
+                    self.lanes.names[lane], f"{self.processing_prefix}{worker_id}", worker_id, count, client=pipe)
+                calls.append(worker_id)
+        try:
+            moved = {}
+            with DISPATCH_LATENCY.time(path="lanes"), redis_latency.time(op="dispatch"):
+                replies = pipe.execute()
+            for worker_id, count in zip(calls, replies):
+                moved[worker_id] = moved.get(worker_id, 0) + count
+        except Exception as e:
+            self.logger.log(f"[TaskScheduler] Error dispatching tasks: {e}")
+            return 0
+        total = sum(moved.values())
+        if total:
+            workers = sum(1 for count in moved.values() if count)
+            self.logger.log(f"[TaskScheduler] Dispatched {total} task(s) from '{self.main_queue}' lanes to {workers} worker(s)")
+        return total
+
+    def _wait_for_work(self, pubsub):
+        """
+        Block until there is likely something to dispatch: either a task arrives
+        on the main queue while a worker is free, or a worker reports a free slot.
+        """
+        free_slots = self.registry.get_free_slots()
+        if free_slots:
+            # Capacity exists but the lanes are empty: block server-side on the most urgent
+            # lane and hand the first arrival straight to the worker with the most free slots.
+            worker_id = max(free_slots, key=lambda w: w[1])[0]
+            task_json = self.lanes.pull(f"{self.processing_prefix}{worker_id}", self.block_timeout, self.lane_policy)
+            if task_json:
+                self.registry.adjust_load(worker_id, 1)
+                self.logger.log("[TaskScheduler] Task moved from '%s' to worker %s",
+                                self.main_queue, worker_id, category="task")
+        else:
+            # Every worker is busy: wait for one of them to free a slot
+            pubsub.get_message(timeout=self.block_timeout)
+        # Collapse any burst of notifications into a single dispatch pass
+        while pubsub.get_message(timeout=0):
+            pass
+
+    def dispatch_events(self):
+        """
+        Event-driven alternative to monitor_tasks: dispatch the backlog as soon as
+        capacity exists instead of one task per idle worker per second.
+        """
+        # The subscription holds a connection for good; take it from the blocking pool
+        pubsub = self.redis_queue.blocking_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.registry.idle_channel)
+        while True:
+            try:
+                self._promote_due()
+                if self._dispatch_available() == 0:
+                    self._wait_for_work(pubsub)
+            except Exception as e:
+                self.logger.log(f"[TaskScheduler] Error in event dispatch loop: {e}")
+                time.sleep(1)
+
+    def _promote_due(self):
+        """Move due delayed tasks to their queues, at most once per promote_interval."""
+        now = time.time()
+        if now - self._last_promote < self.promote_interval:
+            return 0
+        self._last_promote = now
+        try:
+            promoted = self.delayed.promote_due(now)
+        except Exception as e:
+            self.logger.log(f"[TaskScheduler] Error promoting delayed tasks: {e}")
+            return 0
+        if promoted:
+            self.logger.log(f"[TaskScheduler] Promoted {promoted} delayed task(s)")
+        return promoted
+
     def run(self):
         """Start the scheduler loop."""
-        self.logger.log("[TaskScheduler] Task scheduler started.")
-        self.monitor_tasks()
+        if Config.METRICS_PORT:
+            # Dispatch latency of queued work is only recorded in this process
+            try:
+                metrics.serve(Config.METRICS_PORT)
+                self.logger.log(f"[TaskScheduler] Serving metrics on port {Config.METRICS_PORT}")
+            except OSError as e:
+                self.logger.log(f"[TaskScheduler] Not serving metrics on port {Config.METRICS_PORT}: {e}",
+                                level="warning")
+        if self.queue_engine == "stream":
+            # Workers read the consumer group directly; only delayed tasks need us
+            self.logger.log("[TaskScheduler] Stream engine: promoting delayed tasks only.")
+            while True:
+                self._promote_due()
+                time.sleep(self.promote_interval)
+        self.logger.log(f"[TaskScheduler] Task scheduler started on shard {self.shard} ({self.dispatch_mode} dispatch).")
+        if self.dispatch_mode == "event":
+            self.dispatch_events()
+        else:
+            self.monitor_tasks()
 
 # 👇 Add this block to make it executable as a module
 if __name__ == "__main__":
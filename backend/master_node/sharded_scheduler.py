@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+from master_node.scheduler import TaskScheduler
+from utils.redis_client import shard_count, shard_index
+
+
+def shard_key(task):
+    """What a task is routed by: its routing_key if given (to keep related tasks together), else its id."""
+    return task.get("routing_key") or task.get("id")
+
+
+def create_scheduler():
+    """The scheduler a front end submits through: routed over REDIS_SHARDS, or a plain one for a single server."""
+    return ShardedScheduler() if shard_count() > 1 else TaskScheduler(shard=0)
+
+
+class ShardedScheduler:
+    """
+    Spreads submissions over the queue shards in REDIS_SHARDS. Each task goes to
+    the shard its shard_key() hashes to and is placed there by that shard's
+    TaskScheduler, so a task's queue, lease, retries and result all live on one
+    server and every transition stays a single-server transaction.
+
+    A batch is split by shard and the parts are written concurrently, one
+    pipeline per shard, so ingest throughput grows with the number of shards.
+    """
+    def __init__(self, schedulers=None):
+        self.schedulers = schedulers or [TaskScheduler(shard=index) for index in range(shard_count())]
+        self.queue_engine = self.schedulers[0].queue_engine
+        # Writes the parts of a batch that spans shards in parallel
+        self._executor = ThreadPoolExecutor(max_workers=len(self.schedulers))
+
+    def shard_for(self, task):
+        return shard_index(shard_key(task), len(self.schedulers))
+
+    def assign_task(self, task):
+        return self.schedulers[self.shard_for(task)].assign_task(task)
+
+    def already_submitted(self, tasks):
+        """Per task, whether its shard already knows it as submitted."""
+        tasks = list(tasks)
+        groups = {}  # shard -> indexes of its tasks
+        for index, task in enumerate(tasks):
+            groups.setdefault(self.shard_for(task), []).append(index)
+        seen = [False] * len(tasks)
+        for shard, indexes in groups.items():
+            for index, found in zip(indexes, self.schedulers[shard].already_submitted([tasks[i] for i in indexes])):
+                seen[index] = found
+        return seen
+
+    def assign_tasks(self, tasks):
+        """Assign a batch across the shards; returns one result per task, in submission order."""
+        tasks = list(tasks)
+        groups = {}  # shard -> indexes of its tasks, in submission order
+        for index, task in enumerate(tasks):
+            groups.setdefault(self.shard_for(task), []).append(index)
+
+        def write(shard):
+            return self.schedulers[shard].assign_tasks([tasks[index] for index in groups[shard]])
+
+        if len(groups) > 1:
+            written = dict(zip(groups, self._executor.map(write, groups)))
+        else:
+            written = {shard: write(shard) for shard in groups}
+
+        results = [None] * len(tasks)
+        for shard, indexes in groups.items():
+            for index, result in zip(indexes, written[shard]):
+                results[index] = result
+        return results
@@ -1,5 +1,7 @@
 import time
 from task_queue.redis_queue import RedisQueue
+from master_node.failure_handler import FailureHandler
+from utils.config import Config
 from utils.logger import Logger
 
 class TaskMonitor:
@@ -8,8 +10,10 @@ class TaskMonitor:
     If a task hasn't updated in a set period, it may indicate 
     a worker failure or task error.
     """
-    def __init__(self, check_interval=5):
-        self.redis_queue = RedisQueue()
+    def __init__(self, check_interval=5, shard=None):
+        # Leases live on the shard of their task; run one TaskMonitor per shard (SHARD)
+        self.redis_queue = RedisQueue(shard=Config.SHARD if shard is None else shard)
+        self.failure_handler = FailureHandler(self.redis_queue.redis_client)
         self.logger = Logger()
         self.check_interval = check_interval  # seconds
 
@@ -25,24 +29,23 @@ class TaskMonitor:
 
     def detect_stalled_tasks(self):
         """
-        Logic to check tasks in the queue that may have stalled.
-        For a real implementation, you might track 
-        'start_time' or 'last_update' in Redis or a database.
+        Requeue tasks whose lease expired: the worker holding them died or the
+        task outran LEASE_MAX_RUNTIME. Expired leases come from one range query on
+        the lease index, so no processing list is scanned. Returns the count requeued.
         """
-        # Example pseudocode:
-        # tasks = self.redis_queue.list_all_tasks()  # A helper method you’d create
-        # for task in tasks:
-        #     if is_stalled(task):
-        #         self.logger.log(f"Task {task['id']} seems stalled. Reassigning...")
-        #         self.reassign_task(task)
-        pass
+        try:
+            count = self.failure_handler.reclaim_stalled_tasks()
+        except Exception as e:
+            self.logger.log(f"Error reclaiming expired task leases: {e}")
+            return 0
+        if count:
+            self.logger.log(f"Requeued {count} stalled task(s) with expired leases.")
+        return count
 
     def reassign_task(self, task):
         """
-        Reassign the stalled task to another worker or 
-        mark for failure handling.
+        Reassign the stalled task to another worker by
+        putting it back at the front of its lane.
         """
-        # You might call a scheduling function here, or push back 
-        # into the queue with updated details.
-        self.redis_queue.add_task_to_queue(task)
+        self.failure_handler.reassign_task(task)
         self.logger.log(f"Task {task['id']} has been reassigned.")
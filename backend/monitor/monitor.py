@@ -3,56 +3,67 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 import time
-import json
-import redis
 from utils.logger import Logger
+from utils.redis_client import get_shard
+from utils.worker_registry import WorkerRegistry
+from task_queue.stream_queue import StreamQueue
+from master_node.failure_handler import FailureHandler
+from utils.config import Config
+from utils.metrics import metrics
 
 class Monitor:
-    def __init__(self, heartbeat_prefix="worker_status:", processing_prefix="processing:",
-                 main_queue="task_queue", timeout=10, check_interval=2):  # ↓ Reduced timeout & interval
-        self.redis = redis.StrictRedis(host="localhost", port=6379, db=0, decode_responses=True)
-        self.heartbeat_prefix = heartbeat_prefix
+    def __init__(self, processing_prefix="processing:",
+                 main_queue="task_queue", timeout=10, check_interval=2, shard=None):  # ↓ Reduced timeout & interval
+        # Each queue shard has its own monitor (SHARD); workers and tasks never span shards
+        self.shard = Config.SHARD if shard is None else shard
+        self.redis = get_shard(self.shard)
+        self.registry = WorkerRegistry(self.redis)
+        # Stream engine: dead workers' pending entries are requeued instead of their lists
+        self.stream_queue = StreamQueue(shard=self.shard) if Config.QUEUE_ENGINE == "stream" else None
         self.processing_prefix = processing_prefix
         self.main_queue = main_queue
+        # Recovers dead workers' queues and, on the list engine, tasks whose lease expired
+        self.failure_handler = FailureHandler(self.redis, main_queue, processing_prefix, self.stream_queue)
         self.timeout = timeout  # DEAD after 10 sec
         self.check_interval = check_interval  # check every 2 sec
         self.logger = Logger()
 
     def check_heartbeats(self):
-        keys = self.redis.keys(f"{self.heartbeat_prefix}*")
-        for key in keys:
-            try:
-                value = self.redis.get(key)
-                if not value:
-                    continue
-
-                heartbeat = json.loads(value)
-                last_time = heartbeat.get("last_heartbeat", 0)
-                worker_id = heartbeat.get("worker_id", "Unknown")
-                proc_queue = heartbeat.get("processing_queue", "unknown")
+        try:
+            # One range query on the heartbeat index instead of scanning every worker key
+            stale_workers = self.registry.get_stale_workers(self.timeout)
+        except Exception as e:
+            self.logger.log(f"[Monitor] ⚠️ Error reading worker registry: {e}")
+            return
+        for worker_id in stale_workers:
+            self.logger.log(f"[Monitor] ❌ Worker {worker_id} is inactive. Reassigning tasks...")
+        # A whole host going down is recovered in parallel, each queue in one atomic step
+        recovered = self.failure_handler.handle_worker_failures(stale_workers)
+        for worker_id, count in recovered.items():
+            if count is not None:
+                destination = (f"the tail of {self.stream_queue.stream_name}" if self.stream_queue
+                               else f"the front of {self.main_queue}")
+                self.logger.log(f"[Monitor] 🔁 Requeued {count} task(s) of {worker_id} to {destination}")
 
-                now = time.time()
-                if now - last_time > self.timeout:
-                    self.logger.log(f"[Monitor] ❌ Worker {worker_id} is inactive. Reassigning tasks...")
-                    self.requeue_tasks(proc_queue)
-                    self.redis.delete(key)
-            except Exception as e:
-                self.logger.log(f"[Monitor] ⚠️ Error processing {key}: {e}")
-
-    def requeue_tasks(self, processing_queue):
-        tasks = self.redis.lrange(processing_queue, 0, -1)
-        for task_json in tasks:
-            try:
-                self.redis.rpush(self.main_queue, task_json)
-                self.logger.log(f"[Monitor] 🔁 Requeued task from {processing_queue} to {self.main_queue}")
-            except Exception as e:
-                self.logger.log(f"[Monitor] ❌ Failed to requeue task: {e}")
-        self.redis.delete(processing_queue)
+    def check_leases(self):
+        try:
+            count = self.failure_handler.reclaim_stalled_tasks()
+            if count:
+                self.logger.log(f"[Monitor] 🔁 Requeued {count} stalled task(s) with expired leases")
+        except Exception as e:
+            self.logger.log(f"[Monitor] ⚠️ Error reclaiming expired leases: {e}")
 
     def run(self):
-        self.logger.log("[Monitor] Started monitoring for dead workers...")
+        self.logger.log(f"[Monitor] Started monitoring shard {self.shard} for dead workers...")
+        if Config.METRICS_PORT:
+            try:
+                metrics.serve(Config.METRICS_PORT)
+            except OSError as e:
+                self.logger.log(f"[Monitor] Not serving metrics on port {Config.METRICS_PORT}: {e}", level="warning")
         while True:
             self.check_heartbeats()
+            if not self.stream_queue:
+                self.check_leases()
             time.sleep(self.check_interval)
 
 
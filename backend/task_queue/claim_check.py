@@ -0,0 +1,154 @@
+import os
+import json
+import mmap
+import uuid
+from utils.config import Config
+from utils.redis_client import get_redis, get_shard
+
+
+class LocalBlobStore:
+    """
+    Stores payloads as files in a directory shared by the API and workers.
+    Reads are memory-mapped, so workers get a zero-copy memoryview.
+    """
+    name = "local"
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def put(self, data):
+        key = uuid.uuid4().hex
+        tmp_path = self._path(key + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        # Rename last so readers never see a partial blob
+        os.replace(tmp_path, self._path(key))
+        return key
+
+    def get(self, key):
+        with open(self._path(key), "rb") as f:
+            # The mapping outlives the file object; it is released with the memoryview
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class RedisBlobStore:
+    """Stores payloads as fields of one Redis hash, for deployments without a shared disk."""
+    name = "redis"
+
+    def __init__(self, redis_client, hash_key="task_blobs"):
+        self.redis = redis_client
+        self.hash_key = hash_key
+
+    def put(self, data):
+        key = uuid.uuid4().hex
+        # Blobs are UTF-8 text (str or JSON payloads), matching the decode_responses clients
+        self.redis.hset(self.hash_key, key, data.decode("utf-8"))
+        return key
+
+    def get(self, key):
+        value = self.redis.hget(self.hash_key, key)
+        if value is None:
+            raise KeyError(f"Blob {key} not found in '{self.hash_key}'")
+        return value.encode("utf-8")
+
+    def delete(self, key):
+        self.redis.hdel(self.hash_key, key)
+
+
+class ClaimCheck:
+    """
+    Moves large task payloads out of the queue. At enqueue, a payload of at least
+    `threshold` bytes goes to the blob store and the task keeps only a small
+    `payload_ref`. Workers fetch it lazily with load_payload()/open_payload().
+
+    With the Redis store and REDIS_SHARDS, a blob lives on its task's shard. The
+    writer records that shard in the reference, so a reader bound to any
+    server finds it.
+    """
+    def __init__(self, redis_client=None, store=None, threshold=None, shard=None):
+        self.threshold = threshold if threshold is not None else Config.CLAIM_CHECK_THRESHOLD
+        if store is None:
+            if Config.CLAIM_CHECK_STORE == "redis":
+                store = RedisBlobStore(redis_client or get_redis())
+            else:
+                store = LocalBlobStore(Config.CLAIM_CHECK_DIR)
+        self.store = store
+        # Queue shard that `store` writes to, if it is one of them
+        self.shard = shard
+        self._shard_stores = {}  # shard -> RedisBlobStore for references written elsewhere
+
+    def offload(self, task):
+        """Replace a large payload with a reference to the blob store (in place)."""
+        if not self.threshold or "payload" not in task:
+            return task
+        payload = task["payload"]
+        if isinstance(payload, str):
+            data, kind = payload.encode("utf-8"), "str"
+        else:
+            data, kind = json.dumps(payload).encode("utf-8"), "json"
+        if len(data) < self.threshold:
+            return task
+        key = self.store.put(data)
+        task["payload_ref"] = {"store": self.store.name, "key": key, "size": len(data), "type": kind}
+        if self.shard is not None and self.store.name == "redis":
+            task["payload_ref"]["shard"] = self.shard
+        del task["payload"]
+        return task
+
+    def open_payload(self, task):
+        """
+        Raw payload bytes without decoding: a zero-copy memoryview for the local
+        store, bytes otherwise. Inline payloads are returned UTF-8 encoded.
+        """
+        ref = task.get("payload_ref")
+        if ref is None:
+            payload = task.get("payload")
+            return payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload).encode("utf-8")
+        return self._store_for(ref).get(ref["key"])
+
+    def load_payload(self, task):
+        """Return the task payload, fetching and caching it on the task if it was offloaded."""
+        if "payload" in task or "payload_ref" not in task:
+            return task.get("payload")
+        raw = bytes(self.open_payload(task))
+        text = raw.decode("utf-8")
+        task["payload"] = text if task["payload_ref"]["type"] == "str" else json.loads(text)
+        return task["payload"]
+
+    def release(self, task):
+        """
+        Delete an offloaded payload once its task has completed, or was rejected
+        at submission. Dead-lettered tasks keep theirs on purpose: the entry in
+        tasks_failed stays inspectable and replayable, and whoever removes it
+        releases the blob.
+        """
+        ref = task.get("payload_ref")
+        if ref is not None:
+            self._store_for(ref).delete(ref["key"])
+
+    def _store_for(self, ref):
+        """The store holding a referenced blob: its shard's hash if the writer recorded one."""
+        shard = ref.get("shard")
+        if shard is None or ref.get("store") != "redis" or shard == self.shard:
+            return self.store
+        if shard not in self._shard_stores:
+            self._shard_stores[shard] = RedisBlobStore(get_shard(shard))
+        return self._shard_stores[shard]
+
+
+def payload_preview(task, default=""):
+    """Short stand-in for a task payload in status views, without fetching blobs."""
+    ref = task.get("payload_ref")
+    if ref is not None:
+        return f"[{ref.get('size', '?')} bytes in {ref.get('store', '?')} blob store]"
+    return task.get("payload", default)
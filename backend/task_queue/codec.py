@@ -0,0 +1,156 @@
+import json
+import base64
+from utils.config import Config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# First character of every encoded task -> (serializer, compression).
+# Plain JSON needs no extra header: '{' already identifies it, so entries written
+# before the codec existed (and by the json/orjson codecs today) decode unchanged.
+# Binary frames are base64 text because every Redis client uses decode_responses=True.
+HEADERS = {
+    "{": ("json", None),
+    "M": ("msgpack", None),
+    "j": ("json", "zstd"),
+    "k": ("json", "lz4"),
+    "m": ("msgpack", "zstd"),
+    "n": ("msgpack", "lz4"),
+}
+HEADER_FOR = {formats: header for header, formats in HEADERS.items()}
+
+
+class TaskCodec:
+    """
+    Encodes tasks for storage in Redis and decodes any supported format,
+    so queues holding a mix of codecs (e.g. during a rolling upgrade) still work.
+
+    serializer:  "json" (stdlib), "orjson" (same JSON, faster) or "msgpack"
+    compression: None, "zstd" or "lz4"; applied only above `compress_threshold` bytes
+    """
+    def __init__(self, serializer=None, compression=None, compress_threshold=None):
+        self.serializer = serializer or Config.TASK_CODEC
+        self.compression = compression if compression is not None else Config.TASK_COMPRESSION
+        if self.compression == "none":
+            self.compression = None
+        self.compress_threshold = (compress_threshold if compress_threshold is not None
+                                   else Config.TASK_COMPRESS_THRESHOLD)
+        if self.serializer not in ("json", "orjson", "msgpack"):
+            raise ValueError(f"Unknown task serializer: {self.serializer}")
+        if self.compression not in (None, "zstd", "lz4"):
+            raise ValueError(f"Unknown task compression: {self.compression}")
+        _require(self.serializer)
+        if self.compression:
+            _require(self.compression)
+        self._zstd_compressor = zstandard.ZstdCompressor() if self.compression == "zstd" else None
+
+    def encode(self, task):
+        """Return the stored (text) form of a task."""
+        if self.serializer == "msgpack":
+            raw, family = msgpack.packb(task, use_bin_type=True), "msgpack"
+        elif self.serializer == "orjson":
+            raw, family = orjson.dumps(task), "json"
+        else:
+            raw, family = None, "json"
+
+        if self.compression:
+            if raw is None:
+                raw = json.dumps(task).encode("utf-8")
+            if len(raw) >= self.compress_threshold:
+                return HEADER_FOR[(family, self.compression)] + _b64encode(self._compress(raw))
+
+        if family == "msgpack":
+            return HEADER_FOR[("msgpack", None)] + _b64encode(raw)
+        return json.dumps(task) if raw is None else raw.decode("utf-8")
+
+    def decode(self, data):
+        """Decode a task written by any TaskCodec configuration (or plain json.dumps)."""
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        if not data:
+            raise ValueError("Empty task data")
+        header = data[0]
+        if header not in HEADERS:
+            raise ValueError(f"Unknown task encoding header: {header!r}")
+        serializer, compression = HEADERS[header]
+        if serializer == "json" and compression is None:
+            return _loads_json(data)
+
+        if compression:
+            _require(compression)
+        if serializer == "msgpack":
+            _require("msgpack")
+        try:
+            raw = base64.b64decode(data[1:])
+            if compression:
+                raw = _decompress(compression, raw)
+            if serializer == "msgpack":
+                return msgpack.unpackb(raw, raw=False)
+            return _loads_json(raw)
+        except Exception as e:
+            # Surface every corrupt-frame error the same way json.loads would
+            raise ValueError(f"Could not decode {header!r} task frame: {e}") from e
+
+    def _compress(self, raw):
+        if self.compression == "zstd":
+            return self._zstd_compressor.compress(raw)
+        return lz4_frame.compress(raw)
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _loads_json(data):
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN written by the stdlib encoder
+    return json.loads(data)
+
+
+def _decompress(compression, raw):
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(raw)
+    return lz4_frame.decompress(raw)
+
+
+def _require(name):
+    modules = {"json": json, "orjson": orjson, "msgpack": msgpack, "zstd": zstandard, "lz4": lz4_frame}
+    if modules[name] is None:
+        packages = {"zstd": "zstandard", "lz4": "lz4"}
+        raise RuntimeError(f"Task codec '{name}' needs the '{packages.get(name, name)}' package installed")
+
+
+# Process-wide codec built from Config; modules share it instead of building their own
+default_codec = None
+
+
+def get_codec():
+    global default_codec
+    if default_codec is None:
+        default_codec = TaskCodec()
+    return default_codec
+
+
+def encode_task(task):
+    return get_codec().encode(task)
+
+
+def decode_task(data):
+    return get_codec().decode(data)
@@ -0,0 +1,106 @@
+import math
+import time
+from datetime import datetime, timezone
+from utils.config import Config
+from task_queue.lua_scripts import TaskScripts
+
+
+def _finite(value):
+    """`value` as a float, or None if it is NaN, infinite or too large for one."""
+    try:
+        value = float(value)
+    except OverflowError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def parse_due_time(task, now=None):
+    """
+    Epoch seconds at which a task should run, from its `eta` (epoch seconds or
+    ISO-8601; naive times are UTC) or `countdown` (seconds from now). Returns
+    None for tasks that can run immediately. Raises ValueError if either field is invalid.
+    """
+    now = time.time() if now is None else now
+    eta, countdown = task.get("eta"), task.get("countdown")
+    if eta is not None and countdown is not None:
+        raise ValueError("Use either 'eta' or 'countdown', not both")
+    if countdown is not None:
+        if isinstance(countdown, bool) or not isinstance(countdown, (int, float)):
+            raise ValueError("'countdown' must be a non-negative number of seconds")
+        # JSON bodies may carry NaN and Infinity, which would run the task at once or never
+        countdown = _finite(countdown)
+        if countdown is None or countdown < 0:
+            raise ValueError("'countdown' must be a non-negative number of seconds")
+        due = now + countdown
+    elif eta is not None:
+        if isinstance(eta, bool):
+            raise ValueError("'eta' must be epoch seconds or an ISO-8601 timestamp")
+        if isinstance(eta, (int, float)):
+            due = _finite(eta)
+            if due is None:
+                raise ValueError("'eta' must be epoch seconds or an ISO-8601 timestamp")
+        elif isinstance(eta, str):
+            try:
+                parsed = datetime.fromisoformat(eta)
+            except ValueError:
+                raise ValueError(f"'eta' is not an ISO-8601 timestamp: {eta!r}")
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            due = parsed.timestamp()
+        else:
+            raise ValueError("'eta' must be epoch seconds or an ISO-8601 timestamp")
+    else:
+        return None
+    return due if due > now else None
+
+
+class DelayedTasks:
+    """
+    Parks tasks until they are due in sorted sets scored by due time, one per
+    target queue (`<queue>:delayed`). That keeps the priority lane without
+    decoding tasks at promotion. Parking is one ZADD (O(log n)). A promotion
+    tick moves the due tasks with one atomic range pop per queue (O(log n + k)).
+    """
+    def __init__(self, redis_client, targets, stream=False, batch_size=None):
+        self.redis = redis_client
+        self.targets = list(targets)
+        self.keys = [f"{target}:delayed" for target in self.targets]
+        self.stream = stream
+        self.batch_size = batch_size or Config.DELAYED_PROMOTE_BATCH
+        self.scripts = TaskScripts(redis_client)
+
+    def key_for(self, target):
+        return self.keys[self.targets.index(target)]
+
+    def park(self, target, task_json, due, pipe=None):
+        """Hold an encoded task for `target` until `due` (epoch seconds)."""
+        self.park_many(target, {task_json: due}, pipe=pipe)
+
+    def park_many(self, target, members, pipe=None):
+        """Park {encoded task: due time} for `target` with one ZADD."""
+        (pipe or self.redis).zadd(self.key_for(target), members)
+
+    def promote_due(self, now=None):
+        """
+        Move every task due by `now` to its target queue, in chunks of `batch_size`
+        per queue, so each script call stays short. Returns the number promoted.
+        """
+        now = time.time() if now is None else now
+        total = 0
+        pending = list(zip(self.keys, self.targets))
+        while pending:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, target in pending:
+                self.scripts.promote(key, target, now, self.batch_size, self.stream, client=pipe)
+            moved = pipe.execute()
+            total += sum(moved)
+            # Queues that filled a whole chunk may have more due tasks
+            pending = [item for item, count in zip(pending, moved) if count >= self.batch_size]
+        return total
+
+    def depths(self):
+        """Number of parked tasks per target queue."""
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.keys:
+            pipe.zcard(key)
+        return dict(zip(self.targets, pipe.execute()))
@@ -0,0 +1,151 @@
+import time
+import hashlib
+from utils.config import Config
+from utils.logger import Logger
+from utils.redis_client import execute_chunked
+from task_queue.codec import encode_task, decode_task
+
+# KEYS: idempotency key. ARGV: placeholder record, ttl.
+# Claims the key, or returns the stored acceptance and slides its expiry.
+CLAIM_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    return false
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return redis.call('GET', KEYS[1])
+"""
+
+# KEYS: current filter, previous filter. ARGV: expiry, bit positions...
+# Returns 1 if every bit was already set in either filter, then sets them in the current one.
+BLOOM_SCRIPT = """
+local function seen(key)
+    for i = 2, #ARGV do
+        if redis.call('GETBIT', key, ARGV[i]) == 0 then
+            return false
+        end
+    end
+    return true
+end
+local duplicate = seen(KEYS[1]) or seen(KEYS[2])
+for i = 2, #ARGV do
+    redis.call('SETBIT', KEYS[1], ARGV[i], 1)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return duplicate and 1 or 0
+"""
+
+
+class IdempotencyGuard:
+    """
+    Rejects re-submissions of the same task within a sliding TTL window.
+    The key is the task's `idempotency_key`, or its `id` when that is absent.
+
+    exact: SET NX per key, storing the original acceptance so duplicates get it back.
+    bloom: a memory-bounded Bloom filter (two rotating bitmaps per TTL window).
+           Duplicates get a generic acceptance. A false positive (rate set by
+           IDEMPOTENCY_BLOOM_BITS/HASHES) drops a genuinely new task.
+    off:   no checks.
+
+    Redis errors fail open: the task is accepted rather than lost.
+    """
+    def __init__(self, redis_client, mode=None, ttl=None, prefix="idempotency:"):
+        self.redis = redis_client
+        self.mode = mode or Config.IDEMPOTENCY_MODE
+        if self.mode not in ("exact", "bloom", "off"):
+            raise ValueError(f"Unknown idempotency mode: {self.mode}")
+        self.ttl = ttl or Config.IDEMPOTENCY_TTL
+        self.prefix = prefix
+        self.bloom_bits = Config.IDEMPOTENCY_BLOOM_BITS
+        self.bloom_hashes = Config.IDEMPOTENCY_BLOOM_HASHES
+        self.logger = Logger()
+        self._claim = redis_client.register_script(CLAIM_SCRIPT)
+        self._bloom = redis_client.register_script(BLOOM_SCRIPT)
+
+    def key_for(self, task):
+        return str(task.get("idempotency_key") or task.get("id"))
+
+    def claim_many(self, tasks):
+        """
+        Claim each task's key, pipelined. Returns, per task, None if it is new or
+        the original acceptance (marked "duplicate") if it was already submitted.
+        """
+        if self.mode == "off" or not tasks:
+            return [None] * len(tasks)
+        try:
+            if self.mode == "exact":
+                def claim(pipe, task):
+                    placeholder = encode_task({"id": task.get("id"), "status": "accepted", "accepted_at": time.time()})
+                    self._claim(keys=[self.prefix + self.key_for(task)], args=[placeholder, self.ttl], client=pipe)
+                return [None if stored is None else dict(decode_task(stored), duplicate=True)
+                        for stored in execute_chunked(self.redis, tasks, claim)]
+            window = int(time.time() // self.ttl)
+            current, previous = f"{self.prefix}bloom:{window}", f"{self.prefix}bloom:{window - 1}"
+
+            def check(pipe, task):
+                positions = self._bit_positions(self.key_for(task))
+                self._bloom(keys=[current, previous], args=[2 * self.ttl] + positions, client=pipe)
+            return [{"id": task.get("id"), "status": "accepted", "duplicate": True} if seen else None
+                    for task, seen in zip(tasks, execute_chunked(self.redis, tasks, check))]
+        except Exception as e:
+            self.logger.log(f"[Idempotency] Check failed, accepting without deduplication: {e}")
+            return [None] * len(tasks)
+
+    def seen_many(self, tasks):
+        """
+        Per task, whether its key was already submitted, without claiming it.
+        Lets the API skip admission charges for retries that will only get their
+        original acceptance back. Errors count as not seen.
+        """
+        if self.mode == "off" or not tasks:
+            return [False] * len(tasks)
+        try:
+            if self.mode == "exact":
+                return [bool(found) for found in execute_chunked(
+                    self.redis, tasks, lambda pipe, task: pipe.exists(self.prefix + self.key_for(task)))]
+            window = int(time.time() // self.ttl)
+            filters = (f"{self.prefix}bloom:{window}", f"{self.prefix}bloom:{window - 1}")
+
+            def check(pipe, task):
+                for key in filters:
+                    for position in self._bit_positions(self.key_for(task)):
+                        pipe.getbit(key, position)
+            bits = execute_chunked(self.redis, tasks, check)
+            per_filter = self.bloom_hashes
+            return [any(all(bits[start:start + per_filter]) for start in (base, base + per_filter))
+                    for base in range(0, len(bits), 2 * per_filter)]
+        except Exception as e:
+            self.logger.log(f"[Idempotency] Lookup failed, treating submissions as new: {e}")
+            return [False] * len(tasks)
+
+    def claim(self, task):
+        claimed = self.claim_many([task])
+        return claimed[0] if claimed else None
+
+    def settle_many(self, tasks, results):
+        """
+        Record how claimed submissions ended: accepted ones store their result for
+        later duplicates, rejected ones free the key so the producer can retry.
+        """
+        if self.mode != "exact" or not tasks:
+            return
+        try:
+            def record(pipe, outcome):
+                task, result = outcome
+                key = self.prefix + self.key_for(task)
+                if result.get("status") == "accepted":
+                    pipe.set(key, encode_task(result), xx=True, keepttl=True)
+                else:
+                    pipe.delete(key)
+            execute_chunked(self.redis, zip(tasks, results), record)
+        except Exception as e:
+            self.logger.log(f"[Idempotency] Failed to record submission outcome: {e}")
+
+    def settle(self, task, result):
+        self.settle_many([task], [result])
+
+    def _bit_positions(self, key):
+        # Kirsch-Mitzenmacher double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.bloom_bits for i in range(self.bloom_hashes)]
@@ -0,0 +1,176 @@
+# KEYS: processing queue, load hash. ARGV: raw task, worker id ('' to skip load bookkeeping)
+ACK_SCRIPT = """
+local removed = redis.call('LREM', KEYS[1], 1, ARGV[1])
+if removed > 0 and ARGV[2] ~= '' then
+    redis.call('HINCRBY', KEYS[2], ARGV[2], -1)
+end
+return removed
+"""
+
+# KEYS: processing queue, failed queue, load hash. ARGV: raw task as stored, task to record, worker id
+FAIL_SCRIPT = """
+local removed = redis.call('LREM', KEYS[1], 1, ARGV[1])
+if removed > 0 then
+    redis.call('LPUSH', KEYS[2], ARGV[2])
+    if ARGV[3] ~= '' then
+        redis.call('HINCRBY', KEYS[3], ARGV[3], -1)
+    end
+end
+return removed
+"""
+
+# KEYS: processing queue, main queue. Moves every task, in order, to the front of the
+# main queue (they were dispatched before anything still waiting) and deletes the list.
+REQUEUE_ALL_SCRIPT = """
+local tasks = redis.call('LRANGE', KEYS[1], 0, -1)
+local reversed = {}
+for i = #tasks, 1, -1 do
+    reversed[#reversed + 1] = tasks[i]
+end
+for i = 1, #reversed, 1000 do
+    redis.call('LPUSH', KEYS[2], unpack(reversed, i, math.min(i + 999, #reversed)))
+end
+redis.call('DEL', KEYS[1])
+return #tasks
+"""
+
+# KEYS: main queue, processing queue, load hash. ARGV: max tasks to move, worker id
+DISPATCH_SCRIPT = """
+local moved = 0
+for i = 1, tonumber(ARGV[1]) do
+    if not redis.call('LMOVE', KEYS[1], KEYS[2], 'LEFT', 'RIGHT') then
+        break
+    end
+    moved = moved + 1
+end
+if moved > 0 then
+    redis.call('HINCRBY', KEYS[3], ARGV[2], moved)
+end
+return moved
+"""
+
+# KEYS: processing queue, then priority lanes in the order to try them. Moves one task.
+PULL_SCRIPT = """
+for i = 2, #KEYS do
+    local task = redis.call('LMOVE', KEYS[i], KEYS[1], 'LEFT', 'RIGHT')
+    if task then
+        return task
+    end
+end
+return false
+"""
+
+# KEYS: delayed set, target queue. ARGV: now, max tasks, '1' if the target is a stream
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for i = 1, #due, 1000 do
+    local last = math.min(i + 999, #due)
+    if ARGV[3] == '1' then
+        for j = i, last do
+            redis.call('XADD', KEYS[2], '*', 'task', due[j])
+        end
+    else
+        redis.call('RPUSH', KEYS[2], unpack(due, i, last))
+    end
+    redis.call('ZREM', KEYS[1], unpack(due, i, last))
+end
+return #due
+"""
+
+# KEYS: processing queue, delayed set, load hash. ARGV: raw task as stored, next attempt, due time, worker id
+RETRY_SCRIPT = """
+local removed = redis.call('LREM', KEYS[1], 1, ARGV[1])
+if removed > 0 then
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+    if ARGV[4] ~= '' then
+        redis.call('HINCRBY', KEYS[3], ARGV[4], -1)
+    end
+end
+return removed
+"""
+
+# KEYS: lease deadlines, lease records, load hash. ARGV: now, max leases to reclaim.
+# Each record holds the processing queue, lane, worker and raw task. Returns {expired, requeued}.
+RECLAIM_SCRIPT = """
+-- Least overdue first, within this chunk and across chunks (the caller repeats until a short
+-- chunk): each LPUSH lands in front of the last, so the longest-overdue task ends up at the head
+local expired = redis.call('ZREVRANGEBYSCORE', KEYS[1], ARGV[1], '-inf', 'LIMIT', 0, tonumber(ARGV[2]))
+local requeued = 0
+for i = 1, #expired do
+    local member = expired[i]
+    local record = redis.call('HGET', KEYS[2], member)
+    if record then
+        local lease = cjson.decode(record)
+        if redis.call('LREM', lease.queue, 1, lease.task) > 0 then
+            redis.call('LPUSH', lease.lane, lease.task)
+            redis.call('HINCRBY', KEYS[3], lease.worker, -1)
+            requeued = requeued + 1
+        end
+        redis.call('HDEL', KEYS[2], member)
+    end
+    redis.call('ZREM', KEYS[1], member)
+end
+return {#expired, requeued}
+"""
+
+
+class TaskScripts:
+    """
+    Server-side Lua scripts for task state transitions, bound to one client.
+    Each transition is a single atomic EVALSHA round trip, so a crash between
+    steps can neither duplicate nor lose a task. register_script issues
+    SCRIPT LOAD once and reloads transparently after a NOSCRIPT error.
+    """
+    def __init__(self, redis_client, load_key="workers:load"):
+        self.load_key = load_key
+        self._ack = redis_client.register_script(ACK_SCRIPT)
+        self._fail = redis_client.register_script(FAIL_SCRIPT)
+        self._requeue_all = redis_client.register_script(REQUEUE_ALL_SCRIPT)
+        self._dispatch = redis_client.register_script(DISPATCH_SCRIPT)
+        self._pull = redis_client.register_script(PULL_SCRIPT)
+        self._promote = redis_client.register_script(PROMOTE_SCRIPT)
+        self._retry = redis_client.register_script(RETRY_SCRIPT)
+        self._reclaim = redis_client.register_script(RECLAIM_SCRIPT)
+
+    def ack(self, processing_queue, task_json, worker_id="", client=None):
+        """Remove a finished task from its processing queue. Returns 1 if it was there."""
+        return self._ack(keys=[processing_queue, self.load_key], args=[task_json, worker_id], client=client)
+
+    def fail(self, processing_queue, failed_queue, task_json, worker_id="", failed_json=None, client=None):
+        """
+        Move a task from its processing queue to the failed queue. `failed_json` lets the
+        caller record an annotated copy; by default the stored task is moved as-is.
+        """
+        return self._fail(
+            keys=[processing_queue, failed_queue, self.load_key],
+            args=[task_json, failed_json or task_json, worker_id],
+            client=client,
+        )
+
+    def requeue_all(self, processing_queue, main_queue, client=None):
+        """Move a worker's whole processing queue to the front of the main queue. Returns the count."""
+        return self._requeue_all(keys=[processing_queue, main_queue], client=client)
+
+    def dispatch(self, main_queue, processing_queue, worker_id, count, client=None):
+        """Move up to `count` tasks from the main queue to a worker. Returns how many moved."""
+        return self._dispatch(keys=[main_queue, processing_queue, self.load_key], args=[count, worker_id], client=client)
+
+    def pull(self, processing_queue, lanes, client=None):
+        """Move the head of the first non-empty lane to a worker. Returns the raw task or None."""
+        return self._pull(keys=[processing_queue] + list(lanes), client=client)
+
+    def promote(self, delayed_set, target, now, count, stream=False, client=None):
+        """Move up to `count` tasks due by `now` from a delayed set to its queue. Returns the count."""
+        return self._promote(keys=[delayed_set, target], args=[now, count, "1" if stream else "0"], client=client)
+
+    def retry(self, processing_queue, delayed_set, task_json, retry_json, due, worker_id="", client=None):
+        """Move a failed task out of its processing queue and park its next attempt until `due`."""
+        return self._retry(
+            keys=[processing_queue, delayed_set, self.load_key],
+            args=[task_json, retry_json, due, worker_id],
+            client=client,
+        )
+
+    def reclaim(self, lease_set, lease_records, now, count, client=None):
+        """Requeue up to `count` tasks whose leases expired by `now`. Returns [expired, requeued]."""
+        return self._reclaim(keys=[lease_set, lease_records, self.load_key], args=[now, count], client=client)
@@ -0,0 +1,173 @@
+import time
+import redis
+from utils.config import Config
+from task_queue.lua_scripts import TaskScripts
+from task_queue.codec import decode_task
+
+
+class PriorityLanes:
+    """
+    One FIFO list per priority level; higher levels are more urgent. Level 0
+    is the original `task_queue` list, so producers, workers and tools that
+    know nothing about priorities keep working. Level p > 0 lives in
+    `task_queue:<p>`.
+    """
+    def __init__(self, redis_client, main_queue="task_queue", levels=None, blocking_client=None):
+        self.redis = redis_client
+        # Client for the blocking fetch in pull(), ideally on the blocking pool
+        self.blocking = blocking_client or redis_client
+        self.levels = max(1, levels or Config.PRIORITY_LEVELS)
+        self.names = [main_queue] + [f"{main_queue}:{p}" for p in range(1, self.levels)]
+        self.scripts = TaskScripts(redis_client)
+        self._snapshot = None
+        self._snapshot_time = 0
+
+    def priority_of(self, task):
+        """A task's lane index. Missing or invalid priorities fall into lane 0."""
+        try:
+            priority = int(task.get("priority", 0))
+        except (TypeError, ValueError):
+            return 0
+        return min(max(priority, 0), self.levels - 1)
+
+    def name_for(self, task):
+        return self.names[self.priority_of(task)]
+
+    def snapshot(self):
+        """
+        Depth of each lane and the age in seconds of its oldest task (None when
+        empty), read in one pipeline. Used for dispatch and starvation checks.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for name in self.names:
+            pipe.llen(name)
+            pipe.lindex(name, 0)
+        replies = pipe.execute()
+        now = time.time()
+        depths, ages = [], []
+        for depth, head in zip(replies[::2], replies[1::2]):
+            depths.append(depth)
+            age = None
+            if head:
+                try:
+                    head_task = decode_task(head)
+                    # Delayed tasks only start waiting once they are due
+                    age = now - float(head_task.get("due_timestamp", head_task.get("submit_timestamp", now)))
+                except (TypeError, ValueError, AttributeError):
+                    pass
+            ages.append(age)
+        return depths, ages
+
+    def serve_order(self, policy):
+        """
+        Lane indices in the order a single pull should try them: the policy's pick
+        first, then the rest from most to least urgent. The snapshot behind the pick
+        is refreshed at most once a second.
+        """
+        now = time.time()
+        if self._snapshot is None or now - self._snapshot_time >= 1:
+            self._snapshot = self.snapshot()
+            self._snapshot_time = now
+        depths, ages = self._snapshot
+        picks = policy.allocate(depths, ages, 1) or [self.levels - 1]
+        return picks + [p for p in reversed(range(self.levels)) if p != picks[0]]
+
+    def pull(self, processing_queue, timeout=1, policy=None):
+        """
+        Move one task into `processing_queue` and return its raw form, or None
+        after `timeout` seconds. The lanes are swept in one script call. When all
+        are empty, we block server-side on the most urgent lane, so urgent arrivals
+        start at once. Lower lanes are picked up by the next sweep.
+        """
+        if self.levels == 1:
+            return self.blocking.blmove(self.names[0], processing_queue, timeout, "LEFT", "RIGHT")
+        order = self.serve_order(policy) if policy else list(reversed(range(self.levels)))
+        task_json = self.scripts.pull(processing_queue, [self.names[p] for p in order])
+        if task_json:
+            return task_json
+        return self.blocking.blmove(self.names[-1], processing_queue, timeout, "LEFT", "RIGHT")
+
+    def requeue(self, processing_queue):
+        """
+        Move a processing queue's tasks back to the front of their lanes, keeping
+        their order, and delete it atomically. Returns the count.
+        """
+        if self.levels == 1:
+            return self.scripts.requeue_all(processing_queue, self.names[0])
+        # Lua cannot decode every codec, so read the tasks here and commit only if the list is unchanged
+        with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(processing_queue)
+                    tasks = pipe.lrange(processing_queue, 0, -1)
+                    by_lane = {}
+                    for task_json in tasks:
+                        try:
+                            lane = self.name_for(decode_task(task_json))
+                        except (TypeError, ValueError):
+                            lane = self.names[0]
+                        by_lane.setdefault(lane, []).append(task_json)
+                    pipe.multi()
+                    for lane, lane_tasks in by_lane.items():
+                        pipe.lpush(lane, *reversed(lane_tasks))
+                    pipe.delete(processing_queue)
+                    pipe.execute()
+                    return len(tasks)
+                except redis.WatchError:
+                    continue
+
+
+class LanePolicy:
+    """
+    Decides which lanes free worker slots are filled from.
+
+    strict:   always the most urgent non-empty lane
+    weighted: smooth weighted round-robin over non-empty lanes, so each lane
+              gets a share of slots proportional to its weight
+
+    Starvation protection: a lane whose oldest task has waited `max_wait` seconds
+    gets the first slot of every allocation until its head is younger again.
+    """
+    def __init__(self, levels, policy=None, weights=None, max_wait=None):
+        self.levels = levels
+        self.policy = policy or Config.PRIORITY_POLICY
+        if self.policy not in ("strict", "weighted"):
+            raise ValueError(f"Unknown priority policy: {self.policy}")
+        if weights is None:
+            weights = [int(w) for w in Config.PRIORITY_WEIGHTS.split(",") if w.strip()]
+        # Default: each level is four times as urgent as the one below it
+        self.weights = (list(weights) + [4 ** p for p in range(levels)][len(weights):])[:levels]
+        self.max_wait = max_wait if max_wait is not None else Config.PRIORITY_MAX_WAIT
+        self._credit = [0] * levels
+
+    def allocate(self, depths, ages, slots):
+        """Return up to `slots` lane indices, one per slot, never more than a lane's depth."""
+        remaining = list(depths)
+        picks = []
+        if self.max_wait:
+            starving = [p for p in range(self.levels)
+                        if remaining[p] > 0 and ages[p] is not None and ages[p] >= self.max_wait]
+            for p in sorted(starving, reverse=True)[:slots]:
+                picks.append(p)
+                remaining[p] -= 1
+        while len(picks) < slots:
+            lane = self._next_lane(remaining)
+            if lane is None:
+                break
+            picks.append(lane)
+            remaining[lane] -= 1
+        return picks
+
+    def _next_lane(self, remaining):
+        candidates = [p for p in range(self.levels) if remaining[p] > 0]
+        if not candidates:
+            return None
+        if self.policy == "strict":
+            return candidates[-1]
+        # Smooth weighted round-robin: interleaves lanes instead of serving them in bursts
+        total = sum(self.weights[p] for p in candidates)
+        for p in candidates:
+            self._credit[p] += self.weights[p]
+        lane = max(candidates, key=lambda p: (self._credit[p], p))
+        self._credit[lane] -= total
+        return lane
@@ -19,17 +19,17 @@ class RabbitMQQueue:
                 delivery_mode=2,  # Make the message persistent
             )
         )
-        self.logger.log(f"Task {task['id']} added to RabbitMQ queue.")
+        self.logger.log("Task %s added to RabbitMQ queue.", task['id'], category="task")
 
     def get_task_from_queue(self):
         """Get a task from the RabbitMQ queue"""
         method_frame, header_frame, body = self.channel.basic_get(queue='task_queue', auto_ack=True)
         if body:
             task = json.loads(body)
-            self.logger.log(f"Task {task['id']} retrieved from RabbitMQ queue.")
+            self.logger.log("Task %s retrieved from RabbitMQ queue.", task['id'], category="task")
             return task
         return None
 
     def remove_task_from_queue(self, task):
         """RabbitMQ is a message broker, so tasks are automatically removed after processing"""
-        self.logger.log(f"Task {task['id']} processed and removed from queue.")
+        self.logger.log("Task %s processed and removed from queue.", task['id'], category="task")
@@ -1,47 +1,85 @@
 import redis
-import json
 import time
 from utils.logger import Logger
+from utils.redis_client import get_redis, get_shard
+from task_queue.lua_scripts import TaskScripts
+from task_queue.codec import encode_task, decode_task
+from task_queue.priority_lanes import PriorityLanes, LanePolicy
 
 class RedisQueue:
-    def __init__(self, host='localhost', port=6379):
-        # Decode responses to handle Python strings directly
-        self.redis_client = redis.StrictRedis(host=host, port=port, db=0, decode_responses=True)
+    def __init__(self, host=None, port=None, shard=None):
+        # Shared pool from Config; host/port only to reach another server, shard for one of REDIS_SHARDS
+        self.redis_client = get_shard(shard) if shard is not None else get_redis(host, port)
+        # Blocking fetches wait on their own pool
+        self.blocking_client = (get_shard(shard, blocking=True) if shard is not None
+                                else get_redis(host, port, blocking=True))
+        self.shard = shard or 0
         self.logger = Logger()
         self.main_queue_name = "task_queue"
         self.failed_queue_name = "tasks_failed"
+        self.scripts = TaskScripts(self.redis_client)
+        # task_queue is lane 0; more urgent tasks wait in task_queue:<priority>
+        self.lanes = PriorityLanes(self.redis_client, self.main_queue_name, blocking_client=self.blocking_client)
+        self.lane_policy = LanePolicy(self.lanes.levels)
 
     def add_task_to_queue(self, task):
-        """Add a task to the main Redis queue."""
+        """
+        Add a task to the main Redis queue lane for its priority. Returns the lane,
+        or None if the task could not be serialized or written.
+        """
         task['submit_timestamp'] = time.time()
         try:
-            task_json = json.dumps(task)
-            self.redis_client.rpush(self.main_queue_name, task_json)
-            self.logger.log(f"Task {task.get('id', 'N/A')} added to queue '{self.main_queue_name}'.")
+            task_json = encode_task(task)
+            lane = self.lanes.name_for(task)
+            self.redis_client.rpush(lane, task_json)
+            self.logger.log("Task %s added to queue '%s'.", task.get('id', 'N/A'), lane, category="task")
+            return lane
         except TypeError as e:
             self.logger.log(f"Error serializing task: {e} - Task: {task}")
         except redis.RedisError as e:
             self.logger.log(f"Redis error adding task: {e}")
+        return None
 
     def get_task_reliably(self, worker_processing_queue, timeout=5):
         """Atomically move a task from the main queue to a worker's processing queue."""
         try:
-            task_json = self.redis_client.brpoplpush(self.main_queue_name, worker_processing_queue, timeout=timeout)
+            task_json = self.blocking_client.brpoplpush(self.main_queue_name, worker_processing_queue, timeout=timeout)
             if task_json:
-                task_data = json.loads(task_json)
+                task_data = decode_task(task_json)
                 # Mark when processing started (not modifying the stored queue item)
                 task_data['processing_start_timestamp'] = time.time()
                 # Keep original JSON for accurate removal later
                 task_data['_raw'] = task_json
-                self.logger.log(f"Task {task_data.get('id', 'N/A')} moved from '{self.main_queue_name}' to '{worker_processing_queue}'.")
+                self.logger.log("Task %s moved from '%s' to '%s'.",
+                                task_data.get('id', 'N/A'), self.main_queue_name, worker_processing_queue, category="task")
                 return task_data
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             self.logger.log(f"Error decoding task JSON from '{worker_processing_queue}': {e} - Data: {task_json}")
             # If task_json is corrupted, it remains in the processing queue for manual handling
         except redis.RedisError as e:
             self.logger.log(f"Redis error in get_task_reliably: {e}")
         return None  # None if no task moved or on error
 
+    def backlog(self):
+        """Tasks waiting in the priority lanes, i.e. not yet taken by any worker."""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for lane in self.lanes.names:
+            pipe.llen(lane)
+        return sum(pipe.execute())
+
+    def pull_task(self, worker_processing_queue, timeout=1):
+        """
+        Block server-side until a priority lane has a task, then atomically move the
+        oldest one of the lane picked by the lane policy to the tail of the worker's
+        processing queue. Returns the raw task JSON, or None if nothing arrived
+        within `timeout` seconds.
+        """
+        try:
+            return self.lanes.pull(worker_processing_queue, timeout, self.lane_policy)
+        except redis.RedisError as e:
+            self.logger.log(f"Redis error in pull_task: {e}")
+        return None
+
     def confirm_task_completion(self, worker_processing_queue, task):
         """Remove a processed task from the worker's processing queue."""
         try:
@@ -53,12 +91,13 @@ class RedisQueue:
                 if isinstance(task_obj, dict) and 'processing_start_timestamp' in task_obj:
                     temp_obj = dict(task_obj)
                     temp_obj.pop('processing_start_timestamp', None)
-                    task_json = json.dumps(temp_obj)
+                    task_json = encode_task(temp_obj)
                 else:
-                    task_json = json.dumps(task_obj)
-            removed_count = self.redis_client.lrem(worker_processing_queue, 1, task_json)
+                    task_json = encode_task(task_obj)
+            removed_count = self.scripts.ack(worker_processing_queue, task_json)
             if removed_count > 0:
-                self.logger.log(f"Task {task.get('id', 'N/A')} removed from '{worker_processing_queue}'.")
+                self.logger.log("Task %s removed from '%s'.",
+                                task.get('id', 'N/A'), worker_processing_queue, category="task")
             else:
                 self.logger.log(f"WARNING: Task {task.get('id', 'N/A')} not found in '{worker_processing_queue}' for removal.")
         except TypeError as e:
@@ -77,15 +116,14 @@ class RedisQueue:
                 if isinstance(task_obj, dict) and 'processing_start_timestamp' in task_obj:
                     temp_obj = dict(task_obj)
                     temp_obj.pop('processing_start_timestamp', None)
-                    task_json = json.dumps(temp_obj)
+                    task_json = encode_task(temp_obj)
                 else:
-                    task_json = json.dumps(task_obj)
-            # Push the task to the failed queue
-            self.redis_client.lpush(self.failed_queue_name, task_json)
-            # Remove the task from the processing queue
-            removed_count = self.redis_client.lrem(worker_processing_queue, 1, task_json)
+                    task_json = encode_task(task_obj)
+            # Remove from the processing queue and push to the failed queue in one atomic step
+            removed_count = self.scripts.fail(worker_processing_queue, self.failed_queue_name, task_json)
             if removed_count > 0:
-                self.logger.log(f"Task {task.get('id', 'N/A')} moved from '{worker_processing_queue}' to '{self.failed_queue_name}'.")
+                self.logger.log("Task %s moved from '%s' to '%s'.",
+                                task.get('id', 'N/A'), worker_processing_queue, self.failed_queue_name, category="task")
             else:
                 self.logger.log(f"WARNING: Failed task {task.get('id', 'N/A')} not found in '{worker_processing_queue}' during move to failed.")
         except TypeError as e:
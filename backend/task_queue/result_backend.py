@@ -0,0 +1,85 @@
+import time
+from utils.config import Config
+from task_queue.codec import encode_task, decode_task
+
+
+class ResultBackend:
+    """
+    Stores each task's outcome under `result:<task_id>` for `ttl` seconds.
+    Every write also leaves a token on `result:<task_id>:notify`. Waiters
+    block on that list with a BLMOVE onto itself, so each waiter wakes and
+    the token stays there for anyone who starts waiting later.
+    """
+    def __init__(self, redis_client, ttl=None, max_bytes=None, prefix="result:", blocking_client=None):
+        self.redis = redis_client
+        # Client wait() blocks on, ideally on the blocking pool
+        self.blocking = blocking_client or redis_client
+        self.ttl = ttl or Config.RESULT_TTL
+        self.max_bytes = max_bytes or Config.RESULT_MAX_BYTES
+        self.prefix = prefix
+
+    def key(self, task_id):
+        return f"{self.prefix}{task_id}"
+
+    def notify_key(self, task_id):
+        return f"{self.prefix}{task_id}:notify"
+
+    def build(self, task_id, value=None, error=None, worker_id=None):
+        """
+        Result record for a finished task. Handlers may return a bare value or a
+        TaskHandler-style {"status", "result"} dict; errors produce a failed record.
+        """
+        if error is not None:
+            record = {"task_id": task_id, "status": "failed", "error": str(error)}
+        elif isinstance(value, dict) and "status" in value and "result" in value:
+            record = {"task_id": task_id, "status": value["status"], "result": value["result"]}
+        else:
+            record = {"task_id": task_id, "status": "completed", "result": value}
+        record["worker_id"] = worker_id
+        record["completed_at"] = time.time()
+        return record
+
+    def store(self, record, client=None):
+        """Write a result record and wake its waiters. Pass a pipeline as `client` to batch."""
+        try:
+            data = encode_task(record)
+        except (TypeError, ValueError) as e:
+            record = {k: v for k, v in record.items() if k != "result"}
+            record["error"] = f"Result is not serializable: {e}"
+            data = encode_task(record)
+        if len(data) > self.max_bytes:
+            size = len(data)
+            record = {k: v for k, v in record.items() if k != "result"}
+            record.update({"error": f"Result of {size} bytes exceeds the {self.max_bytes}-byte limit",
+                           "truncated": True})
+            data = encode_task(record)
+        task_id = record["task_id"]
+        pipe = client or self.redis.pipeline(transaction=True)
+        pipe.set(self.key(task_id), data, ex=self.ttl)
+        pipe.delete(self.notify_key(task_id))
+        pipe.rpush(self.notify_key(task_id), 1)
+        pipe.expire(self.notify_key(task_id), self.ttl)
+        if client is None:
+            pipe.execute()
+
+    def get(self, task_id):
+        """Return the result record for a task, or None if it has not finished (or expired)."""
+        data = self.redis.get(self.key(task_id))
+        return decode_task(data) if data else None
+
+    def get_many(self, task_ids):
+        """Return {task_id: record or None} for many tasks with one MGET."""
+        task_ids = list(task_ids)
+        if not task_ids:
+            return {}
+        values = self.redis.mget([self.key(task_id) for task_id in task_ids])
+        return {task_id: decode_task(data) if data else None for task_id, data in zip(task_ids, values)}
+
+    def wait(self, task_id, timeout):
+        """Return the result record, blocking up to `timeout` seconds for it to be written."""
+        record = self.get(task_id)
+        if record is not None or timeout <= 0:
+            return record
+        # Rotating the token list onto itself wakes us without consuming the token
+        self.blocking.blmove(self.notify_key(task_id), self.notify_key(task_id), timeout, "LEFT", "RIGHT")
+        return self.get(task_id)
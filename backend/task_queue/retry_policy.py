@@ -0,0 +1,89 @@
+import json
+import math
+import random
+from utils.config import Config
+
+POLICY_FIELDS = ("max_attempts", "backoff_base", "backoff_max", "retry_on")
+
+
+def _is_seconds(value):
+    """Whether `value` is a usable delay: a finite, non-negative number (JSON allows NaN and Infinity)."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        return math.isfinite(value) and value >= 0
+    except OverflowError:
+        return False
+
+
+class RetryPolicy:
+    """
+    How often a failing task is retried and how long it waits in between.
+
+    max_attempts: total runs, including the first
+    backoff_base: delay before the first retry; doubles with every further attempt
+    backoff_max:  cap on the delay
+    retry_on:     exception class names worth retrying; matched against the
+                  error's whole class hierarchy, so "Exception" retries everything
+    Delays use full jitter (uniform between 0 and the exponential delay), so
+    tasks that failed together do not all come back together.
+    """
+    def __init__(self, max_attempts=None, backoff_base=None, backoff_max=None, retry_on=None):
+        self.max_attempts = max_attempts if max_attempts is not None else Config.RETRY_MAX_ATTEMPTS
+        self.backoff_base = backoff_base if backoff_base is not None else Config.RETRY_BACKOFF_BASE
+        self.backoff_max = backoff_max if backoff_max is not None else Config.RETRY_BACKOFF_MAX
+        self.retry_on = list(retry_on) if retry_on is not None else ["Exception"]
+
+    def merged(self, options):
+        """A copy of this policy with the fields in `options` overridden. Raises ValueError on bad options."""
+        if not isinstance(options, dict):
+            raise ValueError("Retry policy must be an object")
+        unknown = set(options) - set(POLICY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown retry policy field(s): {', '.join(sorted(unknown))}")
+        max_attempts = options.get("max_attempts")
+        if max_attempts is not None and (isinstance(max_attempts, bool) or not isinstance(max_attempts, int)
+                                         or max_attempts < 0):
+            raise ValueError("Retry policy 'max_attempts' must be a non-negative integer")
+        for field in ("backoff_base", "backoff_max"):
+            value = options.get(field)
+            if value is not None and not _is_seconds(value):
+                raise ValueError(f"Retry policy '{field}' must be a non-negative number of seconds")
+        retry_on = options.get("retry_on")
+        if retry_on is not None and (not isinstance(retry_on, list) or not all(isinstance(n, str) for n in retry_on)):
+            raise ValueError("Retry policy 'retry_on' must be a list of exception class names")
+        values = {field: getattr(self, field) for field in POLICY_FIELDS}
+        values.update({k: v for k, v in options.items() if v is not None})
+        return RetryPolicy(**values)
+
+    def is_retryable(self, error):
+        names = {cls.__name__ for cls in type(error).__mro__}
+        return any(name in names for name in self.retry_on)
+
+    def should_retry(self, error, attempts):
+        """Whether a task that has now failed `attempts` times should run again."""
+        return attempts < self.max_attempts and self.is_retryable(error)
+
+    def backoff(self, attempts):
+        """Seconds to wait before the next run, after `attempts` failures."""
+        # The exponent is capped so a large max_attempts cannot overflow the float math
+        delay = min(self.backoff_max, self.backoff_base * 2 ** min(attempts - 1, 64))
+        return random.uniform(0, delay)
+
+
+class RetryPolicies:
+    """
+    Picks the policy for a task: its own "retry" options, over the policy for
+    its "type" (from RETRY_POLICIES), over the default policy.
+    """
+    def __init__(self, default=None, per_type=None):
+        self.default = default or RetryPolicy()
+        if per_type is None:
+            per_type = json.loads(Config.RETRY_POLICIES or "{}")
+        self.per_type = {name: self.default.merged(options) for name, options in per_type.items()}
+
+    def for_task(self, task):
+        policy = self.per_type.get(task.get("type"), self.default)
+        if task.get("retry"):
+            policy = policy.merged(task["retry"])
+        return policy
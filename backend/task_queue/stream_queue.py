@@ -0,0 +1,216 @@
+import redis
+import time
+from utils.config import Config
+from utils.logger import Logger
+from utils.redis_client import get_redis, get_shard
+from task_queue.codec import encode_task, decode_task
+
+# KEYS: stream. ARGV: group, consumer, batch size.
+# Moves up to a batch of the consumer's pending entries to the tail of the stream
+# as new entries and deletes the old ones, atomically. Once the consumer has no
+# pending entries left it is removed from the group. Returns {moved, done}.
+REQUEUE_CONSUMER_SCRIPT = """
+local pending = redis.call('XPENDING', KEYS[1], ARGV[1], '-', '+', tonumber(ARGV[3]), ARGV[2])
+local moved = 0
+for _, entry in ipairs(pending) do
+    local id = entry[1]
+    local found = redis.call('XRANGE', KEYS[1], id, id)
+    if #found > 0 then
+        redis.call('XADD', KEYS[1], '*', unpack(found[1][2]))
+        moved = moved + 1
+    end
+    redis.call('XACK', KEYS[1], ARGV[1], id)
+    redis.call('XDEL', KEYS[1], id)
+end
+if #redis.call('XPENDING', KEYS[1], ARGV[1], '-', '+', 1, ARGV[2]) > 0 then
+    return {moved, 0}
+end
+redis.call('XGROUP', 'DELCONSUMER', KEYS[1], ARGV[1], ARGV[2])
+return {moved, 1}
+"""
+
+# KEYS: stream. ARGV: group, consumer, message IDs...
+# Resets the idle time of the entries the consumer still owns, so XAUTOCLAIM
+# leaves them alone. Entries another consumer has claimed meanwhile are skipped.
+RENEW_CLAIMS_SCRIPT = """
+local renewed = 0
+for i = 3, #ARGV do
+    local entry = redis.call('XPENDING', KEYS[1], ARGV[1], ARGV[i], ARGV[i], 1)
+    if #entry > 0 and entry[1][2] == ARGV[2] then
+        redis.call('XCLAIM', KEYS[1], ARGV[1], ARGV[2], 0, ARGV[i], 'JUSTID')
+        renewed = renewed + 1
+    end
+end
+return renewed
+"""
+
+
+class StreamQueue:
+    """
+    Redis Streams alternative to RedisQueue, built on a consumer group.
+    Each worker is a consumer: XREADGROUP hands it entries (tracked in its
+    pending entries list), XACK acknowledges by message ID in O(1), and
+    XAUTOCLAIM lets live workers take over entries another worker left idle.
+    Method names mirror RedisQueue; where RedisQueue takes a worker's
+    processing queue, StreamQueue takes the worker's consumer name.
+    """
+    def __init__(self, host=None, port=None, shard=None):
+        self.redis_client = get_shard(shard) if shard is not None else get_redis(host, port)
+        # Blocking reads wait on their own pool
+        self.blocking_client = (get_shard(shard, blocking=True) if shard is not None
+                                else get_redis(host, port, blocking=True))
+        self.shard = shard or 0
+        self.logger = Logger()
+        self.stream_name = "task_stream"
+        self.group_name = "workers"
+        # Same name as RedisQueue so callers can log/inspect either engine alike
+        self.main_queue_name = self.stream_name
+        self.failed_queue_name = "tasks_failed"
+        self.claim_idle_ms = Config.STREAM_CLAIM_IDLE_MS
+        self._requeue = self.redis_client.register_script(REQUEUE_CONSUMER_SCRIPT)
+        self._renew = self.redis_client.register_script(RENEW_CLAIMS_SCRIPT)
+        self._ensure_group()
+
+    def _ensure_group(self):
+        try:
+            self.redis_client.xgroup_create(self.stream_name, self.group_name, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                self.logger.log(f"Redis error creating consumer group '{self.group_name}': {e}")
+        except redis.RedisError as e:
+            self.logger.log(f"Redis error creating consumer group '{self.group_name}': {e}")
+
+    def _decode_entries(self, entries):
+        tasks = []
+        now = time.time()
+        for message_id, fields in entries:
+            if not fields:
+                # Entry was deleted while pending; nothing left to run
+                continue
+            task_json = fields.get("task")
+            try:
+                task = decode_task(task_json)
+            except (TypeError, ValueError) as e:
+                self.logger.log(f"Error decoding task JSON from stream entry {message_id}: {e}")
+                self.redis_client.xack(self.stream_name, self.group_name, message_id)
+                continue
+            task['processing_start_timestamp'] = now
+            task['_id'] = message_id
+            task['_raw'] = task_json
+            tasks.append(task)
+        return tasks
+
+    def add_task_to_queue(self, task):
+        """Append a task to the stream."""
+        task['submit_timestamp'] = time.time()
+        try:
+            message_id = self.redis_client.xadd(self.stream_name, {"task": encode_task(task)})
+            self.logger.log("Task %s added to stream '%s' as %s.",
+                            task.get('id', 'N/A'), self.stream_name, message_id, category="task")
+            return message_id
+        except TypeError as e:
+            self.logger.log(f"Error serializing task: {e} - Task: {task}")
+        except redis.RedisError as e:
+            self.logger.log(f"Redis error adding task: {e}")
+        return None
+
+    def add_encoded_tasks(self, encoded_tasks):
+        """Append many already-encoded tasks in one pipeline. Returns their message IDs."""
+        pipe = self.redis_client.pipeline(transaction=True)
+        for task_json in encoded_tasks:
+            pipe.xadd(self.stream_name, {"task": task_json})
+        return pipe.execute()
+
+    def backlog(self):
+        """Entries not yet delivered to any consumer: acknowledged entries are deleted, so all minus pending."""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xlen(self.stream_name)
+        pipe.xpending(self.stream_name, self.group_name)
+        length, pending = pipe.execute()
+        return max(length - pending["pending"], 0)
+
+    def get_tasks(self, consumer, count=1, block=None):
+        """
+        Read up to `count` new entries for `consumer`, blocking up to `block`
+        seconds when the stream is empty. Entries stay pending until acked.
+        """
+        try:
+            block_ms = int(block * 1000) if block else None
+            client = self.blocking_client if block_ms else self.redis_client
+            response = client.xreadgroup(
+                self.group_name, consumer, {self.stream_name: ">"}, count=count, block=block_ms)
+        except redis.RedisError as e:
+            self.logger.log(f"Redis error in get_tasks: {e}")
+            return []
+        tasks = []
+        for _, entries in response or []:
+            tasks.extend(self._decode_entries(entries))
+        return tasks
+
+    def get_task_reliably(self, consumer, timeout=5):
+        """Read one task for `consumer`, blocking up to `timeout` seconds."""
+        tasks = self.get_tasks(consumer, count=1, block=timeout)
+        return tasks[0] if tasks else None
+
+    def claim_stale_tasks(self, consumer, count=100):
+        """Take over entries that have sat unacknowledged longer than the claim idle time."""
+        try:
+            response = self.redis_client.xautoclaim(
+                self.stream_name, self.group_name, consumer, self.claim_idle_ms, start_id="0-0", count=count)
+        except redis.RedisError as e:
+            self.logger.log(f"Redis error in claim_stale_tasks: {e}")
+            return []
+        tasks = self._decode_entries(response[1])
+        if tasks:
+            self.logger.log(f"Consumer {consumer} claimed {len(tasks)} stale task(s) from '{self.stream_name}'.")
+        return tasks
+
+    def renew_claims(self, consumer, message_ids):
+        """
+        Keep a live consumer's running entries from looking idle, so XAUTOCLAIM
+        does not hand them to another worker. Returns the number renewed.
+        """
+        if not message_ids:
+            return 0
+        return self._renew(keys=[self.stream_name], args=[self.group_name, consumer] + list(message_ids))
+
+    def confirm_task_completion(self, consumer, task, client=None):
+        """Acknowledge a processed task by message ID and drop it from the stream."""
+        try:
+            pipe = client or self.redis_client.pipeline(transaction=True)
+            pipe.xack(self.stream_name, self.group_name, task['_id'])
+            pipe.xdel(self.stream_name, task['_id'])
+            if client is None:
+                pipe.execute()
+            self.logger.log("Task %s acknowledged by %s.", task.get('id', 'N/A'), consumer, category="task")
+        except redis.RedisError as e:
+            self.logger.log(f"Redis error confirming task completion: {e}")
+
+    def move_task_to_failed(self, consumer, task, client=None, failed_json=None):
+        """
+        Acknowledge a failed task and record it in the failed queue, atomically.
+        `failed_json` lets the caller record an annotated copy instead of the stored task.
+        """
+        try:
+            pipe = client or self.redis_client.pipeline(transaction=True)
+            pipe.xack(self.stream_name, self.group_name, task['_id'])
+            pipe.xdel(self.stream_name, task['_id'])
+            pipe.lpush(self.failed_queue_name, failed_json or task['_raw'])
+            if client is None:
+                pipe.execute()
+            self.logger.log(f"Task {task.get('id', 'N/A')} moved from {consumer} to '{self.failed_queue_name}'.")
+        except redis.RedisError as e:
+            self.logger.log(f"Redis error moving task to failed queue: {e}")
+
+    def requeue_consumer(self, consumer, batch=1000):
+        """
+        Put a dead consumer's pending entries back at the tail of the stream as
+        new entries, one atomic batch at a time, and remove the consumer from the
+        group once none are left. Returns the number requeued.
+        """
+        requeued = 0
+        while True:
+            moved, done = self._requeue(keys=[self.stream_name], args=[self.group_name, consumer, batch])
+            requeued += int(moved)
+            if int(done):
+                return requeued
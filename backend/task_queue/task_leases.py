@@ -0,0 +1,82 @@
+import time
+import json
+from utils.config import Config
+from task_queue.lua_scripts import TaskScripts
+
+
+class TaskLeases:
+    """
+    Per-task visibility timeouts for the list engine.
+
+    - task_leases          sorted set, lease -> deadline (epoch seconds)
+    - task_leases:records  hash, lease -> {queue, lane, worker, task} JSON
+
+    A lease is `<processing queue>|<task id>`. Workers grant one when they pick a
+    task up, push its deadline out while it runs and drop it on ack. Expired
+    leases are found with one range query, so a reclaim tick costs
+    O(log n + k) however many tasks are in flight.
+    """
+    def __init__(self, redis_client, timeout=None, max_runtime=None, batch_size=None, key="task_leases"):
+        self.redis = redis_client
+        self.key = key
+        self.records_key = f"{key}:records"
+        self.timeout = timeout or Config.LEASE_TIMEOUT
+        self.max_runtime = max_runtime or Config.LEASE_MAX_RUNTIME
+        self.batch_size = batch_size or Config.LEASE_RECLAIM_BATCH
+        self.scripts = TaskScripts(redis_client)
+
+    def lease_for(self, processing_queue, task_id):
+        return f"{processing_queue}|{task_id}"
+
+    def grant_many(self, processing_queue, worker_id, grants, pipe=None):
+        """
+        Lease [(task id, lane, raw task)] picked up from `processing_queue` in one
+        round trip. Returns {lease: renewal cap} for the worker to renew against.
+        """
+        if not grants:
+            return {}
+        now = time.time()
+        deadlines, records = {}, {}
+        for task_id, lane, task_json in grants:
+            lease = self.lease_for(processing_queue, task_id)
+            deadlines[lease] = now + self.timeout
+            records[lease] = json.dumps({"queue": processing_queue, "lane": lane,
+                                         "worker": worker_id, "task": task_json})
+        client = pipe or self.redis.pipeline(transaction=False)
+        client.zadd(self.key, deadlines)
+        client.hset(self.records_key, mapping=records)
+        if pipe is None:
+            client.execute()
+        return {lease: now + self.max_runtime for lease in deadlines}
+
+    def renew(self, caps):
+        """Push out the deadlines of leases still held, each no further than its cap."""
+        if not caps:
+            return
+        now = time.time()
+        # XX: a lease reclaimed or released meanwhile is not brought back
+        self.redis.zadd(self.key, {lease: min(now + self.timeout, cap) for lease, cap in caps.items()}, xx=True)
+
+    def release(self, lease, pipe=None):
+        client = pipe or self.redis.pipeline(transaction=False)
+        client.zrem(self.key, lease)
+        client.hdel(self.records_key, lease)
+        if pipe is None:
+            client.execute()
+
+    def reclaim_expired(self, now=None):
+        """
+        Move the tasks of every expired lease back to the front of their lane,
+        in chunks of `batch_size`, least overdue first so that the longest-overdue
+        task ends up at the head. Returns the number of tasks requeued.
+        """
+        now = time.time() if now is None else now
+        total = 0
+        while True:
+            expired, requeued = self.scripts.reclaim(self.key, self.records_key, now, self.batch_size)
+            total += requeued
+            if expired < self.batch_size:
+                return total
+
+    def count(self):
+        return self.redis.zcard(self.key)
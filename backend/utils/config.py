@@ -3,7 +3,35 @@ import os
 class Config:
     # Redis configurations
     REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
-    REDIS_PORT = os.getenv('REDIS_PORT', 6379)
+    REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+    REDIS_DB = int(os.getenv('REDIS_DB', 0))
+    REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', '')
+    # Unix socket path; when set it is used instead of REDIS_HOST/REDIS_PORT
+    REDIS_SOCKET_PATH = os.getenv('REDIS_SOCKET_PATH', '')
+    # Connections per pool (one pool per process and server); callers wait REDIS_POOL_TIMEOUT
+    # seconds for a free one beyond that
+    REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 64))
+    REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 5))
+    # Separate pool for blocking waits (result long-polls, worker fetches, pub/sub), so they
+    # never hold the connections ordinary commands need
+    REDIS_BLOCKING_MAX_CONNECTIONS = int(os.getenv('REDIS_BLOCKING_MAX_CONNECTIONS', 512))
+    # Socket timeouts in seconds (0 = none); REDIS_SOCKET_TIMEOUT must exceed the longest
+    # blocking wait (worker fetch timeout, RESULT_MAX_WAIT)
+    REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 5))
+    REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 0))
+    REDIS_SOCKET_KEEPALIVE = os.getenv('REDIS_SOCKET_KEEPALIVE', '1') == '1'
+    # PING a connection idle this many seconds before reusing it
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+    # Commands per round trip when a batch is split across pipelines
+    REDIS_PIPELINE_CHUNK = int(os.getenv('REDIS_PIPELINE_CHUNK', 1000))
+    # Queue shards as "host:port,host:port"; tasks hash across them. Empty = one shard on REDIS_HOST
+    REDIS_SHARDS = os.getenv('REDIS_SHARDS', '')
+    # Shard a scheduler or monitor process serves (run one of each per shard)
+    SHARD = int(os.getenv('SHARD', 0))
+    # A worker's home shard; -1 spreads numbered workers round-robin over the shards
+    WORKER_SHARD = int(os.getenv('WORKER_SHARD', -1))
+    # Seconds between an idle worker's checks of the other shards for a backlog
+    SHARD_PROBE_INTERVAL = float(os.getenv('SHARD_PROBE_INTERVAL', 5))
 
     # RabbitMQ configurations
     RABBITMQ_HOST = os.getenv('RABBITMQ_HOST', 'localhost')
@@ -11,3 +39,137 @@ class Config:
     # Database configurations (optional)
     DB_HOST = os.getenv('DB_HOST', 'localhost')
     DB_PORT = os.getenv('DB_PORT', 5432)
+
+    # Worker registry: seconds since last heartbeat for a worker to count as active
+    WORKER_ACTIVE_WINDOW = int(os.getenv('WORKER_ACTIVE_WINDOW', 60))
+
+    # Scheduler dispatch mode: "poll" (fixed interval) or "event" (blocking + idle notifications)
+    DISPATCH_MODE = os.getenv('DISPATCH_MODE', 'poll')
+    # Longest time the event dispatcher blocks before re-checking the cluster view
+    DISPATCH_BLOCK_TIMEOUT = float(os.getenv('DISPATCH_BLOCK_TIMEOUT', 1))
+
+    # Worker execution: "serial" (one task at a time), "thread", "asyncio" or "process"
+    WORKER_MODE = os.getenv('WORKER_MODE', 'serial')
+    # Tasks a worker runs at once; 0 means one per CPU core in process mode, else 1
+    WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 0))
+    # Tasks a worker holds in flight (running + waiting for a slot); 0 means same as concurrency
+    WORKER_PREFETCH = int(os.getenv('WORKER_PREFETCH', 0))
+    # Times a task may take down a process-pool child before it is moved to the failed queue
+    WORKER_MAX_CRASHES = int(os.getenv('WORKER_MAX_CRASHES', 3))
+    # Seconds a worker with an empty processing queue blocks on the main queue per fetch
+    WORKER_FETCH_TIMEOUT = float(os.getenv('WORKER_FETCH_TIMEOUT', 1))
+
+    # Queue engine: "list" (task_queue + processing:* lists) or "stream" (Redis Streams consumer group)
+    QUEUE_ENGINE = os.getenv('QUEUE_ENGINE', 'list')
+    # Stream engine: how long an entry may sit unacknowledged before another worker claims it.
+    # Workers renew the claims of running entries, up to LEASE_MAX_RUNTIME after pickup.
+    STREAM_CLAIM_IDLE_MS = int(os.getenv('STREAM_CLAIM_IDLE_MS', 60000))
+
+    # Task encoding: "json", "orjson" or "msgpack"; readers decode every format regardless
+    TASK_CODEC = os.getenv('TASK_CODEC', 'json')
+    # Compress encoded tasks at least this many bytes with "zstd" or "lz4" ("none" disables)
+    TASK_COMPRESSION = os.getenv('TASK_COMPRESSION', 'none')
+    TASK_COMPRESS_THRESHOLD = int(os.getenv('TASK_COMPRESS_THRESHOLD', 4096))
+
+    # Claim check: payloads of at least this many bytes are stored outside the queue.
+    # Off by default (0): the local store only works where API and workers share a disk
+    CLAIM_CHECK_THRESHOLD = int(os.getenv('CLAIM_CHECK_THRESHOLD', 0))
+    # Blob store for offloaded payloads: "local" (directory shared by API and workers) or "redis"
+    CLAIM_CHECK_STORE = os.getenv('CLAIM_CHECK_STORE', 'local')
+    CLAIM_CHECK_DIR = os.getenv('CLAIM_CHECK_DIR', '/tmp/queuepilot-blobs')
+
+    # Priority lanes: tasks carry "priority" 0..PRIORITY_LEVELS-1 (higher is more urgent)
+    PRIORITY_LEVELS = int(os.getenv('PRIORITY_LEVELS', 3))
+    # How free slots are shared between lanes: "weighted" or "strict"
+    PRIORITY_POLICY = os.getenv('PRIORITY_POLICY', 'weighted')
+    # Comma-separated lane weights from lowest to highest priority; default 1,4,16,...
+    PRIORITY_WEIGHTS = os.getenv('PRIORITY_WEIGHTS', '')
+    # Seconds a lane's oldest task may wait before that lane is served first (0 disables)
+    PRIORITY_MAX_WAIT = float(os.getenv('PRIORITY_MAX_WAIT', 30))
+
+    # Delayed tasks: most due tasks promoted per queue in one atomic script call
+    DELAYED_PROMOTE_BATCH = int(os.getenv('DELAYED_PROMOTE_BATCH', 1000))
+
+    # Result backend: how long results are kept, their size cap, and the longest /result long-poll
+    RESULT_TTL = int(os.getenv('RESULT_TTL', 86400))
+    RESULT_MAX_BYTES = int(os.getenv('RESULT_MAX_BYTES', 1048576))
+    RESULT_MAX_WAIT = float(os.getenv('RESULT_MAX_WAIT', 30))
+
+    # Submission deduplication by idempotency_key (default: task id): "exact", "bloom" or "off"
+    IDEMPOTENCY_MODE = os.getenv('IDEMPOTENCY_MODE', 'exact')
+    # Sliding window in seconds; a duplicate inside it extends the window
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 86400))
+    # Bloom mode: bits per filter (two filters live at once) and hash functions per key
+    IDEMPOTENCY_BLOOM_BITS = int(os.getenv('IDEMPOTENCY_BLOOM_BITS', 2 ** 27))
+    IDEMPOTENCY_BLOOM_HASHES = int(os.getenv('IDEMPOTENCY_BLOOM_HASHES', 7))
+
+    # Retries: total attempts per task, then exponential backoff (seconds) with full jitter
+    RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 3))
+    RETRY_BACKOFF_BASE = float(os.getenv('RETRY_BACKOFF_BASE', 1))
+    RETRY_BACKOFF_MAX = float(os.getenv('RETRY_BACKOFF_MAX', 300))
+    # Per task "type" overrides as JSON, e.g. {"email": {"max_attempts": 5, "retry_on": ["TimeoutError"]}}
+    RETRY_POLICIES = os.getenv('RETRY_POLICIES', '{}')
+
+    # Task leases (list engine): a picked-up task not acked within LEASE_TIMEOUT seconds is requeued.
+    # Workers renew leases of running tasks, but never past LEASE_MAX_RUNTIME seconds after pickup.
+    LEASE_TIMEOUT = int(os.getenv('LEASE_TIMEOUT', 60))
+    LEASE_MAX_RUNTIME = int(os.getenv('LEASE_MAX_RUNTIME', 3600))
+    # Expired leases reclaimed per script call
+    LEASE_RECLAIM_BATCH = int(os.getenv('LEASE_RECLAIM_BATCH', 1000))
+
+    # Dead workers recovered at once when many fail together (e.g. a whole host)
+    RECOVERY_CONCURRENCY = int(os.getenv('RECOVERY_CONCURRENCY', 16))
+
+    # Worker choice for new tasks: "least_time" (earliest expected completion from worker
+    # service-time EWMAs), "p2c" (the better of SCHEDULING_SAMPLE random workers) or "most_free"
+    SCHEDULING_POLICY = os.getenv('SCHEDULING_POLICY', 'least_time')
+    SCHEDULING_SAMPLE = int(os.getenv('SCHEDULING_SAMPLE', 2))
+    # EWMA weight of the newest service time
+    SERVICE_TIME_ALPHA = float(os.getenv('SERVICE_TIME_ALPHA', 0.2))
+
+    # Logging: level, log file, "text" or "json" (JSON lines) file format
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'info')
+    LOG_FILE = os.getenv('LOG_FILE', 'system.log')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    # Records buffered for the background writer; beyond this they are dropped, never waited on
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 100000))
+    # Messages per second per category, e.g. "task=100,dispatch=20"; per-task messages use "task"
+    LOG_RATE_LIMITS = os.getenv('LOG_RATE_LIMITS', 'task=100')
+
+    # Port for GET /metrics from a scheduler, worker or monitor process (0 = off). Give each process
+    # on a host its own: one that finds the port taken logs a warning and runs without it
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+    # Task types that get their own metric series (comma-separated). RETRY_POLICIES types are
+    # included; any other type is recorded as "other", so clients cannot create series at will
+    METRICS_TASK_TYPES = os.getenv('METRICS_TASK_TYPES', '')
+
+    # Dashboard status: one snapshot rebuilt every STATUS_INTERVAL seconds, with the first
+    # STATUS_PREVIEW tasks of each queue; rebuilds pause after STATUS_IDLE_TIMEOUT seconds unread
+    STATUS_INTERVAL = float(os.getenv('STATUS_INTERVAL', 2))
+    STATUS_PREVIEW = int(os.getenv('STATUS_PREVIEW', 50))
+    STATUS_IDLE_TIMEOUT = int(os.getenv('STATUS_IDLE_TIMEOUT', 60))
+    # Default and largest page of tasks from /queue_status and /system_status
+    STATUS_PAGE_SIZE = int(os.getenv('STATUS_PAGE_SIZE', 100))
+    STATUS_MAX_PAGE_SIZE = int(os.getenv('STATUS_MAX_PAGE_SIZE', 1000))
+    # Seconds between keep-alive comments on an idle /events stream
+    STATUS_KEEPALIVE = int(os.getenv('STATUS_KEEPALIVE', 15))
+
+    # Async ingestion server (client_interface/async_api.py): submissions are written in batches
+    # of up to INGEST_BATCH_SIZE, at most INGEST_BATCH_DELAY_MS after the first one arrives
+    INGEST_PORT = int(os.getenv('INGEST_PORT', 5001))
+    INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 500))
+    INGEST_BATCH_DELAY_MS = float(os.getenv('INGEST_BATCH_DELAY_MS', 2))
+    # Batches written concurrently, each on its own thread and Redis connection
+    INGEST_FLUSH_WORKERS = int(os.getenv('INGEST_FLUSH_WORKERS', 4))
+
+    # Admission control on submission (0 = no limit). Tasks waiting in the main queue (all lanes,
+    # or the stream) beyond which submissions get 429, and the cap on a worker's processing queue
+    ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv('ADMISSION_MAX_QUEUE_DEPTH', 1000000))
+    ADMISSION_MAX_WORKER_QUEUE = int(os.getenv('ADMISSION_MAX_WORKER_QUEUE', 0))
+    # Per-client token bucket: tasks per second and burst size; clients are told apart by
+    # ADMISSION_CLIENT_HEADER, or by address without it
+    ADMISSION_RATE = float(os.getenv('ADMISSION_RATE', 0))
+    ADMISSION_BURST = float(os.getenv('ADMISSION_BURST', 0))
+    ADMISSION_CLIENT_HEADER = os.getenv('ADMISSION_CLIENT_HEADER', 'X-Client-ID')
+    # Longest Retry-After handed out, in seconds
+    ADMISSION_MAX_RETRY_AFTER = int(os.getenv('ADMISSION_MAX_RETRY_AFTER', 60))
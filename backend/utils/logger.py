@@ -1,34 +1,202 @@
+import atexit
+import json
 import logging
+import multiprocessing
+import os
+import queue
 import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from utils.config import Config
+
+LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread as they are. The message is only
+    %-formatted there, so callers pay for neither formatting nor I/O. Pass
+    immutable values (ids, numbers, strings) as arguments. A full queue drops
+    the record instead of blocking the caller.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Tracebacks refer to the caller's frames, so they are rendered now
+        if record.exc_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _ConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        color = getattr(record, "color", None)
+        return f"{color}{line}\033[0m" if color else line
+
+
+class _JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, message, category and any extra fields."""
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname.lower(),
+            "message": record.getMessage(),
+        }
+        if getattr(record, "category", None):
+            entry["category"] = record.category
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _RateLimiter:
+    """
+    Per-category cap on messages per second (LOG_RATE_LIMITS, e.g. "task=100").
+    When a second closes with messages dropped, the next message that gets
+    through reports how many were suppressed.
+    """
+    def __init__(self, limits):
+        self.limits = limits
+        self._windows = {}  # category -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, spec):
+        limits = {}
+        for item in spec.split(","):
+            if "=" in item:
+                category, limit = item.split("=", 1)
+                limits[category.strip()] = int(limit)
+        return cls(limits)
+
+    def admit(self, category):
+        """Return (allowed, messages suppressed since the last admitted one)."""
+        limit = self.limits.get(category)
+        if limit is None:
+            return True, 0
+        now = int(time.monotonic())
+        with self._lock:
+            window = self._windows.setdefault(category, [now, 0, 0])
+            if window[0] != now:
+                window[0], window[1] = now, 0
+            if window[1] >= limit:
+                window[2] += 1
+                return False, 0
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+            return True, suppressed
+
 
 class Logger:
-    def __init__(self, log_file="system.log"):
+    """
+    Application logger shared by every component. Records go through an
+    in-memory queue to one background thread, which writes `system.log` and
+    the console. Logging never waits on I/O.
+
+    Process-pool children write synchronously instead. A forked child inherits
+    the queue but not the thread, and pool children exit without running
+    atexit, so records queued there would never be written.
+
+    Messages are formatted lazily: log("Task %s done", task_id) skips the
+    formatting entirely when the level is disabled or the category is over
+    its rate limit. LOG_FORMAT=json writes JSON lines to the file, including
+    any keyword fields passed to log().
+    """
+    _listener = None
+    _handlers = None  # what the app logger writes to: the queue, or the real handlers in a pool child
+    _limiter = None
+    _log_file = None
+    _setup_lock = threading.Lock()
+
+    def __init__(self, log_file=None):
         self.logger = logging.getLogger('TaskSchedulerLogger')
-        self.logger.setLevel(logging.INFO)
-
-        # Avoid duplicate handlers
-        if not self.logger.handlers:
-            # File handler with UTF-8 encoding
-            file_handler = logging.FileHandler(log_file, encoding='utf-8')
-            formatter = logging.Formatter('%(asctime)s - %(message)s')
-            file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
-
-            # Console handler (safe fallback if needed)
-            console_handler = logging.StreamHandler(sys.stdout)
-            console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
-
-    def log(self, message, color=None):
-        """Logs to both file and console. Adds color if specified."""
-        try:
-            self.logger.info(message)  # ✅ File + console (utf-8 safe)
-        except UnicodeEncodeError:
-            # Strip emoji if file logging crashes (very rare now)
-            message = message.encode('ascii', 'ignore').decode()
-
-        # Colored terminal output (optional)
-        if color:
-            print(f"{color}{message}\033[0m")
+        Logger._ensure_started(self.logger, log_file)
+
+    @classmethod
+    def _ensure_started(cls, logger, log_file=None):
+        with cls._setup_lock:
+            # Avoid duplicate handlers
+            if cls._handlers is None:
+                cls._start(logger, log_file or cls._log_file or Config.LOG_FILE)
+
+    @classmethod
+    def _start(cls, logger, log_file):
+        logger.setLevel(LEVELS.get(Config.LOG_LEVEL.lower(), logging.INFO))
+        text = logging.Formatter('%(asctime)s - %(message)s')
+
+        # File handler with UTF-8 encoding
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(_JsonFormatter() if Config.LOG_FORMAT == "json" else text)
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(_ConsoleFormatter('%(asctime)s - %(message)s'))
+
+        cls._log_file = log_file
+        cls._limiter = _RateLimiter.from_config(Config.LOG_RATE_LIMITS)
+        if multiprocessing.parent_process() is not None:
+            cls._handlers = [file_handler, console_handler]
         else:
-            print(message)
+            queue_handler = _DeferredQueueHandler(queue.Queue(maxsize=Config.LOG_QUEUE_SIZE))
+            cls._handlers = [queue_handler]
+            cls._listener = QueueListener(queue_handler.queue, file_handler, console_handler,
+                                          respect_handler_level=True)
+            cls._listener.start()
+            # Flush what is still queued on exit
+            atexit.register(cls._listener.stop)
+        for handler in cls._handlers:
+            logger.addHandler(handler)
+
+    @classmethod
+    def _after_fork(cls):
+        """In a forked child: drop the parent's queue, whose listener thread did not survive the fork."""
+        cls._setup_lock = threading.Lock()
+        if cls._handlers is None:
+            return
+        logger = logging.getLogger('TaskSchedulerLogger')
+        for handler in cls._handlers:
+            logger.removeHandler(handler)
+        cls._handlers = cls._listener = None
+
+    def log(self, message, *args, color=None, level="info", category=None, **fields):
+        """
+        Log `message % args` at `level`. `category` groups per-task messages for
+        rate limiting; `fields` are extra structured values for the JSON format.
+        """
+        if Logger._handlers is None:
+            # First record since a fork
+            Logger._ensure_started(self.logger)
+        levelno = LEVELS.get(level, logging.INFO)
+        if not self.logger.isEnabledFor(levelno):
+            return
+        if category:
+            allowed, suppressed = Logger._limiter.admit(category)
+            if not allowed:
+                return
+            if suppressed:
+                self.logger.log(logging.WARNING, "[Logger] Suppressed %d '%s' message(s) over the rate limit",
+                                suppressed, category, extra={"category": category})
+        self.logger.log(levelno, message, *args, extra={"color": color, "category": category, "fields": fields})
+
+    def debug(self, message, *args, **kwargs):
+        self.log(message, *args, level="debug", **kwargs)
+
+    def warning(self, message, *args, **kwargs):
+        self.log(message, *args, level="warning", **kwargs)
+
+    def error(self, message, *args, **kwargs):
+        self.log(message, *args, level="error", **kwargs)
+
+
+os.register_at_fork(after_in_child=Logger._after_fork)
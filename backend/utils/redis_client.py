@@ -0,0 +1,107 @@
+import threading
+import zlib
+import redis
+from utils.config import Config
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_options(host, port, db, decode_responses, blocking):
+    options = {
+        "db": Config.REDIS_DB if db is None else db,
+        "password": Config.REDIS_PASSWORD or None,
+        "decode_responses": decode_responses,
+        "max_connections": Config.REDIS_BLOCKING_MAX_CONNECTIONS if blocking else Config.REDIS_MAX_CONNECTIONS,
+        # Wait this long for a free connection when all are in use, then fail
+        "timeout": Config.REDIS_POOL_TIMEOUT,
+        "socket_connect_timeout": Config.REDIS_CONNECT_TIMEOUT or None,
+        "socket_timeout": Config.REDIS_SOCKET_TIMEOUT or None,
+        "health_check_interval": Config.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+    if Config.REDIS_SOCKET_PATH and host is None:
+        options.update(connection_class=redis.UnixDomainSocketConnection, path=Config.REDIS_SOCKET_PATH)
+    else:
+        options.update(host=host or Config.REDIS_HOST, port=int(port or Config.REDIS_PORT),
+                       socket_keepalive=Config.REDIS_SOCKET_KEEPALIVE)
+    return options
+
+
+def get_pool(host=None, port=None, db=None, decode_responses=True, blocking=False):
+    """
+    The process-wide connection pool for a Redis endpoint, created on first use.
+    Connections are opened lazily and reused, and never exceed REDIS_MAX_CONNECTIONS.
+
+    `blocking` selects a separate pool, capped at REDIS_BLOCKING_MAX_CONNECTIONS,
+    for commands that hold a connection while they wait (BLMOVE, blocking
+    XREADGROUP, pub/sub), so long waits can never starve ordinary commands.
+    """
+    options = _pool_options(host, port, db, decode_responses, blocking)
+    key = (blocking,) + tuple(sorted((name, str(value)) for name, value in options.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = redis.BlockingConnectionPool(**options)
+    return pool
+
+
+def get_redis(host=None, port=None, db=None, decode_responses=True, blocking=False):
+    """
+    A client on the shared pool for REDIS_HOST/REDIS_PORT, or REDIS_SOCKET_PATH
+    when set. Clients are cheap; every component in a process shares the
+    connections underneath. Pass `host`/`port` only to reach a different server,
+    and `blocking` for a client used for blocking waits.
+    """
+    return redis.StrictRedis(connection_pool=get_pool(host, port, db, decode_responses, blocking))
+
+
+def shard_addresses():
+    """(host, port) of every queue shard in REDIS_SHARDS, or one shard on the default server."""
+    addresses = []
+    for entry in Config.REDIS_SHARDS.split(","):
+        entry = entry.strip()
+        if entry:
+            host, _, port = entry.rpartition(":")
+            addresses.append((host, int(port)) if host else (entry, None))
+    return addresses or [(None, None)]
+
+
+def shard_count():
+    return len(shard_addresses())
+
+
+def get_shard(index, decode_responses=True, blocking=False):
+    """A client for queue shard `index`, on that server's shared pool (or its blocking pool)."""
+    host, port = shard_addresses()[index]
+    return get_redis(host, port, decode_responses=decode_responses, blocking=blocking)
+
+
+def shard_index(key, count=None):
+    """
+    The shard a routing key lives on. CRC32 is stable across processes and
+    restarts (unlike hash()), so every producer, worker and API instance agrees.
+    """
+    count = count or shard_count()
+    if count < 2:
+        return 0
+    return zlib.crc32(str(key).encode("utf-8")) % count
+
+
+def execute_chunked(client, items, add, chunk_size=None, transaction=False):
+    """
+    Queue `add(pipe, item)` for every item, sending a pipeline every `chunk_size`
+    items so huge batches neither buffer unboundedly nor stall the server.
+    Returns the replies of all chunks in order.
+    """
+    chunk_size = chunk_size or Config.REDIS_PIPELINE_CHUNK
+    replies = []
+    pipe = client.pipeline(transaction=transaction)
+    for index, item in enumerate(items, 1):
+        add(pipe, item)
+        if index % chunk_size == 0:
+            replies += pipe.execute()
+    # Executing an empty pipeline is free: no round trip
+    replies += pipe.execute()
+    return replies
@@ -0,0 +1,81 @@
+import time
+import threading
+from utils.config import Config
+
+
+def task_type(task):
+    return str(task.get("type") or "default")
+
+
+class ServiceTimeStats:
+    """
+    A worker's rolling service times: one EWMA per task type plus the start time
+    of every task it is running. Published to the worker registry so schedulers
+    can estimate when a new task would finish on this worker.
+    """
+    def __init__(self, alpha=None):
+        self.alpha = alpha or Config.SERVICE_TIME_ALPHA
+        self.ewma = {}      # task type -> smoothed seconds per task
+        self.mean = None    # smoothed seconds over all types
+        self._running = {}  # in-flight key -> (task type, start time)
+        self._lock = threading.Lock()
+
+    def start(self, key, task):
+        with self._lock:
+            self._running[key] = (task_type(task), time.time())
+
+    def finish(self, key):
+        """Stop timing a task and fold its duration into the averages."""
+        with self._lock:
+            started = self._running.pop(key, None)
+            if started is None:
+                return None
+            kind, start = started
+            duration = time.time() - start
+            previous = self.ewma.get(kind)
+            self.ewma[kind] = duration if previous is None else previous + self.alpha * (duration - previous)
+            self.mean = duration if self.mean is None else self.mean + self.alpha * (duration - self.mean)
+            return duration
+
+    def snapshot(self, concurrency):
+        with self._lock:
+            return {
+                "ewma": {kind: round(seconds, 4) for kind, seconds in self.ewma.items()},
+                "mean": round(self.mean, 4) if self.mean is not None else None,
+                "concurrency": concurrency,
+                "running": [[kind, start] for kind, start in self._running.values()],
+            }
+
+
+def estimate(stats, kind):
+    """Expected service time of a `kind` task on a worker, from its published stats."""
+    seconds = stats.get("ewma", {}).get(kind)
+    if seconds is None:
+        seconds = stats.get("mean")
+    # No history yet: treat the worker as fast so it gets work and builds some
+    return seconds or 0.0
+
+
+def throughput(stats):
+    """Tasks per second a worker completes when busy: its concurrency over its mean service time."""
+    mean = stats.get("mean")
+    if not mean:
+        return 0.0
+    return max(int(stats.get("concurrency") or 1), 1) / mean
+
+
+def backlog(stats, load, now=None):
+    """
+    Seconds until a worker could start a new task: the time left on what it is
+    running (EWMA minus elapsed) plus its queued tasks, spread over its concurrency.
+    """
+    now = time.time() if now is None else now
+    running = stats.get("running", [])
+    remaining = sum(max(estimate(stats, kind) - (now - start), 0.0) for kind, start in running)
+    queued = max(load - len(running), 0) * estimate(stats, None)
+    return (remaining + queued) / max(int(stats.get("concurrency") or 1), 1)
+
+
+def expected_completion(stats, load, kind, now=None):
+    """Seconds until a new `kind` task would finish on a worker."""
+    return backlog(stats, load, now) + estimate(stats, kind)
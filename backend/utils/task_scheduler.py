@@ -1,8 +1,11 @@
 import random
-import redis
 import time
-import json
 from utils.logger import Logger
+from utils.redis_client import get_redis
+from task_queue.codec import encode_task
+from task_queue.claim_check import ClaimCheck
+from task_queue.priority_lanes import PriorityLanes
+from utils.worker_registry import WorkerRegistry
 
 class TaskSchedulerUtils:
     def __init__(self, workers=None):
@@ -13,36 +16,23 @@ class TaskSchedulerUtils:
         """
         self.workers = workers
         self.logger = Logger()
-        self.redis = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+        self.redis = get_redis()
+        self.registry = WorkerRegistry(self.redis)
+        self.claim_check = ClaimCheck(self.redis)
         # Queue names and prefixes
         self.main_queue = "task_queue"
         self.failed_queue = "tasks_failed"
         self.processing_prefix = "processing:"
-        self.heartbeat_prefix = "worker_status:"
+        self.lanes = PriorityLanes(self.redis, self.main_queue)
 
     def get_least_loaded_worker(self):
         """Get the worker with the fewest pending tasks (returns a worker ID or None)."""
-        active_workers = []
         try:
-            # Fetch all active worker heartbeat entries
-            for key in self.redis.keys(f"{self.heartbeat_prefix}*"):
-                data = self.redis.get(key)
-                if not data:
-                    continue
-                hb = json.loads(data)
-                wid = hb.get("worker_id")
-                proc_queue = hb.get("processing_queue")
-                if not wid or not proc_queue:
-                    continue
-                # Determine number of tasks in that worker's processing queue
-                try:
-                    load = self.redis.llen(proc_queue)
-                except Exception as e:
-                    self.logger.log(f"[TaskSchedulerUtils] Error getting load for {proc_queue}: {e}")
-                    load = float('inf')
-                active_workers.append((wid, load))
+            # Liveness and load come from the worker registry in one round trip
+            active_workers = self.registry.get_active_workers()
         except Exception as e:
             self.logger.log(f"[TaskSchedulerUtils] Error retrieving worker list: {e}")
+            active_workers = []
         # If a specific set of workers is provided, filter to those
         if self.workers:
             allowed_ids = set()
@@ -72,20 +62,29 @@ class TaskSchedulerUtils:
         task_id = task.get('id', 'N/A')
         if "submit_timestamp" not in task:
             task["submit_timestamp"] = time.time()
+        self.claim_check.offload(task)
         worker_id = self.get_least_loaded_worker()
         if worker_id:
             # Assign task to chosen worker's processing queue
             try:
-                task_json = json.dumps(task)
-                self.redis.rpush(f"{self.processing_prefix}{worker_id}", task_json)
-                self.logger.log(f"[TaskSchedulerUtils] Task {task_id} assigned to worker {worker_id}")
+                task_json = encode_task(task)
+                pipe = self.redis.pipeline(transaction=True)
+                pipe.rpush(f"{self.processing_prefix}{worker_id}", task_json)
+                self.registry.adjust_load(worker_id, 1, pipe=pipe)
+                pipe.execute()
+                self.logger.log("[TaskSchedulerUtils] Task %s assigned to worker %s",
+                                task_id, worker_id, category="task")
             except Exception as e:
                 self.logger.log(f"[TaskSchedulerUtils] Error assigning task {task_id} to {worker_id}: {e}")
+                self.claim_check.release(task)
         else:
             # No active worker available, queue task in main queue
             try:
-                task_json = json.dumps(task)
-                self.redis.rpush(self.main_queue, task_json)
-                self.logger.log(f"[TaskSchedulerUtils] No active worker. Task {task_id} queued in '{self.main_queue}'")
+                task_json = encode_task(task)
+                lane = self.lanes.name_for(task)
+                self.redis.rpush(lane, task_json)
+                self.logger.log("[TaskSchedulerUtils] No active worker. Task %s queued in '%s'",
+                                task_id, lane, category="task")
             except Exception as e:
                 self.logger.log(f"[TaskSchedulerUtils] Error queueing task {task_id} to main queue: {e}")
+                self.claim_check.release(task)
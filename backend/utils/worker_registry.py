@@ -0,0 +1,197 @@
+import time
+import json
+from utils.config import Config
+
+# KEYS: heartbeats, load, capacity, stats. ARGV: active cutoff, workers wanted, queue cap (0 = none).
+# Draws a few random registered workers and keeps up to ARGV[2] that are active and
+# have a free slot. Returns a flat list of worker id, free slots, load, stats JSON.
+SAMPLE_SCRIPT = """
+local wanted = tonumber(ARGV[2])
+local drawn = redis.call('ZRANDMEMBER', KEYS[1], wanted * 4, 'WITHSCORES')
+local picked, found = {}, 0
+for i = 1, #drawn, 2 do
+    if found >= wanted then
+        break
+    end
+    local worker = drawn[i]
+    if tonumber(drawn[i + 1]) >= tonumber(ARGV[1]) then
+        local load = math.max(tonumber(redis.call('HGET', KEYS[2], worker) or '0'), 0)
+        local capacity = tonumber(redis.call('HGET', KEYS[3], worker) or '1')
+        if tonumber(ARGV[3]) > 0 then
+            capacity = math.min(capacity, tonumber(ARGV[3]))
+        end
+        local slots = capacity - load
+        if slots > 0 then
+            found = found + 1
+            table.insert(picked, worker)
+            table.insert(picked, slots)
+            table.insert(picked, load)
+            table.insert(picked, redis.call('HGET', KEYS[4], worker) or '')
+        end
+    end
+end
+return picked
+"""
+
+
+def _parse_stats(raw):
+    try:
+        return json.loads(raw) if raw else {}
+    except (TypeError, ValueError):
+        return {}
+
+
+class WorkerRegistry:
+    """
+    Maintained index of worker liveness and load, replacing KEYS scans.
+
+    - workers:heartbeats  sorted set, worker_id -> last heartbeat time
+    - workers:load        hash, worker_id -> tasks in its processing queue
+    - workers:info        hash, worker_id -> status JSON for dashboards
+    - workers:capacity    hash, worker_id -> tasks it can run at once
+    - workers:stats       hash, worker_id -> service-time stats JSON (EWMA per task type, running tasks)
+
+    Workers write their exact load on every heartbeat; schedulers bump it
+    with HINCRBY as they assign, so the view stays current in between.
+    """
+    def __init__(self, redis_client, active_window=None):
+        self.redis = redis_client
+        self.heartbeats_key = "workers:heartbeats"
+        self.load_key = "workers:load"
+        self.info_key = "workers:info"
+        self.capacity_key = "workers:capacity"
+        self.stats_key = "workers:stats"
+        # Pub/sub channel workers publish to whenever they free up a slot
+        self.idle_channel = "workers:idle"
+        self.active_window = active_window if active_window is not None else Config.WORKER_ACTIVE_WINDOW
+        # Cap on a worker's processing queue, below the capacity it reports (0 = no cap)
+        self.max_queue = Config.ADMISSION_MAX_WORKER_QUEUE
+        self._sample = redis_client.register_script(SAMPLE_SCRIPT)
+
+    def _capacity(self, reported):
+        capacity = int(reported)
+        return min(capacity, self.max_queue) if self.max_queue > 0 else capacity
+
+    def heartbeat(self, worker_id, info, load, capacity=1, stats=None):
+        """Record a worker heartbeat together with its current load, capacity, status and service times."""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zadd(self.heartbeats_key, {worker_id: info.get("last_heartbeat", time.time())})
+        pipe.hset(self.load_key, worker_id, load)
+        pipe.hset(self.capacity_key, worker_id, capacity)
+        pipe.hset(self.info_key, worker_id, json.dumps(info))
+        if stats is not None:
+            self.report_stats(worker_id, stats, pipe=pipe)
+        pipe.execute()
+
+    def report_stats(self, worker_id, stats, pipe=None):
+        """Publish a worker's service-time stats; pass a pipeline to batch it."""
+        (pipe or self.redis).hset(self.stats_key, worker_id, json.dumps(stats))
+
+    def adjust_load(self, worker_id, delta, pipe=None):
+        """Increment a worker's load; pass a pipeline to batch it with the enqueue."""
+        (pipe or self.redis).hincrby(self.load_key, worker_id, delta)
+
+    def get_active_workers(self):
+        """Return [(worker_id, load)] for workers that heartbeated within the active window."""
+        cutoff = time.time() - self.active_window
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrangebyscore(self.heartbeats_key, cutoff, "+inf")
+        pipe.hgetall(self.load_key)
+        worker_ids, loads = pipe.execute()
+        return [(wid, max(0, int(loads.get(wid, 0)))) for wid in worker_ids]
+
+    def get_free_slots(self):
+        """Return [(worker_id, free_slots)] for active workers with spare capacity."""
+        cutoff = time.time() - self.active_window
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrangebyscore(self.heartbeats_key, cutoff, "+inf")
+        pipe.hgetall(self.load_key)
+        pipe.hgetall(self.capacity_key)
+        worker_ids, loads, capacities = pipe.execute()
+        free = []
+        for wid in worker_ids:
+            slots = self._capacity(capacities.get(wid, 1)) - max(0, int(loads.get(wid, 0)))
+            if slots > 0:
+                free.append((wid, slots))
+        return free
+
+    def get_candidates(self):
+        """
+        Return [(worker_id, free_slots, load, stats)] for active workers with spare
+        capacity, read in one pipeline of four commands.
+        """
+        cutoff = time.time() - self.active_window
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrangebyscore(self.heartbeats_key, cutoff, "+inf")
+        pipe.hgetall(self.load_key)
+        pipe.hgetall(self.capacity_key)
+        pipe.hgetall(self.stats_key)
+        worker_ids, loads, capacities, stats = pipe.execute()
+        candidates = []
+        for wid in worker_ids:
+            load = max(0, int(loads.get(wid, 0)))
+            slots = self._capacity(capacities.get(wid, 1)) - load
+            if slots > 0:
+                candidates.append((wid, slots, load, _parse_stats(stats.get(wid))))
+        return candidates
+
+    def sample_candidates(self, count=2):
+        """
+        Like get_candidates, but for at most `count` random active workers with
+        spare capacity, chosen server-side. The work per call does not grow with
+        the number of workers.
+        """
+        cutoff = time.time() - self.active_window
+        replies = self._sample(
+            keys=[self.heartbeats_key, self.load_key, self.capacity_key, self.stats_key],
+            args=[cutoff, count, self.max_queue])
+        return [(wid, int(slots), int(load), _parse_stats(stats))
+                for wid, slots, load, stats in zip(replies[::4], replies[1::4], replies[2::4], replies[3::4])]
+
+    def notify_idle(self, worker_id):
+        """Tell event-driven schedulers that a worker has a free slot."""
+        self.redis.publish(self.idle_channel, worker_id)
+
+    def get_active_stats(self):
+        """Return [(worker_id, stats)] for every active worker, busy or not."""
+        cutoff = time.time() - self.active_window
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrangebyscore(self.heartbeats_key, cutoff, "+inf")
+        pipe.hgetall(self.stats_key)
+        worker_ids, stats = pipe.execute()
+        return [(wid, _parse_stats(stats.get(wid))) for wid in worker_ids]
+
+    def get_stale_workers(self, timeout):
+        """Return worker IDs whose last heartbeat is older than `timeout` seconds."""
+        return self.redis.zrangebyscore(self.heartbeats_key, "-inf", f"({time.time() - timeout}")
+
+    def get_worker_info(self):
+        """Return the last reported status dict of every registered worker."""
+        workers = []
+        for raw in self.redis.hvals(self.info_key):
+            try:
+                workers.append(json.loads(raw))
+            except (TypeError, ValueError):
+                continue
+        return workers
+
+    def retire(self, worker_id):
+        """
+        Take a worker out of scheduling at once, leaving its recovery to the monitor:
+        its heartbeat is marked stale, so the monitor requeues whatever is still
+        placed on it and then removes it, as for a worker that died.
+        """
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zadd(self.heartbeats_key, {worker_id: 0})
+        pipe.hset(self.capacity_key, worker_id, 0)
+        pipe.execute()
+
+    def remove(self, worker_id):
+        """Drop a worker from every registry structure."""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zrem(self.heartbeats_key, worker_id)
+        pipe.hdel(self.load_key, worker_id)
+        pipe.hdel(self.info_key, worker_id)
+        pipe.hdel(self.capacity_key, worker_id)
+        pipe.hdel(self.stats_key, worker_id)
+        pipe.execute()
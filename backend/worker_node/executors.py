@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from worker_node.task_handler import TaskHandler
+
+# One TaskHandler per pool process, created on its first task
+_child_handler = None
+
+
+def run_task_in_child(task):
+    """Process-pool entry point: run TaskHandler.handle_task inside a child process."""
+    global _child_handler
+    if _child_handler is None:
+        _child_handler = TaskHandler()
+    return _child_handler.handle_task(task)
+
+
+class AsyncioExecutor:
+    """
+    Runs coroutine handlers on a private event loop in a background thread.
+    Mirrors the concurrent.futures submit()/shutdown() interface so the
+    worker can treat it like any other pool.
+    """
+    def __init__(self, max_workers):
+        self.loop = asyncio.new_event_loop()
+        self._semaphore = None
+        self._max_workers = max_workers
+        self._thread = threading.Thread(target=self._run_loop, name="worker-asyncio", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _bounded(self, fn, *args):
+        # Created on first use so it belongs to the worker loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_workers)
+        async with self._semaphore:
+            return await fn(*args)
+
+    def submit(self, fn, *args):
+        """Schedule coroutine function `fn(*args)`; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(self._bounded(fn, *args), self.loop)
+
+    def shutdown(self, wait=True):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if wait:
+            self._thread.join()
+
+
+def create_executor(mode, concurrency):
+    """Build the task executor for a worker mode ("thread", "asyncio" or "process")."""
+    if mode == "process":
+        return ProcessPoolExecutor(max_workers=concurrency)
+    if mode == "thread":
+        return ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="worker-task")
+    if mode == "asyncio":
+        return AsyncioExecutor(concurrency)
+    raise ValueError(f"Unknown worker mode: {mode}")
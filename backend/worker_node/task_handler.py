@@ -1,4 +1,5 @@
 from utils.logger import Logger
+from task_queue.claim_check import ClaimCheck
 
 class TaskHandler:
     """
@@ -7,6 +8,8 @@ class TaskHandler:
     """
     def __init__(self):
         self.logger = Logger()
+        # Resolves payloads the scheduler moved to the blob store
+        self.claim_check = ClaimCheck()
     
     def handle_task(self, task):
         """
@@ -14,12 +17,12 @@ class TaskHandler:
         Customize this to suit your workload.
         """
         task_id = task.get("id", "Unknown")
-        self.logger.log(f"Handling task {task_id}")
+        self.logger.log("Handling task %s", task_id, category="task")
         
         # Add your task logic here, e.g.:
         result = self._run_task_logic(task)
         
-        self.logger.log(f"Task {task_id} completed with result: {result}")
+        self.logger.log("Task %s completed with result: %s", task_id, result, category="task")
         return {"task_id": task_id, "status": "completed", "result": result}
 
     def _run_task_logic(self, task):
@@ -29,7 +32,7 @@ class TaskHandler:
         """
         # Example: if your task has a "type" or "action", handle accordingly
         # if task["type"] == "data_processing":
-        #     return self._process_data(task["payload"])
+        #     return self._process_data(self.claim_check.load_payload(task))
         # else:
         #     return "Unsupported task type"
         return "Generic success"
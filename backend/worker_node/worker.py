@@ -1,50 +1,232 @@
 import time
 import random
 import os
-import json
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures.process import BrokenProcessPool
 from task_queue.redis_queue import RedisQueue
+from task_queue.stream_queue import StreamQueue
+from task_queue.codec import encode_task, decode_task
+from task_queue.claim_check import ClaimCheck
+from task_queue.result_backend import ResultBackend
+from task_queue.delayed_tasks import DelayedTasks
+from task_queue.retry_policy import RetryPolicies
+from task_queue.task_leases import TaskLeases
+from utils.config import Config
 from utils.logger import Logger
+from utils.redis_client import shard_count, shard_index
+from utils.worker_registry import WorkerRegistry
+from utils.service_stats import ServiceTimeStats, task_type
+from utils.metrics import metrics, redis_latency
+from worker_node.executors import create_executor, run_task_in_child
+
+QUEUE_WAIT = metrics.histogram(
+    "task_queue_wait_seconds", "Time from submission (or due time) to pickup by a worker", ["type"])
+SERVICE_TIME = metrics.histogram("task_service_seconds", "Time a worker spent running a task", ["type"])
+TASKS_FINISHED = metrics.counter("worker_tasks_finished_total", "Tasks finished by this worker, by outcome", ["outcome"])
+IN_FLIGHT = metrics.gauge("worker_tasks_in_flight", "Tasks this worker is running")
+
 
 class Worker:
-    def __init__(self):
+    def __init__(self, mode=None, concurrency=None, prefetch=None, handler=None):
         # Get human-readable ID from environment or default to '1'
         index = os.getenv("WORKER_INDEX", "1")
         self.worker_id = f"Worker-{index}"
         
-        self.redis_queue = RedisQueue()
+        # "list" uses task_queue + processing:<id>; "stream" reads a consumer group as this worker
+        self.queue_engine = Config.QUEUE_ENGINE
         self.logger = Logger()
+        # Failed tasks are retried with backoff through the scheduler's delay index
+        self.retry_policies = RetryPolicies()
+        # Values the metric "type" label may take; see _metric_type
+        self.metric_types = {"default", *self.retry_policies.per_type,
+                             *(name.strip() for name in Config.METRICS_TASK_TYPES.split(",") if name.strip())}
+        self._lease_caps = {}  # lease -> latest deadline a renewal may set
+        self._claim_caps = {}  # stream message ID -> time after which its claim is no longer renewed
+
+        # With REDIS_SHARDS the worker serves its home shard, and helps out on
+        # another one only while idle at home and that one has a backlog
+        self.shard_count = shard_count()
+        if Config.WORKER_SHARD >= 0:
+            self.home_shard = Config.WORKER_SHARD % self.shard_count
+        elif index.isdigit() and int(index) > 0:
+            self.home_shard = (int(index) - 1) % self.shard_count
+        else:
+            self.home_shard = shard_index(self.worker_id, self.shard_count)
+        self._queues = {}  # shard -> queue, reused when probing and moving
+        self._last_probe = 0
+        self._bind(self.home_shard)
 
         self.processing_queue_name = f"processing:{self.worker_id}"
         self.failed_queue_name = "tasks_failed"
 
         self.heartbeat_interval = 30  # seconds
-        self.heartbeat_key = f"worker_status:{self.worker_id}"
+        # Longest server-side block on the main queue when nothing is assigned to us
+        self.fetch_timeout = Config.WORKER_FETCH_TIMEOUT
+
+        # Execution mode: "serial" keeps the one-task loop, "thread"/"asyncio"/"process" run a pool
+        self.mode = mode or Config.WORKER_MODE
+        if self.mode == "serial":
+            self.concurrency = 1
+        else:
+            default_concurrency = (os.cpu_count() or 1) if self.mode == "process" else 1
+            self.concurrency = concurrency or Config.WORKER_CONCURRENCY or default_concurrency
+        # In-flight window: tasks taken from the processing queue but not yet acknowledged
+        self.prefetch = max(prefetch or Config.WORKER_PREFETCH or self.concurrency, self.concurrency)
+        if handler is None:
+            if self.mode == "asyncio":
+                handler = self.process_task_async
+            elif self.mode == "process":
+                handler = run_task_in_child
+            else:
+                handler = self.process_task
+        if self.mode == "asyncio" and not asyncio.iscoroutinefunction(handler):
+            raise ValueError("asyncio mode needs a coroutine function handler")
+        self.handler = handler
+
+        # Service times per task type, published for latency-aware scheduling
+        self.service_times = ServiceTimeStats()
+        self._in_flight = Counter()  # raw task JSON -> copies currently in flight
+        self._in_flight_ids = {}     # raw task JSON -> task id, for status reporting
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Event()
+        # Process mode: crashes per raw task, and whether the pool needs rebuilding
+        self._crashes = Counter()
+        self._pool_broken = False
+
+    def _queue_for(self, shard):
+        if shard not in self._queues:
+            queue_class = StreamQueue if self.queue_engine == "stream" else RedisQueue
+            self._queues[shard] = queue_class(shard=shard)
+        return self._queues[shard]
+
+    def _bind(self, shard):
+        """Point every per-shard component at `shard`; a task is always finished on the shard it came from."""
+        self.shard = shard
+        self.redis_queue = self._queue_for(shard)
+        client = self.redis_queue.redis_client
+        self.registry = WorkerRegistry(client)
+        # Offloaded payloads are fetched by the handler through load_payload/open_payload
+        self.claim_check = ClaimCheck(client, shard=shard)
+        # Handler return values (or errors) are kept here for clients to fetch
+        self.results = ResultBackend(client)
+        stream = self.queue_engine == "stream"
+        self.delayed = DelayedTasks(client,
+                                    [self.redis_queue.main_queue_name] if stream else self.redis_queue.lanes.names,
+                                    stream=stream)
+        # List engine: each running task holds a lease the monitor reclaims if it expires.
+        # The stream engine gets the same from XAUTOCLAIM on idle pending entries.
+        self.leases = TaskLeases(client)
+
+    def _rebalance(self):
+        """
+        Called only when idle: nothing in flight and nothing to take on this shard.
+        Every SHARD_PROBE_INTERVAL, read each shard's backlog and go home if it
+        has one, else to the shard with the largest. Returns True if we moved.
+        """
+        if self.shard_count < 2 or time.time() - self._last_probe < Config.SHARD_PROBE_INTERVAL:
+            return False
+        self._last_probe = time.time()
+        try:
+            backlogs = [self._queue_for(shard).backlog() for shard in range(self.shard_count)]
+        except Exception as e:
+            self.logger.log(f"[{self.worker_id}] Error reading shard backlogs: {e}")
+            return False
+        if backlogs[self.home_shard]:
+            target = self.home_shard
+        elif backlogs[self.shard]:
+            return False
+        else:
+            busiest = max(range(self.shard_count), key=lambda shard: backlogs[shard])
+            target = busiest if backlogs[busiest] else self.home_shard
+        if target == self.shard:
+            return False
+        self._leave_shard()
+        self.logger.log(f"[{self.worker_id}] Moving from shard {self.shard} to shard {target} "
+                        f"({backlogs[target]} task(s) waiting there)")
+        self._bind(target)
+        self.update_heartbeat()
+        return True
+
+    def _leave_shard(self):
+        """
+        Stop taking work on the current shard and hand back anything placed on us
+        meanwhile. A placement racing this is requeued by that shard's monitor,
+        which sees our retired heartbeat as a dead worker.
+        """
+        try:
+            self.registry.retire(self.worker_id)
+            if self.queue_engine == "stream":
+                self.redis_queue.requeue_consumer(self.worker_id)
+            else:
+                self.redis_queue.lanes.requeue(self.processing_queue_name)
+        except Exception as e:
+            self.logger.log(f"[{self.worker_id}] Error leaving shard {self.shard}: {e}")
 
     def update_heartbeat(self, current_task_id=""):
+        if not current_task_id and self._in_flight_ids:
+            with self._lock:
+                current_task_id = ", ".join(self._in_flight_ids.values())
         data = {
             "worker_id": self.worker_id,
             "processing_queue": self.processing_queue_name,
             "status": "processing" if current_task_id else "idle",
             "current_task_id": current_task_id,
+            "shard": self.shard,
             "last_heartbeat": time.time()
         }
         try:
-            self.redis_queue.redis_client.set(
-                self.heartbeat_key,
-                json.dumps(data),
-                ex=self.heartbeat_interval * 2
-            )
+            # Publish the exact load so the registry never drifts for long
+            if self.queue_engine == "stream":
+                load = self.prefetch - self._free_slots()
+            else:
+                load = self.redis_queue.redis_client.llen(self.processing_queue_name)
+            self.registry.heartbeat(self.worker_id, data, load, capacity=self.prefetch,
+                                    stats=self.service_times.snapshot(self.concurrency))
         except Exception as e:
             self.logger.log(f"[{self.worker_id}] Error updating heartbeat: {e}")
 
+    def _notify_idle(self):
+        try:
+            self.registry.notify_idle(self.worker_id)
+        except Exception as e:
+            self.logger.log(f"[{self.worker_id}] Error publishing idle notification: {e}")
+
     def process_task(self, task):
         task_id = task.get('id', 'unknown_id')
-        self.logger.log(f"[{self.worker_id}] Processing task {task_id}")
+        self.logger.log("[%s] Processing task %s", self.worker_id, task_id, category="task")
         time.sleep(random.uniform(1, 3))
-        self.logger.log(f"[{self.worker_id}] Completed task {task_id}")
+        self.logger.log("[%s] Completed task %s", self.worker_id, task_id, category="task")
+
+    async def process_task_async(self, task):
+        task_id = task.get('id', 'unknown_id')
+        self.logger.log("[%s] Processing task %s", self.worker_id, task_id, category="task")
+        await asyncio.sleep(random.uniform(1, 3))
+        self.logger.log("[%s] Completed task %s", self.worker_id, task_id, category="task")
 
     def run(self):
-        self.logger.log(f"[{self.worker_id}] Started. Awaiting tasks in '{self.processing_queue_name}'.")
+        source = self.redis_queue.main_queue_name if self.queue_engine == "stream" else self.processing_queue_name
+        self.logger.log(f"[{self.worker_id}] Started in {self.mode} mode on shard {self.shard}. "
+                        f"Awaiting tasks in '{source}'.")
+        if Config.METRICS_PORT:
+            try:
+                metrics.serve(Config.METRICS_PORT)
+                self.logger.log(f"[{self.worker_id}] Serving metrics on port {Config.METRICS_PORT}")
+            except OSError as e:
+                # Most likely another process on this host took the port; keep working without it
+                self.logger.log(f"[{self.worker_id}] Not serving metrics on port {Config.METRICS_PORT}: {e}",
+                                level="warning")
+        renew = self._renew_claims if self.queue_engine == "stream" else self._renew_leases
+        threading.Thread(target=renew, daemon=True).start()
+        if self.queue_engine == "stream":
+            self._run_stream()
+        elif self.mode == "serial":
+            self._run_serial()
+        else:
+            self._run_concurrent()
+
+    def _run_serial(self):
         last_heartbeat_time = 0
 
         while True:
@@ -57,41 +239,441 @@ class Worker:
                 task_json = self.redis_queue.redis_client.lindex(self.processing_queue_name, 0)
                 if task_json:
                     try:
-                        task = json.loads(task_json)
+                        task = decode_task(task_json)
                     except Exception as parse_error:
                         self.logger.log(f"[{self.worker_id}] Error decoding task JSON: {parse_error}")
                         self.redis_queue.redis_client.lpop(self.processing_queue_name)
                         continue
 
                     task_id = task.get('id', 'unknown_id')
-                    self.logger.log(f"[{self.worker_id}] Picked up task {task_id}")
+                    self.logger.log("[%s] Picked up task %s", self.worker_id, task_id, category="task")
+                    self._grant_leases([(task, task_json)])
                     self.update_heartbeat(current_task_id=task_id)
                     last_heartbeat_time = time.time()
 
+                    self._task_started(task)
                     try:
-                        self.process_task(task)
-                        removed = self.redis_queue.redis_client.lpop(self.processing_queue_name)
-                        if removed is None:
+                        value = self.handler(task)
+                        self._task_finished(task)
+                        # Acknowledge and record the result in one transaction
+                        pipe = self.redis_queue.redis_client.pipeline(transaction=True)
+                        self.redis_queue.scripts.ack(self.processing_queue_name, task_json, self.worker_id, client=pipe)
+                        self.results.store(self.results.build(task_id, value, worker_id=self.worker_id), client=pipe)
+                        self._release_lease(task, pipe)
+                        with redis_latency.time(op="ack"):
+                            removed = pipe.execute()[0]
+                        if not removed:
                             self.logger.log(f"[{self.worker_id}] WARNING: Task {task_id} not found in queue during removal.")
                         else:
-                            self.logger.log(f"[{self.worker_id}] Confirmed completion for task {task_id}")
+                            self.claim_check.release(task)
+                            TASKS_FINISHED.inc(outcome="completed")
+                            self.logger.log("[%s] Confirmed completion for task %s",
+                                            self.worker_id, task_id, category="task")
                     except Exception as process_error:
-                        self.logger.log(f"[{self.worker_id}] Error processing task {task_id}: {process_error}")
+                        self._task_finished(task)
+                        self.logger.log("[%s] Error processing task %s: %s",
+                                        self.worker_id, task_id, process_error, level="error")
                         try:
-                            self.redis_queue.redis_client.lpush(self.failed_queue_name, task_json)
-                            self.redis_queue.redis_client.lpop(self.processing_queue_name)
-                            self.logger.log(f"[{self.worker_id}] Moved failed task {task_id} to '{self.failed_queue_name}'")
+                            pipe = self.redis_queue.redis_client.pipeline(transaction=True)
+                            retry_in = self._fail_or_retry(task, task_json, process_error, pipe)
+                            self._release_lease(task, pipe)
+                            with redis_latency.time(op="fail"):
+                                pipe.execute()
+                            self._log_failure(task_id, retry_in)
                         except Exception as move_error:
-                            self.logger.log(f"[{self.worker_id}] CRITICAL: Failed to move task {task_id}: {move_error}")
+                            self.logger.log(f"[{self.worker_id}] CRITICAL: Failed to move task {task_id}: {move_error}",
+                                            level="error")
                     finally:
                         self.update_heartbeat()
                         last_heartbeat_time = time.time()
+                        self._notify_idle()
                 else:
-                    time.sleep(1)
+                    # Nothing assigned to us: pull straight from the main queue, blocking server-side
+                    if not self.redis_queue.pull_task(self.processing_queue_name, timeout=self.fetch_timeout):
+                        self._rebalance()
             except Exception as loop_error:
                 self.logger.log(f"[{self.worker_id}] Unhandled error in worker loop: {loop_error}")
                 time.sleep(5)
 
+    def _run_concurrent(self):
+        """
+        Keep up to `prefetch` tasks from the processing queue running on a pool.
+        Tasks stay in the processing queue until acknowledged, so the monitor can
+        still recover them if this worker dies.
+        """
+        executor = create_executor(self.mode, self.concurrency)
+        last_heartbeat_time = 0
+        try:
+            while True:
+                now = time.time()
+                if now - last_heartbeat_time > self.heartbeat_interval:
+                    self.update_heartbeat()
+                    last_heartbeat_time = now
+
+                try:
+                    if self._pool_broken:
+                        # A child died; its tasks were released back to the window
+                        self.logger.log(f"[{self.worker_id}] Process pool broke. Starting a new one.")
+                        executor.shutdown(wait=False)
+                        executor = create_executor(self.mode, self.concurrency)
+                        self._pool_broken = False
+                    self._slot_freed.clear()
+                    if self._fill_window(executor):
+                        continue
+                    if self._free_slots() > 0:
+                        # Our queue is drained: block server-side on the main queue for more work
+                        if self.redis_queue.pull_task(self.processing_queue_name, timeout=self.fetch_timeout):
+                            self.registry.adjust_load(self.worker_id, 1)
+                        elif self._free_slots() == self.prefetch:
+                            self._rebalance()
+                    else:
+                        # Window is full; a completion wakes us to refill it
+                        self._slot_freed.wait(timeout=1)
+                except Exception as loop_error:
+                    self.logger.log(f"[{self.worker_id}] Unhandled error in worker loop: {loop_error}")
+                    time.sleep(5)
+        finally:
+            executor.shutdown(wait=True)
+
+    def _free_slots(self):
+        with self._lock:
+            return self.prefetch - sum(self._in_flight.values())
+
+    def _release_slot(self, key):
+        """Drop one in-flight copy of a task (raw JSON, or stream message ID) and wake the loop."""
+        with self._lock:
+            self._in_flight[key] -= 1
+            if self._in_flight[key] <= 0:
+                del self._in_flight[key]
+                self._in_flight_ids.pop(key, None)
+                self._claim_caps.pop(key, None)
+        self._slot_freed.set()
+
+    def _fill_window(self, executor):
+        """Start tasks from the head of the processing queue until the window is full."""
+        with self._lock:
+            in_flight = sum(self._in_flight.values())
+            snapshot = Counter(self._in_flight)
+        free = self.prefetch - in_flight
+        if free <= 0:
+            return 0
+
+        # Tasks already in flight sit at the head of the queue; look just past them
+        with redis_latency.time(op="fetch"):
+            window = self.redis_queue.redis_client.lrange(self.processing_queue_name, 0, in_flight + free - 1)
+        picked = []
+        for task_json in window:
+            if snapshot[task_json] > 0:
+                snapshot[task_json] -= 1
+                continue
+            if len(picked) >= free:
+                break
+            try:
+                picked.append((decode_task(task_json), task_json))
+            except Exception as parse_error:
+                self.logger.log(f"[{self.worker_id}] Error decoding task JSON: {parse_error}")
+                self.redis_queue.redis_client.lrem(self.processing_queue_name, 1, task_json)
+
+        # Lease the whole batch in one round trip before any of it can finish
+        self._grant_leases(picked)
+        started = 0
+        for task, task_json in picked:
+            task_id = task.get('id', 'unknown_id')
+            try:
+                future = executor.submit(self.handler, task)
+            except BrokenProcessPool:
+                # The pool died before taking it; it stays queued for the rebuilt pool
+                self._pool_broken = True
+                break
+            with self._lock:
+                self._in_flight[task_json] += 1
+                self._in_flight_ids[task_json] = str(task_id)
+            self.logger.log("[%s] Picked up task %s", self.worker_id, task_id, category="task")
+            self._task_started(task)
+            future.add_done_callback(lambda f, raw=task_json, t=task: self._on_task_done(f, raw, t))
+            started += 1
+        return started
+
+    def _on_task_done(self, future, task_json, task):
+        """Acknowledge or fail a finished task, then free its window slot."""
+        client = self.redis_queue.redis_client
+        task_id = task.get('id', 'unknown_id')
+        self._task_finished(task)
+        try:
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool):
+                self._pool_broken = True
+                with self._lock:
+                    self._crashes[task_json] += 1
+                    crashes = self._crashes[task_json]
+                if crashes < Config.WORKER_MAX_CRASHES:
+                    # Leave it in the processing queue; the window picks it up again
+                    self.logger.log(f"[{self.worker_id}] Task {task_id} lost its process ({crashes} crash(es)). Requeued.")
+                    return
+                error = RuntimeError(f"task crashed its worker process {crashes} times")
+                retryable = False
+            else:
+                retryable = True
+            with self._lock:
+                self._crashes.pop(task_json, None)
+            # The transition script and the idle notification share one round trip
+            pipe = client.pipeline(transaction=False)
+            if error is None:
+                self.redis_queue.scripts.ack(self.processing_queue_name, task_json, self.worker_id, client=pipe)
+                self.results.store(self.results.build(task_id, future.result(), worker_id=self.worker_id), client=pipe)
+            else:
+                self.logger.log("[%s] Error processing task %s: %s", self.worker_id, task_id, error, level="error")
+                retry_in = self._fail_or_retry(task, task_json, error, pipe, retryable=retryable)
+            self._release_lease(task, pipe)
+            self.registry.report_stats(self.worker_id, self.service_times.snapshot(self.concurrency), pipe=pipe)
+            pipe.publish(self.registry.idle_channel, self.worker_id)
+            with redis_latency.time(op="ack" if error is None else "fail"):
+                pipe.execute()
+            if error is None:
+                self.claim_check.release(task)
+                TASKS_FINISHED.inc(outcome="completed")
+                self.logger.log("[%s] Confirmed completion for task %s", self.worker_id, task_id, category="task")
+            else:
+                self._log_failure(task_id, retry_in)
+        except Exception as ack_error:
+            self.logger.log(f"[{self.worker_id}] CRITICAL: Failed to acknowledge task {task_id}: {ack_error}",
+                            level="error")
+        finally:
+            self._release_slot(task_json)
+
+    def _run_stream(self):
+        """
+        Stream-engine loop: read up to the free window from the consumer group in
+        one blocking XREADGROUP, and periodically claim entries other workers left idle.
+        """
+        executor = None if self.mode == "serial" else create_executor(self.mode, self.concurrency)
+        last_heartbeat_time = 0
+        last_claim_time = 0
+        try:
+            while True:
+                now = time.time()
+                if now - last_heartbeat_time > self.heartbeat_interval:
+                    self.update_heartbeat()
+                    last_heartbeat_time = now
+
+                try:
+                    if self._pool_broken:
+                        # Tasks from the broken pool stay pending and are reclaimed later
+                        self.logger.log(f"[{self.worker_id}] Process pool broke. Starting a new one.")
+                        executor.shutdown(wait=False)
+                        executor = create_executor(self.mode, self.concurrency)
+                        self._pool_broken = False
+                    self._slot_freed.clear()
+                    free = self._free_slots()
+                    if free <= 0:
+                        self._slot_freed.wait(timeout=1)
+                        continue
+
+                    tasks = []
+                    if now - last_claim_time > self.redis_queue.claim_idle_ms / 1000:
+                        tasks = self.redis_queue.claim_stale_tasks(self.worker_id, count=free)
+                        last_claim_time = now
+                    if len(tasks) < free:
+                        tasks += self.redis_queue.get_tasks(
+                            self.worker_id, count=free - len(tasks), block=self.fetch_timeout)
+                    if not tasks and self._free_slots() == self.prefetch and self._rebalance():
+                        last_claim_time = 0
+                        continue
+
+                    for task in tasks:
+                        task_id = task.get('id', 'unknown_id')
+                        self.logger.log("[%s] Picked up task %s", self.worker_id, task_id, category="task")
+                        with self._lock:
+                            self._in_flight[task['_id']] += 1
+                            self._in_flight_ids[task['_id']] = str(task_id)
+                            self._claim_caps.setdefault(task['_id'], time.time() + Config.LEASE_MAX_RUNTIME)
+                        self._task_started(task)
+                        if executor is None:
+                            try:
+                                value = self.handler(task)
+                                self._finish_stream_task(task, None, value)
+                            except Exception as process_error:
+                                self._finish_stream_task(task, process_error)
+                        else:
+                            try:
+                                future = executor.submit(self.handler, task)
+                            except BrokenProcessPool:
+                                # Never started: free its slot; the entry stays pending and is reclaimed later
+                                self._pool_broken = True
+                                self._task_finished(task)
+                                self._release_slot(task['_id'])
+                                continue
+                            future.add_done_callback(lambda f, t=task: self._finish_stream_task(
+                                t, f.exception(), None if f.exception() else f.result()))
+                except Exception as loop_error:
+                    self.logger.log(f"[{self.worker_id}] Unhandled error in worker loop: {loop_error}")
+                    time.sleep(5)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    def _finish_stream_task(self, task, error, value=None):
+        """Acknowledge or fail a finished stream task, record its result, then free its window slot."""
+        task_id = task.get('id', 'unknown_id')
+        self._task_finished(task)
+        try:
+            if isinstance(error, BrokenProcessPool):
+                # Not acknowledged: it stays pending and XAUTOCLAIM hands it out again
+                self._pool_broken = True
+                self.logger.log(f"[{self.worker_id}] Task {task_id} lost its process. Left pending for reclaim.")
+                return
+            pipe = self.redis_queue.redis_client.pipeline(transaction=True)
+            if error is None:
+                self.redis_queue.confirm_task_completion(self.worker_id, task, client=pipe)
+                self.results.store(self.results.build(task_id, value, worker_id=self.worker_id), client=pipe)
+            else:
+                self.logger.log("[%s] Error processing task %s: %s", self.worker_id, task_id, error, level="error")
+                retry_in = self._fail_or_retry(task, task['_raw'], error, pipe)
+            self.registry.report_stats(self.worker_id, self.service_times.snapshot(self.concurrency), pipe=pipe)
+            pipe.publish(self.registry.idle_channel, self.worker_id)
+            with redis_latency.time(op="ack" if error is None else "fail"):
+                pipe.execute()
+            if error is None:
+                self.claim_check.release(task)
+                TASKS_FINISHED.inc(outcome="completed")
+            else:
+                self._log_failure(task_id, retry_in)
+        except Exception as ack_error:
+            self.logger.log(f"[{self.worker_id}] CRITICAL: Failed to acknowledge task {task_id}: {ack_error}",
+                            level="error")
+        finally:
+            self._release_slot(task['_id'])
+
+    def _grant_leases(self, picked):
+        """Lease [(task, raw task)] just picked up from our processing queue."""
+        if self.queue_engine == "stream" or not picked:
+            return
+        grants = [(task.get('id', 'unknown_id'), self.redis_queue.lanes.name_for(task), task_json)
+                  for task, task_json in picked]
+        try:
+            caps = self.leases.grant_many(self.processing_queue_name, self.worker_id, grants)
+        except Exception as e:
+            # Without a lease the task is still recovered if this worker dies
+            self.logger.log(f"[{self.worker_id}] Error granting task leases: {e}")
+            return
+        with self._lock:
+            self._lease_caps.update(caps)
+
+    def _release_lease(self, task, pipe):
+        lease = self.leases.lease_for(self.processing_queue_name, task.get('id', 'unknown_id'))
+        with self._lock:
+            self._lease_caps.pop(lease, None)
+        self.leases.release(lease, pipe=pipe)
+
+    def _renew_leases(self):
+        """Keep extending the leases of running tasks, up to their maximum runtime."""
+        while True:
+            time.sleep(self.leases.timeout / 3)
+            now = time.time()
+            with self._lock:
+                # Past its cap a lease is left to expire so the monitor reclaims the task
+                for lease in [lease for lease, cap in self._lease_caps.items() if cap <= now]:
+                    del self._lease_caps[lease]
+                caps = dict(self._lease_caps)
+            try:
+                self.leases.renew(caps)
+            except Exception as e:
+                self.logger.log(f"[{self.worker_id}] Error renewing task leases: {e}")
+
+    def _renew_claims(self):
+        """
+        Stream engine: keep resetting the idle time of running entries, so a task
+        that outlives STREAM_CLAIM_IDLE_MS is not claimed and run by another
+        worker. Renewal stops LEASE_MAX_RUNTIME after pickup, as for leases.
+        """
+        while True:
+            time.sleep(self.redis_queue.claim_idle_ms / 3000)
+            now = time.time()
+            with self._lock:
+                message_ids = [message_id for message_id, cap in self._claim_caps.items() if cap > now]
+            try:
+                self.redis_queue.renew_claims(self.worker_id, message_ids)
+            except Exception as e:
+                self.logger.log(f"[{self.worker_id}] Error renewing stream claims: {e}")
+
+    def _fail_or_retry(self, task, task_json, error, pipe, retryable=True):
+        """
+        Queue a failed task's next step on `pipe`: its next attempt parked in the
+        delay index while its retry policy allows, otherwise the failed queue with
+        the attempt history and last error. Returns the retry delay, or None when
+        the task was dead-lettered.
+        """
+        task_id = task.get('id', 'unknown_id')
+        attempts = int(task.get("attempts", 0)) + 1
+        history = list(task.get("attempt_history", [])) + [{
+            "attempt": attempts,
+            "error": str(error),
+            "error_type": type(error).__name__,
+            "worker_id": self.worker_id,
+            "failed_at": time.time(),
+        }]
+        # Internal fields are rebuilt on the next pickup; offloaded payloads stay in the blob store
+        stored = {k: v for k, v in task.items()
+                  if not k.startswith("_") and k != "processing_start_timestamp"
+                  and not (k == "payload" and "payload_ref" in task)}
+        stored.update(attempts=attempts, attempt_history=history)
+        try:
+            policy = self.retry_policies.for_task(task)
+        except ValueError as policy_error:
+            self.logger.log(f"[{self.worker_id}] Task {task_id} has an invalid retry policy: {policy_error}")
+            policy, retryable = None, False
+        if retryable and policy.should_retry(error, attempts):
+            delay = policy.backoff(attempts)
+            due = time.time() + delay
+            stored["due_timestamp"] = due
+            if self.queue_engine == "stream":
+                self.redis_queue.confirm_task_completion(self.worker_id, task, client=pipe)
+                self.delayed.park(self.redis_queue.main_queue_name, encode_task(stored), due, pipe=pipe)
+            else:
+                self.redis_queue.scripts.retry(
+                    self.processing_queue_name, self.delayed.key_for(self.redis_queue.lanes.name_for(task)),
+                    task_json, encode_task(stored), due, self.worker_id, client=pipe)
+            return delay
+        stored["last_error"] = str(error)
+        if self.queue_engine == "stream":
+            self.redis_queue.move_task_to_failed(self.worker_id, task, client=pipe, failed_json=encode_task(stored))
+        else:
+            self.redis_queue.scripts.fail(self.processing_queue_name, self.failed_queue_name, task_json,
+                                          self.worker_id, failed_json=encode_task(stored), client=pipe)
+        record = self.results.build(task_id, error=error, worker_id=self.worker_id)
+        record["attempts"] = attempts
+        self.results.store(record, client=pipe)
+        return None
+
+    def _metric_type(self, task):
+        """A task's type as a metric label: unknown types share "other", since each value is a whole series."""
+        kind = task_type(task)
+        return kind if kind in self.metric_types else "other"
+
+    def _task_started(self, task):
+        now = time.time()
+        self.service_times.start(id(task), task)
+        IN_FLIGHT.inc()
+        try:
+            ready = max(float(task.get("submit_timestamp", now)), float(task.get("due_timestamp", 0)))
+            QUEUE_WAIT.observe(max(now - ready, 0.0), type=self._metric_type(task))
+        except (TypeError, ValueError):
+            pass
+
+    def _task_finished(self, task):
+        duration = self.service_times.finish(id(task))
+        if duration is not None:
+            IN_FLIGHT.inc(-1)
+            SERVICE_TIME.observe(duration, type=self._metric_type(task))
+
+    def _log_failure(self, task_id, retry_in):
+        TASKS_FINISHED.inc(outcome="failed" if retry_in is None else "retried")
+        if retry_in is None:
+            self.logger.log("[%s] Moved failed task %s to '%s'",
+                            self.worker_id, task_id, self.failed_queue_name, category="task")
+        else:
+            self.logger.log("[%s] Task %s will be retried in %.1fs", self.worker_id, task_id, retry_in, category="task")
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1:
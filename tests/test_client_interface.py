@@ -1,7 +1,11 @@
 import unittest
-from backend.client_interface.api import app
+import asyncio
+from backend.client_interface.api import app, EVENT_EPOCH
+from backend.client_interface.async_api import MicroBatcher
+from backend.client_interface.admission import AdmissionController
+from backend.client_interface.task_submission import TaskSubmission
 from flask import json
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 class TestClientAPI(unittest.TestCase):
 
@@ -16,5 +20,137 @@ class TestClientAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn("Task task1 submitted successfully!", response.get_data(as_text=True))
 
+    @patch('backend.client_interface.api.task_scheduler')
+    def test_submit_tasks_rejects_invalid_entries(self, mock_scheduler):
+        mock_scheduler.assign_tasks.return_value = [
+            {"id": "task1", "status": "accepted", "worker_id": "Worker-1", "queue": "processing:Worker-1"}
+        ]
+        batch = {"tasks": [{"id": "task1", "payload": "p"}, {"id": "task2"}]}
+
+        with app.test_client() as client:
+            response = client.post('/submit_tasks', json=batch)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["accepted"], 1)
+        self.assertEqual(body["results"][1]["status"], "rejected")
+        mock_scheduler.assign_tasks.assert_called_once_with([{"id": "task1", "payload": "p"}])
+
+    @patch('backend.client_interface.api.ResultBackend')
+    def test_result_rejects_non_finite_wait(self, MockResults):
+        with app.test_client() as client:
+            responses = [client.get(f'/result/task1?wait={wait}') for wait in ("nan", "inf", "soon")]
+
+        self.assertEqual([response.status_code for response in responses], [400, 400, 400])
+        MockResults.assert_not_called()
+
+    @patch('backend.client_interface.api.status_snapshots')
+    def test_queue_status_pages_snapshot(self, mock_snapshots):
+        mock_snapshots.current.return_value = {
+            "version": 3, "generated_at": 0, "queue_size": 3, "counts": {"pending": 3}, "lanes": [],
+            "failed_tasks": [], "tasks": [{"id": f"task{i}", "payload": "p"} for i in range(3)]
+        }
+
+        with app.test_client() as client:
+            first = client.get('/queue_status?limit=2').get_json()
+            second = client.get(f"/queue_status?limit=2&cursor={first['next_cursor']}").get_json()
+            bad = client.get('/queue_status?cursor=-1')
+
+        self.assertEqual(first["queue_size"], 3)
+        self.assertEqual([t["id"] for t in first["tasks"] + second["tasks"]], ["task0", "task1", "task2"])
+        self.assertIsNone(second["next_cursor"])
+        self.assertEqual(bad.status_code, 400)
+
+    @patch('backend.client_interface.api.status_snapshots')
+    def test_events_resume_only_from_this_process(self, mock_snapshots):
+        snapshot = {"version": 3}
+        full, delta = {"queue_size": 3, "tasks": []}, {"queue_size": 3}
+        mock_snapshots.changes_since.side_effect = lambda version: (snapshot, delta if version == 2 else full)
+
+        def first_event(last_event_id):
+            with app.test_client() as client:
+                response = client.get('/events', headers={"Last-Event-ID": last_event_id}, buffered=False)
+                event = next(response.response)
+                response.close()
+            event = event.decode() if isinstance(event, bytes) else event
+            fields = dict(line.split(": ", 1) for line in event.strip().split("\n"))
+            return fields["id"], json.loads(fields["data"])["changes"]
+
+        self.assertEqual(first_event(f"{EVENT_EPOCH}-2"), (f"{EVENT_EPOCH}-3", delta))
+        # Same version number, but issued by another process or before a restart
+        self.assertEqual(first_event("0123abcd-3"), (f"{EVENT_EPOCH}-3", full))
+        self.assertEqual(first_event("3"), (f"{EVENT_EPOCH}-3", full))
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_concurrent_submissions_share_one_write(self):
+        flush = MagicMock(side_effect=lambda tasks: [{"id": t["id"], "status": "accepted"} for t in tasks])
+        batcher = MicroBatcher(flush, max_batch=3, max_delay=0.05, workers=1)
+
+        async def submit_all():
+            results = await asyncio.gather(*(batcher.submit({"id": f"task{i}"}) for i in range(4)))
+            await batcher.close()
+            return results
+
+        results = asyncio.run(submit_all())
+
+        # Three fill a batch at once; the fourth is flushed by the timer
+        self.assertEqual([len(call.args[0]) for call in flush.call_args_list], [3, 1])
+        self.assertEqual([r["id"] for r in results], ["task0", "task1", "task2", "task3"])
+
+
+class TestAdmissionControl(unittest.TestCase):
+
+    def test_full_queue_retry_after_follows_drain_rate(self):
+        redis_client = MagicMock()
+        redis_client.pipeline.return_value.execute.return_value = [[0, "depth", 50]]
+        controller = AdmissionController(redis_client, ["task_queue"], max_depth=10, rate=0)
+        controller.registry = MagicMock()
+        # Two slots at 0.5 s per task drain 4 tasks/s
+        controller.registry.get_active_stats.return_value = [("Worker-1", {"mean": 0.5, "concurrency": 2})]
+
+        decision = controller.check("client-a")
+
+        # 41 tasks over the limit at 4 tasks/s
+        self.assertEqual(decision["reason"], "depth")
+        self.assertEqual(decision["retry_after"], 11)
+
+    @patch('backend.client_interface.api.admission')
+    @patch('backend.client_interface.api.task_scheduler')
+    def test_retries_of_accepted_tasks_are_not_charged(self, mock_scheduler, mock_admission):
+        mock_scheduler.already_submitted.side_effect = lambda tasks: [task["id"] == "task1" for task in tasks]
+        mock_scheduler.assign_tasks.side_effect = lambda tasks: [{"id": task["id"], "status": "accepted"} for task in tasks]
+        mock_scheduler.assign_task.return_value = {"id": "task1", "status": "accepted", "duplicate": True}
+        mock_admission.check.return_value = None
+        batch = {"tasks": [{"id": "task1", "payload": "p"}, {"id": "task2", "payload": "p"}]}
+
+        with app.test_client() as client:
+            retried = client.post('/submit_task', json={"task": {"id": "task1", "payload": "p"}})
+            mixed = client.post('/submit_tasks', json=batch)
+
+        self.assertEqual((retried.status_code, mixed.status_code), (200, 200))
+        # Only the new task in the batch was paid for
+        mock_admission.check.assert_called_once()
+        self.assertEqual(mock_admission.check.call_args.kwargs["cost"], 1)
+        self.assertEqual(mock_admission.check.call_args.kwargs["tasks"], [{"id": "task2", "payload": "p"}])
+
+    @patch('backend.client_interface.task_submission.time.sleep')
+    @patch('backend.client_interface.task_submission.requests.post')
+    def test_submission_backs_off_on_429(self, mock_post, mock_sleep):
+        throttled = MagicMock(status_code=429, headers={"Retry-After": "2"})
+        accepted = MagicMock(status_code=200, headers={})
+        accepted.json.return_value = {"message": "Task task1 submitted successfully!"}
+        mock_post.side_effect = [throttled, accepted]
+        client = TaskSubmission(client_id="client-a")
+
+        self.assertIn("message", client.submit_task({"id": "task1", "payload": "p"}))
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(mock_post.call_args.kwargs["headers"], {"X-Client-ID": "client-a"})
+        # Waited at least the server's Retry-After, and keeps pacing itself afterwards
+        self.assertGreaterEqual(max(call.args[0] for call in mock_sleep.call_args_list), 2)
+        self.assertGreater(client.pace, 0)
+
 if __name__ == '__main__':
     unittest.main()
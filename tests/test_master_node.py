@@ -1,6 +1,11 @@
 import unittest
+import redis
 from backend.master_node.scheduler import TaskScheduler
-from unittest.mock import patch
+from backend.task_queue.redis_queue import RedisQueue
+from backend.master_node.failure_handler import FailureHandler
+from backend.master_node.sharded_scheduler import ShardedScheduler
+from backend.utils.redis_client import shard_index
+from unittest.mock import MagicMock, patch
 
 class TestTaskScheduler(unittest.TestCase):
 
@@ -16,7 +21,121 @@ class TestTaskScheduler(unittest.TestCase):
         scheduler.assign_task(task)
         mock_queue.add_task_to_queue.assert_called_with(task)
 
+    @patch('backend.master_node.scheduler.RedisQueue')
+    def test_duplicate_submission_returns_original(self, MockRedisQueue):
+        scheduler = TaskScheduler()
+        original = {"id": "task1", "status": "accepted", "queue": "task_queue", "duplicate": True}
+        scheduler.idempotency.claim = lambda task: original
+
+        result = scheduler.assign_task({"id": "task1", "payload": "p"})
+
+        self.assertEqual(result, original)
+        MockRedisQueue.return_value.add_task_to_queue.assert_not_called()
+
+    @patch('backend.task_queue.redis_queue.get_redis')
+    @patch('backend.master_node.scheduler.RedisQueue')
+    def test_failed_enqueue_is_rejected_not_settled_as_accepted(self, MockRedisQueue, mock_get_redis):
+        mock_get_redis.return_value.rpush.side_effect = redis.ConnectionError("connection lost")
+        MockRedisQueue.return_value = RedisQueue()
+        scheduler = TaskScheduler()
+        scheduler._select_worker = lambda task=None: None
+        scheduler.idempotency = MagicMock()
+        scheduler.idempotency.claim.return_value = None
+        task = {"id": "task1", "payload": "p"}
+
+        result = scheduler.assign_task(task)
+
+        # A rejected settle frees the idempotency key, so the producer's retry is enqueued
+        self.assertEqual(result["status"], "rejected")
+        scheduler.idempotency.settle.assert_called_once_with(task, result)
+
+    @patch('backend.master_node.scheduler.RedisQueue')
+    def test_idle_notification_wakes_dispatch_to_the_freed_worker(self, MockRedisQueue):
+        class Stop(BaseException):
+            pass
+
+        scheduler = TaskScheduler(dispatch_mode="event")
+        scheduler._promote_due = MagicMock(return_value=0)
+        scheduler.registry = MagicMock()
+        # Every worker is busy (dispatch pass, then the wait) until Worker-2 reports a free slot
+        scheduler.registry.get_free_slots.side_effect = [[], [], [("Worker-2", 1)]]
+        scheduler.lanes = MagicMock()
+        scheduler.lanes.snapshot.return_value = ([1] + [0] * (scheduler.lane_policy.levels - 1),
+                                                 [5] + [None] * (scheduler.lane_policy.levels - 1))
+        pubsub = MockRedisQueue.return_value.blocking_client.pubsub.return_value
+        pubsub.get_message.side_effect = [{"type": "message", "data": "Worker-2"}, None]
+        scheduler._dispatch = MagicMock(side_effect=Stop)
+
+        with self.assertRaises(Stop):
+            scheduler.dispatch_events()
+
+        pubsub.subscribe.assert_called_once_with(scheduler.registry.idle_channel)
+        # The scheduler blocked on the notification instead of polling, then dispatched once woken
+        self.assertEqual(pubsub.get_message.call_args_list[0].kwargs, {"timeout": scheduler.block_timeout})
+        scheduler.lanes.pull.assert_not_called()
+        scheduler._dispatch.assert_called_once_with({"Worker-2": {0: 1}})
+
+    @patch('backend.master_node.scheduler.RedisQueue')
+    def test_rejected_batch_releases_offloaded_payloads(self, MockRedisQueue):
+        MockRedisQueue.return_value.redis_client.pipeline.return_value.execute.side_effect = \
+            redis.ConnectionError("connection lost")
+        scheduler = TaskScheduler()
+        scheduler.idempotency = MagicMock()
+        scheduler.idempotency.claim_many.side_effect = lambda tasks: [None] * len(tasks)
+        scheduler._slot_heap = lambda: []
+        scheduler.claim_check = MagicMock()
+        scheduler.claim_check.offload.side_effect = lambda task: task
+        large = {"id": "task1", "payload_ref": {"store": "local", "key": "k1"}}
+        small = {"id": "task2", "payload": "p"}
+
+        results = scheduler.assign_tasks([large, small])
+
+        self.assertEqual([result["status"] for result in results], ["rejected", "rejected"])
+        # Only the task whose payload went to the blob store has something to release
+        scheduler.claim_check.release.assert_called_once_with(large)
+
     # More tests for failure handling and task monitoring can be added here
 
+
+class TestFailureHandler(unittest.TestCase):
+
+    def test_recovers_workers_in_parallel_and_keeps_failed_ones_registered(self):
+        handler = FailureHandler(MagicMock())
+        handler.lanes = MagicMock()
+        handler.registry = MagicMock()
+
+        def requeue(queue):
+            if queue == "processing:W2":
+                raise ConnectionError("lost connection")
+            return 3
+        handler.lanes.requeue.side_effect = requeue
+
+        recovered = handler.handle_worker_failures(["W1", "W2", "W3"])
+
+        self.assertEqual(recovered, {"W1": 3, "W2": None, "W3": 3})
+        removed = sorted(call.args[0] for call in handler.registry.remove.call_args_list)
+        self.assertEqual(removed, ["W1", "W3"])
+
+
+class TestShardedScheduler(unittest.TestCase):
+
+    def test_batch_is_split_by_shard_and_keeps_submission_order(self):
+        schedulers = [MagicMock(), MagicMock()]
+        for shard, scheduler in enumerate(schedulers):
+            scheduler.assign_tasks.side_effect = lambda tasks, shard=shard: [
+                {"id": task["id"], "shard": shard} for task in tasks]
+        tasks = [{"id": f"task{i}", "payload": "p"} for i in range(10)]
+        tasks += [{"id": "a", "payload": "p", "routing_key": "user-1"},
+                  {"id": "b", "payload": "p", "routing_key": "user-1"}]
+
+        results = ShardedScheduler(schedulers).assign_tasks(tasks)
+
+        self.assertEqual([r["id"] for r in results], [t["id"] for t in tasks])
+        for task, result in zip(tasks, results):
+            self.assertEqual(result["shard"], shard_index(task.get("routing_key") or task["id"], 2))
+        # Both shards got work, and tasks sharing a routing key stay together
+        self.assertEqual({r["shard"] for r in results}, {0, 1})
+        self.assertEqual(results[-1]["shard"], results[-2]["shard"])
+
 if __name__ == '__main__':
     unittest.main()
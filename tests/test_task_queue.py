@@ -1,6 +1,15 @@
 import unittest
 from backend.task_queue.redis_queue import RedisQueue
-from unittest.mock import patch
+from backend.task_queue.stream_queue import StreamQueue
+from backend.task_queue.codec import TaskCodec
+from backend.task_queue.claim_check import ClaimCheck, LocalBlobStore, RedisBlobStore
+from backend.task_queue.priority_lanes import LanePolicy
+from backend.task_queue.delayed_tasks import parse_due_time
+from backend.task_queue.retry_policy import RetryPolicy
+from backend.task_queue.result_backend import ResultBackend
+from backend.task_queue.task_leases import TaskLeases
+import tempfile
+from unittest.mock import MagicMock, patch
 
 class TestRedisQueue(unittest.TestCase):
 
@@ -15,7 +24,186 @@ class TestRedisQueue(unittest.TestCase):
 
         mock_redis.rpush.assert_called_with("task_queue", '{"id": "task1"}')
 
+    @patch('backend.task_queue.redis_queue.redis.StrictRedis')
+    def test_move_task_to_failed_is_one_script_call(self, MockRedis):
+        queue = RedisQueue()
+        queue.scripts = MagicMock()
+        queue.scripts.fail.return_value = 1
+
+        queue.move_task_to_failed("processing:Worker-1", {"id": "task1", "_raw": '{"id": "task1"}'})
+
+        queue.scripts.fail.assert_called_once_with("processing:Worker-1", "tasks_failed", '{"id": "task1"}')
+        MockRedis.return_value.lpush.assert_not_called()
+
     # Add more tests for task removal, task retrieval, etc.
 
+
+class TestTaskCodec(unittest.TestCase):
+
+    def test_decodes_legacy_and_compressed_frames(self):
+        task = {"id": "task1", "payload": "x" * 200}
+        legacy = '{"id": "task1", "payload": "%s"}' % ("x" * 200)
+        compressed = TaskCodec("json", "zstd", compress_threshold=64).encode(task)
+
+        # Any codec configuration reads every stored format
+        reader = TaskCodec("json", "none")
+        self.assertEqual(reader.decode(legacy), task)
+        self.assertEqual(compressed[0], "j")
+        self.assertEqual(reader.decode(compressed), task)
+
+
+class TestClaimCheck(unittest.TestCase):
+
+    def test_large_payload_is_offloaded_and_loaded_lazily(self):
+        claim_check = ClaimCheck(store=LocalBlobStore(tempfile.mkdtemp()), threshold=16)
+        small = claim_check.offload({"id": "small", "payload": "tiny"})
+        self.assertEqual(small, {"id": "small", "payload": "tiny"})
+
+        task = claim_check.offload({"id": "big", "payload": {"rows": list(range(100))}})
+        self.assertNotIn("payload", task)
+        self.assertIsInstance(claim_check.open_payload(task), memoryview)
+        self.assertEqual(claim_check.load_payload(task), {"rows": list(range(100))})
+
+    @patch('backend.task_queue.claim_check.get_shard')
+    def test_redis_blob_is_read_from_the_shard_it_was_written_to(self, mock_get_shard):
+        shard_client = MagicMock()
+        writer = ClaimCheck(store=RedisBlobStore(shard_client), threshold=16, shard=2)
+        task = writer.offload({"id": "big", "payload": "x" * 32})
+        stored = shard_client.hset.call_args[0]
+        shard_client.hget.side_effect = lambda hash_key, key: stored[2] if (hash_key, key) == stored[:2] else None
+        mock_get_shard.return_value = shard_client
+
+        # A handler's claim check is bound to the default server
+        reader = ClaimCheck(store=RedisBlobStore(MagicMock()))
+
+        self.assertEqual(task["payload_ref"]["shard"], 2)
+        self.assertEqual(reader.load_payload(task), "x" * 32)
+        mock_get_shard.assert_called_once_with(2)
+
+
+class TestLanePolicy(unittest.TestCase):
+
+    def test_weighted_shares_and_starvation_protection(self):
+        policy = LanePolicy(3, "weighted", weights=[1, 4, 16], max_wait=30)
+        picks = policy.allocate([100, 100, 100], [1, 1, 1], 21)
+        self.assertEqual([picks.count(lane) for lane in range(3)], [1, 4, 16])
+
+        strict = LanePolicy(3, "strict", max_wait=30)
+        # Lane 0's head has waited past max_wait, so it gets the first slot despite strict order
+        self.assertEqual(strict.allocate([5, 0, 5], [45, None, 1], 3), [0, 2, 2])
+
+
+class TestDelayedTasks(unittest.TestCase):
+
+    def test_parse_due_time(self):
+        now = 1700000000.0
+        self.assertEqual(parse_due_time({"countdown": 600}, now), now + 600)
+        self.assertEqual(parse_due_time({"eta": "2023-11-14T22:13:20+00:00"}, now - 5), now)
+        # Past or missing times run immediately
+        self.assertIsNone(parse_due_time({"eta": now - 1}, now))
+        self.assertIsNone(parse_due_time({}, now))
+        with self.assertRaises(ValueError):
+            parse_due_time({"eta": now + 1, "countdown": 1}, now)
+        # Non-finite times would park a task forever or run it at once
+        for task in ({"countdown": float("inf")}, {"countdown": float("nan")}, {"countdown": 10 ** 400},
+                     {"eta": float("inf")}, {"eta": float("nan")}, {"eta": 10 ** 400}):
+            with self.assertRaises(ValueError):
+                parse_due_time(task, now)
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_merged_rejects_unusable_values(self):
+        policy = RetryPolicy(max_attempts=3, backoff_base=1, backoff_max=60)
+        merged = policy.merged({"max_attempts": 5, "backoff_base": 0.5})
+        self.assertEqual((merged.max_attempts, merged.backoff_base, merged.backoff_max), (5, 0.5, 60))
+
+        # Infinite or NaN backoffs would park every retry forever
+        for options in ({"backoff_base": float("inf"), "backoff_max": float("inf")}, {"backoff_max": float("nan")},
+                        {"backoff_base": 10 ** 400}, {"max_attempts": 2.5}, {"max_attempts": float("inf")},
+                        {"max_attempts": True}, {"backoff_base": -1}):
+            with self.assertRaises(ValueError):
+                policy.merged(options)
+
+    def test_backoff_stays_finite_after_many_attempts(self):
+        policy = RetryPolicy(max_attempts=10 ** 6, backoff_base=1, backoff_max=300)
+        self.assertLessEqual(policy.backoff(5000), 300)
+
+
+class TestResultBackend(unittest.TestCase):
+
+    def test_store_unwraps_handler_dict_and_caps_size(self):
+        backend = ResultBackend(MagicMock(), ttl=60, max_bytes=300)
+        pipe = MagicMock()
+        record = backend.build("t1", {"task_id": "t1", "status": "completed", "result": "x" * 500})
+        self.assertEqual(record["result"], "x" * 500)
+
+        backend.store(record, client=pipe)
+
+        key, data = pipe.set.call_args.args
+        self.assertEqual(key, "result:t1")
+        self.assertEqual(pipe.set.call_args.kwargs, {"ex": 60})
+        self.assertIn('"truncated": true', data)
+        pipe.rpush.assert_called_once_with("result:t1:notify", 1)
+
+
+class TestTaskLeases(unittest.TestCase):
+
+    def test_grant_and_reclaim_in_chunks(self):
+        redis_client = MagicMock()
+        leases = TaskLeases(redis_client, timeout=30, max_runtime=600, batch_size=2)
+        pipe = redis_client.pipeline.return_value
+
+        caps = leases.grant_many("processing:W", "W", [("t1", "task_queue:1", '{"id": "t1"}')])
+
+        self.assertEqual(list(caps), ["processing:W|t1"])
+        deadlines = pipe.zadd.call_args.args[1]
+        self.assertIn("processing:W|t1", deadlines)
+        record = pipe.hset.call_args.kwargs["mapping"]["processing:W|t1"]
+        self.assertIn('"lane": "task_queue:1"', record)
+
+        # A full chunk means more may have expired; keep going until a short one
+        leases.scripts = MagicMock()
+        leases.scripts.reclaim.side_effect = [[2, 2], [1, 0]]
+        self.assertEqual(leases.reclaim_expired(now=100), 2)
+        self.assertEqual(leases.scripts.reclaim.call_count, 2)
+
+
+class TestStreamQueue(unittest.TestCase):
+
+    @patch('backend.task_queue.stream_queue.get_redis')
+    def test_ack_deletes_the_entry_in_the_callers_transaction(self, mock_get_redis):
+        queue = StreamQueue()
+        pipe = MagicMock()
+
+        queue.confirm_task_completion("W1", {"id": "t1", "_id": "1-0"}, client=pipe)
+
+        pipe.xack.assert_called_once_with("task_stream", "workers", "1-0")
+        pipe.xdel.assert_called_once_with("task_stream", "1-0")
+        pipe.execute.assert_not_called()
+
+    @patch('backend.task_queue.stream_queue.get_redis')
+    def test_claim_stale_tasks_skips_deleted_entries(self, mock_get_redis):
+        queue = StreamQueue()
+        mock_get_redis.return_value.xautoclaim.return_value = ["0-0", [("1-0", {"task": '{"id": "t1"}'}), ("2-0", None)]]
+
+        tasks = queue.claim_stale_tasks("W2")
+
+        self.assertEqual([(t["id"], t["_id"]) for t in tasks], [("t1", "1-0")])
+        args = mock_get_redis.return_value.xautoclaim.call_args.args
+        self.assertEqual(args[:4], ("task_stream", "workers", "W2", queue.claim_idle_ms))
+
+    @patch('backend.task_queue.stream_queue.get_redis')
+    def test_requeue_consumer_batches_until_its_pending_list_is_empty(self, mock_get_redis):
+        queue = StreamQueue()
+        queue._requeue = MagicMock(side_effect=[[2, 0], [1, 1]])
+
+        self.assertEqual(queue.requeue_consumer("W1", batch=2), 3)
+
+        # Each batch is one atomic script; the consumer is dropped inside the last one
+        self.assertEqual(queue._requeue.call_count, 2)
+        self.assertEqual(queue._requeue.call_args.kwargs["args"], ["workers", "W1", 2])
+        mock_get_redis.return_value.xgroup_delconsumer.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,18 @@
 import unittest
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from backend.utils.task_scheduler import TaskSchedulerUtils
-from unittest.mock import MagicMock
+from backend.utils.worker_registry import WorkerRegistry
+from backend.utils.service_stats import ServiceTimeStats, expected_completion
+from backend.utils.logger import Logger, _RateLimiter
+from backend.utils.metrics import MetricsRegistry
+from backend.utils import redis_client
+from unittest.mock import MagicMock, patch
+
+
+def log_in_child(message):
+    Logger().log(message)
 
 class TestTaskSchedulerUtils(unittest.TestCase):
     
@@ -30,5 +42,120 @@ class TestTaskSchedulerUtils(unittest.TestCase):
         # Verify that task is assigned to the worker
         selected_worker.assign_task.assert_called_with(task)
 
+
+class TestWorkerRegistry(unittest.TestCase):
+
+    def test_get_active_workers_reads_index_in_one_pipeline(self):
+        mock_redis = MagicMock()
+        pipe = mock_redis.pipeline.return_value
+        pipe.execute.return_value = [["Worker-1", "Worker-2"], {"Worker-1": "3", "Worker-2": "-1"}]
+        registry = WorkerRegistry(mock_redis, active_window=60)
+
+        workers = registry.get_active_workers()
+
+        # Negative loads from racing decrements are clamped to zero
+        self.assertEqual(workers, [("Worker-1", 3), ("Worker-2", 0)])
+        mock_redis.keys.assert_not_called()
+        pipe.execute.assert_called_once()
+
+
+class TestServiceTimeStats(unittest.TestCase):
+
+    @patch('backend.utils.service_stats.time.time')
+    def test_ewma_and_expected_completion(self, mock_time):
+        stats = ServiceTimeStats(alpha=0.5)
+        for duration in (2.0, 4.0):
+            mock_time.return_value = 100.0
+            stats.start("k", {"type": "resize"})
+            mock_time.return_value = 100.0 + duration
+            stats.finish("k")
+        self.assertEqual(stats.ewma["resize"], 3.0)
+
+        # One long task 10s into a 600s average dwarfs a short one just started
+        busy = {"ewma": {"video": 600.0}, "mean": 600.0, "concurrency": 1, "running": [["video", 990.0]]}
+        quick = {"ewma": {"thumb": 0.1}, "mean": 0.1, "concurrency": 1, "running": [["thumb", 1000.0]]}
+        self.assertAlmostEqual(expected_completion(busy, 1, "thumb", now=1000.0), 1190.0)
+        self.assertAlmostEqual(expected_completion(quick, 1, "thumb", now=1000.0), 0.2)
+
+
+class TestLogRateLimiter(unittest.TestCase):
+
+    @patch('backend.utils.logger.time.monotonic')
+    def test_limits_per_category_and_reports_suppressed(self, mock_monotonic):
+        limiter = _RateLimiter.from_config("task=2")
+        mock_monotonic.return_value = 10.0
+        admitted = [limiter.admit("task")[0] for _ in range(5)]
+        self.assertEqual(admitted, [True, True, False, False, False])
+        self.assertEqual(limiter.admit("other"), (True, 0))
+
+        # The first message of the next second carries the suppressed count
+        mock_monotonic.return_value = 11.0
+        self.assertEqual(limiter.admit("task"), (True, 3))
+
+
+class TestLogger(unittest.TestCase):
+
+    def test_records_logged_in_a_forked_pool_child_are_written(self):
+        Logger()
+        message = f"from a pool child {uuid.uuid4().hex}"
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as pool:
+            pool.submit(log_in_child, message).result()
+
+        with open(Logger._log_file, encoding="utf-8") as log_file:
+            self.assertIn(message, log_file.read())
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_histogram_quantiles_and_prometheus_text(self):
+        registry = MetricsRegistry()
+        wait = registry.histogram("queue_wait_seconds", "Queue wait", ["type"], buckets=(1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3):
+            wait.observe(value, type="resize")
+        registry.counter("tasks_total", "Tasks").inc(2)
+
+        # Half the observations are at or below 1.5, inside the (1, 2] bucket
+        self.assertAlmostEqual(wait.quantile(0.5, type="resize"), 1.5)
+        text = registry.render()
+        self.assertIn('queue_wait_seconds_bucket{type="resize",le="2"} 3', text)
+        self.assertIn('queue_wait_seconds_bucket{type="resize",le="+Inf"} 4', text)
+        self.assertIn('queue_wait_seconds_count{type="resize"} 4', text)
+        self.assertIn('queue_wait_seconds_quantile{type="resize",quantile="0.99"}', text)
+        self.assertIn("tasks_total 2", text)
+
+
+class TestRedisClient(unittest.TestCase):
+
+    def test_clients_share_one_pool_per_endpoint(self):
+        first, second = redis_client.get_redis(), redis_client.get_redis()
+        self.assertIs(first.connection_pool, second.connection_pool)
+        self.assertIsNot(redis_client.get_redis(port=6380).connection_pool, first.connection_pool)
+
+        with patch.object(redis_client.Config, "REDIS_SOCKET_PATH", "/tmp/redis.sock"):
+            pool = redis_client.get_pool()
+        self.assertIs(pool.connection_class, redis_client.redis.UnixDomainSocketConnection)
+        self.assertEqual(pool.connection_kwargs["path"], "/tmp/redis.sock")
+
+    def test_blocking_waits_use_their_own_capped_pool(self):
+        shared = redis_client.get_redis().connection_pool
+        blocking = redis_client.get_redis(blocking=True).connection_pool
+
+        # Long-polls exhausting the blocking pool leave the shared one untouched
+        self.assertIsNot(blocking, shared)
+        self.assertIs(redis_client.get_redis(blocking=True).connection_pool, blocking)
+        self.assertEqual(blocking.max_connections, redis_client.Config.REDIS_BLOCKING_MAX_CONNECTIONS)
+        self.assertEqual(shared.max_connections, redis_client.Config.REDIS_MAX_CONNECTIONS)
+
+    def test_execute_chunked_splits_large_batches(self):
+        client = MagicMock()
+        pipe = client.pipeline.return_value
+        pipe.execute.side_effect = [[1, 2], [3, 4], [5]]
+
+        replies = redis_client.execute_chunked(client, range(5), lambda p, item: p.get(item), chunk_size=2)
+
+        self.assertEqual(replies, [1, 2, 3, 4, 5])
+        self.assertEqual(pipe.execute.call_count, 3)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,18 @@
 import unittest
-from backend.worker_node.worker import Worker
-from unittest.mock import patch
+import json
+import os
+import socket
+from concurrent.futures.process import BrokenProcessPool
+from backend.worker_node.worker import Worker, QUEUE_WAIT
+from backend.task_queue.redis_queue import RedisQueue
+from backend.worker_node.executors import create_executor
+from unittest.mock import MagicMock, patch
+
+
+def crash_child(task):
+    # Kills the pool process mid-task, as a segfault or OOM kill would
+    os._exit(1)
+
 
 class TestWorker(unittest.TestCase):
 
@@ -15,6 +27,137 @@ class TestWorker(unittest.TestCase):
 
         mock_queue.remove_task_from_queue.assert_called_with(task)
 
+    @patch('backend.worker_node.worker.RedisQueue')
+    def test_fill_window_skips_in_flight_tasks(self, MockRedisQueue):
+        worker = Worker(mode="thread", concurrency=2)
+        mock_client = MockRedisQueue.return_value.redis_client
+        mock_client.lrange.return_value = ['{"id": "a"}', '{"id": "b"}']
+        worker._in_flight['{"id": "a"}'] = 1
+        executor = MagicMock()
+
+        started = worker._fill_window(executor)
+
+        # Only the task not already running is handed to the pool
+        self.assertEqual(started, 1)
+        executor.submit.assert_called_once_with(worker.handler, {"id": "b"})
+
+    @patch('backend.worker_node.worker.RedisQueue')
+    def test_failed_task_retries_then_dead_letters(self, MockRedisQueue):
+        MockRedisQueue.return_value.lanes.names = ["task_queue"]
+        MockRedisQueue.return_value.lanes.name_for.return_value = "task_queue"
+        worker = Worker()
+        scripts = MockRedisQueue.return_value.scripts
+        task = {"id": "t1", "payload": "x", "retry": {"max_attempts": 2, "retry_on": ["TimeoutError"]}}
+
+        delay = worker._fail_or_retry(task, '{"id": "t1"}', TimeoutError("slow"), MagicMock())
+
+        # First failure is parked in the lane's delay index with its attempt recorded
+        self.assertIsNotNone(delay)
+        retry_args = scripts.retry.call_args[0]
+        self.assertEqual(retry_args[1], "task_queue:delayed")
+        retried = json.loads(retry_args[3])
+        self.assertEqual(retried["attempts"], 1)
+
+        # Second failure uses up the attempts and lands in the failed queue with its history
+        self.assertIsNone(worker._fail_or_retry(retried, retry_args[3], TimeoutError("slow"), MagicMock()))
+        failed = json.loads(scripts.fail.call_args[1]["failed_json"])
+        self.assertEqual(len(failed["attempt_history"]), 2)
+        self.assertEqual(failed["last_error"], "slow")
+
+        # Exceptions outside retry_on are dead-lettered at once
+        self.assertIsNone(worker._fail_or_retry(task, '{"id": "t1"}', KeyError("bad"), MagicMock()))
+
+    @patch('backend.worker_node.worker.Config.WORKER_MAX_CRASHES', 2)
+    @patch('backend.worker_node.worker.RedisQueue')
+    def test_crashed_child_is_retried_then_dead_lettered_and_frees_its_slot(self, MockRedisQueue):
+        MockRedisQueue.return_value.lanes.name_for.return_value = "task_queue"
+        MockRedisQueue.return_value.redis_client.lrange.return_value = ['{"id": "t1", "payload": "x"}']
+        scripts = MockRedisQueue.return_value.scripts
+        worker = Worker(mode="process", concurrency=1, handler=crash_child)
+
+        for crash in (1, 2):
+            executor = create_executor("process", 1)
+            worker._slot_freed.clear()
+            self.assertEqual(worker._fill_window(executor), 1)
+            self.assertTrue(worker._slot_freed.wait(timeout=30))
+            executor.shutdown(wait=True)
+            # Each crash frees the slot and marks the pool for rebuilding
+            self.assertEqual(worker._free_slots(), worker.prefetch)
+            self.assertTrue(worker._pool_broken)
+            worker._pool_broken = False
+            if crash == 1:
+                # Below the limit the task stays in the processing queue for the new pool
+                scripts.fail.assert_not_called()
+
+        # At WORKER_MAX_CRASHES it is dead-lettered rather than retried
+        scripts.fail.assert_called_once()
+        failed = json.loads(scripts.fail.call_args[1]["failed_json"])
+        self.assertIn("crashed its worker process 2 times", failed["last_error"])
+
+        # A pool that is already broken refuses the task without leaking its slot
+        broken = MagicMock()
+        broken.submit.side_effect = BrokenProcessPool("pool is gone")
+        self.assertEqual(worker._fill_window(broken), 0)
+        self.assertEqual(worker._free_slots(), worker.prefetch)
+        self.assertTrue(worker._pool_broken)
+
+    @patch('backend.task_queue.redis_queue.get_shard')
+    @patch('backend.worker_node.worker.RedisQueue')
+    def test_idle_serial_worker_blocks_on_the_most_urgent_lane(self, MockRedisQueue, mock_get_shard):
+        class Stop(BaseException):
+            pass
+
+        clients = {False: MagicMock(), True: MagicMock()}
+        mock_get_shard.side_effect = lambda shard, blocking=False: clients[blocking]
+        shared, blocking = clients[False], clients[True]
+        # Nothing assigned to us and every lane empty, so the sweep comes back with nothing
+        shared.lindex.return_value = None
+        shared.register_script.return_value.return_value = None
+        blocking.blmove.side_effect = Stop
+        MockRedisQueue.side_effect = RedisQueue
+        worker = Worker(mode="serial")
+        lanes = worker.redis_queue.lanes
+        shared.pipeline.return_value.execute.return_value = [0, None] * lanes.levels
+
+        with self.assertRaises(Stop):
+            worker._run_serial()
+
+        blocking.blmove.assert_called_once_with(
+            lanes.names[-1], worker.processing_queue_name, worker.fetch_timeout, "LEFT", "RIGHT")
+        self.assertEqual(worker.processing_queue_name, f"processing:{worker.worker_id}")
+        shared.blmove.assert_not_called()
+
+    @patch('backend.worker_node.worker.RedisQueue')
+    def test_taken_metrics_port_does_not_stop_the_worker(self, MockRedisQueue):
+        with socket.socket() as taken:
+            taken.bind(("0.0.0.0", 0))
+            taken.listen()
+            worker = Worker(mode="serial")
+            worker._renew_leases = MagicMock()
+            worker._run_serial = MagicMock()
+
+            with patch('backend.worker_node.worker.Config.METRICS_PORT', taken.getsockname()[1]):
+                worker.run()
+
+        worker._run_serial.assert_called_once_with()
+
+    @patch('backend.worker_node.worker.Config.METRICS_TASK_TYPES', "resize, email")
+    @patch('backend.worker_node.worker.RedisQueue')
+    def test_metric_type_label_is_limited_to_known_types(self, MockRedisQueue):
+        worker = Worker()
+        before = set(QUEUE_WAIT._values)
+
+        for kind in ("resize", None, "client-chosen-1", "client-chosen-2"):
+            task = {"id": "t1", "submit_timestamp": 0}
+            if kind:
+                task["type"] = kind
+            worker._task_started(task)
+            worker._task_finished(task)
+
+        self.assertLessEqual(set(QUEUE_WAIT._values) - before, {("resize",), ("default",), ("other",)})
+        self.assertIn(("other",), QUEUE_WAIT._values)
+        self.assertNotIn(("client-chosen-1",), QUEUE_WAIT._values)
+
     # Add more tests for worker logic here
 
 if __name__ == '__main__':